@@ -1,14 +1,15 @@
-import gradio as gr
-import pandas as pd
-import time
 import json
 import os
 from pathlib import Path
 import tempfile
 import shutil
 import sys
+import time
+import threading
 import logging  # コンソールの代わりにロギングを使用
 
+# gradio・pandas は読み込みに時間がかかるため、使う関数の中で読み込む（build_demo() で UI を作るときなど）
+
 # ロガーの設定
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -22,9 +23,26 @@ if str(SRC_DIR) not in sys.path:
 try:
     from tavily_processor import tavily_processor
     from watch_info_extractor import WatchInfoExtractor
+    from job_scheduler import JobScheduler, DEFAULT_MAX_CONCURRENT_JOBS
+    from content_trimmer import ContentTrimmer
+    from rule_extractor import RuleExtractor
+    from near_duplicates import NearDuplicateIndex
+    from query_planner import QueryPlanner
+    from result_table import results_to_frame, format_for_display
+    from pipeline import WatchSearchPipeline
+    from input_reader import iter_input_rows, INPUT_SUFFIXES
+    from metrics import get_metrics, start_prometheus_server
 
     # process_excel.py から必要な定数をインポート
-    from process_excel import DATA_DIR, SLEEP_SECONDS, MAX_URLS_TO_FETCH, ADVANCE_SEARCH
+    from process_excel import (
+        DATA_DIR,
+        MAX_URLS_TO_FETCH,
+        ADVANCE_SEARCH,
+        TRIM_MAX_CHARS,
+        EXTRACT_BATCH_SIZE,
+        open_search_cache,
+        open_extraction_cache,
+    )
 except ImportError as e:
     logging.error(f"必要なモジュールのインポートに失敗しました: {e}")
     # Gradioアプリ起動前にエラーを表示する方法があれば良いが、ここではログ出力に留める
@@ -32,184 +50,174 @@ except ImportError as e:
     raise  # アプリケーションを停止させる
 
 
+STREAM_UPDATE_INTERVAL = 1.0  # 処理途中の結果テーブルを更新する最短間隔（秒）
+QUEUE_POLL_INTERVAL = 1.0  # 待機中のジョブが順番を確認する間隔（秒）
+JOB_LIST_REFRESH_INTERVAL = 2.0  # ジョブ一覧の表示を更新する間隔（秒）
+
+# 1つのジョブ内で並列に処理する行数（検索・抽出それぞれの同時実行数の上限）
+APP_WORKERS_PER_JOB = int(os.environ.get("APP_WORKERS_PER_JOB", 1))
+
+# 全セッションで共有するジョブスケジューラ（同時実行数は APP_MAX_CONCURRENT_JOBS で設定）
+job_scheduler = JobScheduler(int(os.environ.get("APP_MAX_CONCURRENT_JOBS", DEFAULT_MAX_CONCURRENT_JOBS)))
+
+_shared_clients = None
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_clients():
+    """
+    プロセス全体で共有する API クライアントを返す（初回呼び出し時に作成）
+    クリックごとに作り直さないため、HTTP の接続プール（keep-alive）とキャッシュの接続を使い回せる
+    レート制限もプロセス全体で共有されるため、複数セッションからの実行でも合計の呼び出し回数が制限される
+    戻り値:
+    tuple: (tavily_processor, WatchInfoExtractor)
+    """
+    global _shared_clients
+    with _shared_clients_lock:
+        if _shared_clients is None:
+            logging.info("APIクライアントを初期化中...")
+            _shared_clients = (
+                tavily_processor(search_cache=open_search_cache()),
+                WatchInfoExtractor(result_cache=open_extraction_cache()),
+            )
+            logging.info("APIクライアントの初期化完了。")
+        return _shared_clients
+
+
 # --- Gradio 用の処理関数 ---
-def process_excel_gradio(input_file_obj, progress=gr.Progress(track_tqdm=True)):  # Progressのコメント解除
-    """Gradioインターフェース用のExcel処理関数"""
+def process_excel_gradio(input_file_obj, progress=None, plan_queries=False):
+    """
+    Gradioインターフェース用のExcel処理関数
+    行の処理が終わるたびに、それまでの結果テーブルとステータスを yield する（ジェネレータ）
+    結果テーブルは完了した行ごとに result_table で1回だけ展開・整形し、表示の際は入力順に連結するだけにする（更新は STREAM_UPDATE_INTERVAL 秒に1回まで）
+    キャッシュ済みの行はすぐに表示し、残りの行は job_scheduler の実行枠が空くのを待ってから処理する
+    progress (gr.Progress): 進捗バー。None の場合は進捗を表示しない
+    plan_queries (bool): 同じブランド・型番の行の検索を1回にまとめる（CLI の --plan-queries と同じ。結果の件数が変わるため既定は無効）
+    """
+    import pandas as pd
+
+    if progress is None:
+        progress = lambda *args, **kwargs: None
     if input_file_obj is None:
-        return pd.DataFrame(), "エラー: 入力ファイルが指定されていません。"
+        yield pd.DataFrame(), "エラー: 入力ファイルが指定されていません。"
+        return
 
     # input_file_obj は Gradio の File コンポーネントが返すオブジェクト
     # .name 属性に一時ファイルのパスが含まれる
     input_excel_path = Path(input_file_obj.name)
     logging.info(f"処理対象ファイル: {input_excel_path}")
+    row_tables = {}  # 行番号 -> 表示用に展開した1行分の結果テーブル（行ごとに1回だけ展開する）
+    job = None
+    job_status = "中断"
+
+    def add_row(index, result):
+        # 完了した行だけを展開・整形して保持する（表示のたびに全行を展開し直さない）
+        with get_metrics().span("dataframe_build"):
+            row_tables[index] = format_for_display(results_to_frame([result]))
+
+    def current_table():
+        # 展開済みの行を入力順に並べて結果テーブルを作成
+        if not row_tables:
+            return format_for_display(results_to_frame([]))
+        with get_metrics().span("dataframe_build"):
+            return pd.concat([row_tables[index] for index in sorted(row_tables)], ignore_index=True)
 
     try:
-        # APIクライアントの初期化 (環境変数からAPIキーを読み込む想定)
-        logging.info("APIクライアントを初期化中...")
-        tavily_client = tavily_processor()
-        watch_extractor = WatchInfoExtractor()
-        logging.info("APIクライアントの初期化完了。")
+        # プロセス全体で共有するAPIクライアントを使用 (環境変数からAPIキーを読み込む想定)
+        tavily_client, watch_extractor = get_shared_clients()
 
-        # Excelファイルを読み込む
+        # 入力ファイルを読み込む（検索に使う列だけを1行ずつ読み込み、軽い行データとして保持する）
         logging.info(f"Excelファイルを読み込み中: {input_excel_path}")
-        df = pd.read_excel(input_excel_path)
-        total_rows = len(df)
+        with get_metrics().span("excel_load"):
+            input_rows = list(iter_input_rows(input_excel_path))
+        total_rows = len(input_rows)
         logging.info(f"Excelファイルの読み込み完了。処理対象: {total_rows}行")
-        results_list = []
+        job = job_scheduler.submit(getattr(input_file_obj, "orig_name", input_excel_path.name), total_rows)
+        # CLI (process_excel.py) と同じ処理エンジンを使う
+        pipeline = WatchSearchPipeline(
+            tavily_client,
+            watch_extractor,
+            max_results=MAX_URLS_TO_FETCH,
+            advance_search=ADVANCE_SEARCH,
+            workers=APP_WORKERS_PER_JOB,
+            content_trimmer=ContentTrimmer(max_chars=TRIM_MAX_CHARS) if TRIM_MAX_CHARS > 0 else None,
+            batch_size=EXTRACT_BATCH_SIZE,
+            log=logging.info,
+            rule_extractor=RuleExtractor(),
+            near_duplicates=NearDuplicateIndex(),
+            query_planner=QueryPlanner() if plan_queries else None,
+        )
 
         progress(0, desc="処理開始...")  # Progressのコメント解除
 
-        # 各行を処理
-        for index, row in df.iterrows():
+        if pipeline.query_planner is not None:
+            # 全行の検索をブランド・型番ごとにまとめる（キャッシュの確認も前回と同じまとめた検索キーワードで行う）
+            pipeline.query_planner.plan(input_rows)
+
+        # キャッシュ済みの行は実行枠を待たずにすぐ表示する
+        remaining_rows = []
+        cached_details = {}  # URL -> キャッシュ済みの抽出結果（行をまたいで共有）
+        for index, row in input_rows:
+            cached_result = pipeline.lookup_cached(row, cached_details)
+            if cached_result is None:
+                remaining_rows.append((index, row))
+            else:
+                add_row(index, cached_result)
+        job_scheduler.update(job, len(row_tables))
+        if row_tables:
+            logging.info(f"キャッシュ済みの {len(row_tables)} 行を表示します。")
+            yield current_table(), f"キャッシュ済み: {len(row_tables)}/{total_rows} 行"
+
+        # 実行枠が空くまで待機（順番が変わったときだけ表示を更新）
+        last_position = None
+        wait_timeout = 0  # 初回はすぐに順番を確認し、待つ場合は待機中であることをすぐに表示する
+        while remaining_rows and not job_scheduler.wait_turn(job, timeout=wait_timeout):
+            wait_timeout = QUEUE_POLL_INTERVAL
+            position = job_scheduler.position(job)
+            if position != last_position:
+                last_position = position
+                yield current_table(), f"待機中: {position} 番目 (実行中のジョブが終わり次第開始します)"
+
+        last_update = None
+        # 残りの各行を処理（完了した順に結果を受け取る）
+        for done_count, (index, result) in enumerate(pipeline.run(remaining_rows, total_rows=total_rows), start=1):
             # 進捗を更新 (Progressのコメント解除)
-            current_progress = (index + 1) / total_rows
-            progress(current_progress, desc=f"検索クエリ処理中: {index + 1}/{total_rows}")  # 説明を修正
-
-            # Excelからデータを安全に取得 (列が存在しない場合も考慮)
-            brand = row.get("ブランド", "")
-            model = row.get("型番", "")
-            dial_color = row.get("文字盤色", "")
-            bracelet = row.get("ブレス形状", "")
-            initial_keywords = f"{brand} {model} {dial_color} {bracelet} 中古".strip()  # 空白を除去
+            current_progress = done_count / len(remaining_rows)
+            progress(current_progress, desc=f"検索クエリ処理中: {len(row_tables) + 1}/{total_rows}")  # 説明を修正
 
-            logging.info(f"({index+1}/{total_rows}) 処理開始: {initial_keywords}")
+            # 行の結果を展開して保持（テーブルは表示する時に並べるだけにする）
+            add_row(index, result)
+            job_scheduler.update(job, len(row_tables))
 
-            search_results = []
-            extracted_watches_details = []
-            row_error = None  # 行レベルのエラーを記録
+            # 処理途中の結果を表示（最初の行は即座に、以降は一定間隔ごと）
+            now = time.monotonic()
+            if last_update is None or now - last_update >= STREAM_UPDATE_INTERVAL:
+                last_update = now
+                yield current_table(), f"処理中: {len(row_tables)}/{total_rows} 行完了"
 
-            try:
-                # Tavily検索
-                logging.info(f"  -> 商品検索クエリ実行中: {initial_keywords}")
-                search_results = tavily_client.search_item(
-                    initial_keywords, max_results=MAX_URLS_TO_FETCH, advance_search=ADVANCE_SEARCH
-                )
-                logging.info(f"  -> 検索結果 ({len(search_results)}件)")
-
-                # 個別商品情報抽出
-                logging.info(f"  -> 個別商品ページ情報取得中 ({len(search_results)}件)...")
-                for i, item in enumerate(search_results):
-                    product_url = item.get("url")
-                    product_content = item.get("content")
-
-                    if not product_url or not product_content:
-                        logging.warning(f"    ({i+1}/{len(search_results)}) URL/コンテンツなしでスキップ")
-                        continue
-
-                    logging.info(f"    ({i+1}/{len(search_results)}) URL: {product_url}")
-                    try:
-                        watch_detail = watch_extractor.extract_info(product_content)
-                        if watch_detail:
-                            watch_detail["url"] = product_url
-                            extracted_watches_details.append(watch_detail)
-                            price_str = f"¥{watch_detail.get('price'):,}" if watch_detail.get("price") else "N/A"
-                            logging.info(
-                                f"      -> 抽出成功: {watch_detail.get('name', 'N/A')} ({watch_detail.get('model_number', 'N/A')}) / {price_str}"
-                            )
-                        else:
-                            logging.warning("      -> 詳細抽出失敗")
-                            # 抽出失敗時もURLとエラー情報を記録
-                            extracted_watches_details.append({"url": product_url, "error": "詳細抽出失敗"})
-                    except Exception as e_extract:
-                        logging.error(f"    -> URL {product_url} の処理中にエラー発生: {repr(e_extract)}")
-                        # 抽出エラー時もURLとエラー情報を記録
-                        extracted_watches_details.append(
-                            {"url": product_url, "error": f"抽出エラー: {repr(e_extract)}"}
-                        )
-
-                    # APIのレート制限を避けるために待機
-                    time.sleep(SLEEP_SECONDS)
-
-            except Exception as e_row:
-                logging.error(f"  -> 行 {index+1} の処理中にエラー発生: {repr(e_row)}")
-                row_error = f"行処理エラー: {repr(e_row)}"
-                # 行全体のエラーの場合、空の結果とエラーメッセージを記録
-
-            # 行の結果をリストに追加
-            results_list.append(
-                {
-                    "input_keywords": initial_keywords,
-                    "extracted_results": extracted_watches_details,
-                    "row_error": row_error,  # 行レベルのエラーを追加
-                }
-            )
-
-        # --- 結果をDataFrameに整形 ---
-        logging.info("処理結果をDataFrameに整形中...")
-        output_data = []
-        # JSONの全キーを列名として定義（accessories内のキーも展開）
-        columns = [
-            "検索キーワード",
-            "商品名",
-            "型番",
-            "文字盤色",
-            "ブレス形状",
-            "価格",
-            "販売店",
-            "保証書日付",
-            "保証書あり",
-            "箱あり",
-            "付属品詳細",
-            "状態",
-            "URL",
-            "エラー",
-        ]
-
-        for result in results_list:
-            keywords = result["input_keywords"]
-            row_err = result["row_error"]
-
-            if row_err:  # 行レベルのエラーがあった場合
-                error_row = {col: "" for col in columns}  # 全ての列を空にする
-                error_row["検索キーワード"] = keywords
-                error_row["エラー"] = row_err
-                output_data.append(error_row)
-
-            elif not result["extracted_results"]:  # 検索結果が0件の場合
-                no_result_row = {col: "" for col in columns}  # 全ての列を空にする
-                no_result_row["検索キーワード"] = keywords
-                no_result_row["商品名"] = "該当なし"
-                output_data.append(no_result_row)
-
-            else:  # 検索結果がある場合
-                for detail in result["extracted_results"]:
-                    accessories = detail.get("accessories", {})  # Noneの場合も考慮
-                    if accessories is None:  # accessoriesがNoneの場合のフォールバック
-                        accessories = {}
-                    output_row = {
-                        "検索キーワード": keywords,
-                        "商品名": detail.get("name", "N/A"),
-                        "型番": detail.get("model_number", "N/A"),
-                        "文字盤色": detail.get("dial_color", "N/A"),
-                        "ブレス形状": detail.get("bracelet_type", "N/A"),
-                        "価格": f"¥{detail.get('price'):,}" if detail.get("price") is not None else "N/A",
-                        "販売店": detail.get("seller", "N/A"),
-                        "保証書日付": detail.get("warranty_date", "N/A"),
-                        "保証書あり": accessories.get("has_warranty_card", False),  # デフォルトFalse
-                        "箱あり": accessories.get("has_box", False),  # デフォルトFalse
-                        "付属品詳細": accessories.get("other_description", ""),  # デフォルト空文字
-                        "状態": detail.get("condition", "N/A"),
-                        "URL": detail.get("url", "N/A"),
-                        "エラー": detail.get("error", ""),  # 抽出エラーなど
-                    }
-                    output_data.append(output_row)
-
-        # 定義した列順序でDataFrameを作成
-        output_df = pd.DataFrame(output_data, columns=columns)
-        logging.info("DataFrameの整形完了。")
-        return output_df, "処理が完了しました。"
+        # 最後に未表示の行が残っていれば反映
+        logging.info("全行の処理が完了しました。")
+        job_status = "完了"
+        yield current_table(), "処理が完了しました。"
 
     except FileNotFoundError:
+        job_status = "エラー"
         logging.error(f"エラー: ファイルが見つかりません - {input_excel_path}")
-        return pd.DataFrame(), f"エラー: ファイル '{input_excel_path.name}' が見つかりません。"
+        yield pd.DataFrame(), f"エラー: ファイル '{input_excel_path.name}' が見つかりません。"
     except ImportError:
+        job_status = "エラー"
         # mainレベルのImportErrorは上でキャッチされるはずだが念のため
         logging.critical("重大なエラー: 必要なモジュールが見つかりません。")
-        return pd.DataFrame(), "エラー: アプリケーションの初期化に失敗しました。ログを確認してください。"
+        yield pd.DataFrame(), "エラー: アプリケーションの初期化に失敗しました。ログを確認してください。"
     except Exception as e:
+        job_status = "エラー"
         logging.exception("エラー: 処理中に予期せぬ問題が発生しました。")  # スタックトレースもログに出力
-        return pd.DataFrame(), f"エラー: 処理中に問題が発生しました。詳細: {repr(e)}"
+        # それまでに完了した行の結果は残して表示する
+        yield current_table(), f"エラー: 処理中に問題が発生しました。詳細: {repr(e)}"
     finally:
+        # 実行枠を解放して次のジョブに渡す（途中で中断された場合も含む）
+        if job is not None:
+            job_scheduler.finish(job, job_status)
         # Gradioは一時ファイルを自動で削除するはずだが、念のため確認
         if input_excel_path.exists() and "gradio" in str(input_excel_path):
             try:
@@ -220,136 +228,170 @@ def process_excel_gradio(input_file_obj, progress=gr.Progress(track_tqdm=True)):
 
 
 # --- Gradio UIの定義 ---
-# data/input ディレクトリ内のExcelファイルを取得
-input_dir = DATA_DIR / "input"
-excel_files = []
-if input_dir.exists() and input_dir.is_dir():
-    excel_files = sorted([f.name for f in input_dir.glob("*.xlsx")])  # ソートして表示順を安定させる
-    logging.info(f"検出されたExcelファイル: {excel_files}")
-else:
-    logging.warning(f"入力ディレクトリが見つかりません: {input_dir}")
+INPUT_DIR = DATA_DIR / "input"  # 選択肢に表示する Excel ファイルのディレクトリ
 
-with gr.Blocks(theme=gr.themes.Soft()) as demo:
-    gr.Markdown("# Excel 時計情報 検索・抽出ツール")
-    gr.Markdown(
-        "`data/input` 内のExcelファイルを選択するか、新しいファイルをアップロードして「実行」ボタンを押してください。"
-    )
 
-    with gr.Row():
-        with gr.Column(scale=1):
-            gr.Markdown("### 入力設定")
-            # data/input内のファイルを選択するドロップダウン
-            file_dropdown = gr.Dropdown(
-                label="既存のファイルを選択",
-                choices=excel_files,
-                value=excel_files[0] if excel_files else None,
-                # ファイルがない場合は非表示にするか、メッセージを表示する
-                info=(
-                    "`data/input` ディレクトリ内の .xlsx ファイルが表示されます。"
-                    if excel_files
-                    else "`data/input` に .xlsx ファイルが見つかりません。"
-                ),
-                interactive=bool(excel_files),  # ファイルがない場合は操作不可
-            )
-            # # または、ファイルをアップロード (一時的にコメントアウト)
-            # file_upload = gr.File(
-            #     label="または、Excelファイルをアップロード",
-            #     file_types=[".xlsx"],
-            # )
-            run_button = gr.Button("実行", variant="primary")
-            status_text = gr.Textbox(label="ステータス", interactive=False, lines=1)
-
-        with gr.Column(scale=3):
-            gr.Markdown("### 処理結果")
-            output_table = gr.DataFrame(label="抽出結果")  # TextboxからDataFrameに戻す
-            # output_text = gr.Textbox(label="抽出結果 (テキスト)", lines=15, interactive=False) # DataFrameを使うので削除
-
-    # --- イベントハンドラ ---
-    # ファイルがアップロードされたら、ドロップダウンの選択を解除
-    def clear_dropdown_on_upload(uploaded_file):
-        if uploaded_file is not None:
-            return gr.Dropdown(value=None)  # ドロップダウンの選択を解除
-            # アップロードがクリアされた場合などは元の値を維持 (あるいはNoneのまま)
-            # この動作は要件次第
-            return gr.Dropdown()  # 現状維持
-
-    # # file_upload.upload(fn=clear_dropdown_on_upload, inputs=[file_upload], outputs=[file_dropdown]) # 一時的にコメントアウト
-
-    # # ドロップダウンが選択されたら、アップロードされたファイルをクリア (不要に)
-    # def clear_upload_on_select(dropdown_value):
-    #     if dropdown_value is not None:
-    #         return gr.File(value=None)
-    #         return gr.File()
-
-    # # file_dropdown.change(fn=clear_upload_on_select, inputs=[file_dropdown], outputs=[file_upload]) # 一時的にコメントアウト
-
-    # 実行ボタンのクリックイベント (ファイルアップロードを除外, Progressを有効化)
-    def run_processing_wrapper(dropdown_choice, progress=gr.Progress(track_tqdm=True)):  # Progressのコメント解除
-        """実行ボタンクリック時の処理 (ドロップダウンのみ)"""
-        target_file_obj = None
-        source_description = ""
-
-        if dropdown_choice is not None:
-            # ドロップダウンで選択されたファイルを使用
-            file_path = input_dir / dropdown_choice
-            source_description = f"選択されたファイル ({dropdown_choice})"
-            if not file_path.exists():
-                logging.error(f"選択されたファイルが見つかりません: {file_path}")
-                return pd.DataFrame(), f"エラー: 選択されたファイル '{dropdown_choice}' が見つかりません。"
-
-            # GradioのFileコンポーネントはファイルオブジェクトを期待するため、
-            # 選択されたファイルを一時ディレクトリにコピーして、そのオブジェクトを渡す
-            try:
-                # 一時ファイルを作成 (接尾辞を元のファイルに合わせる)
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_file:
-                    shutil.copyfile(file_path, tmp_file.name)
-                    logging.info(f"選択されたファイル {file_path} を一時ファイル {tmp_file.name} にコピーしました。")
-
-                    # GradioのFileコンポーネントが返すオブジェクトを模倣
-                    # Gradio内部で使われるかもしれない属性も設定しておく
-                    class MockFile:
-                        def __init__(self, name, orig_name):
-                            self.name = name  # 一時ファイルのフルパス
-                            self.orig_name = orig_name  # 元のファイル名
-
-                    mock_file_obj = MockFile(tmp_file.name, dropdown_choice)
-
-                    logging.info(f"処理を開始します。ソース: {source_description}")
-                    result_df, status = process_excel_gradio(mock_file_obj, progress)  # Progressを渡すように修正
-
-                    # 処理後、一時ファイルを削除
-                    # process_excel_gradio内で削除しようとすると、Gradioがまだ掴んでいる可能性があるため、ここで削除
-                    try:
-                        os.remove(tmp_file.name)
-                        logging.info(f"一時ファイル {tmp_file.name} を削除しました。")
-                    except OSError as e:
-                        logging.warning(f"一時ファイル {tmp_file.name} の削除に失敗しました: {e}")
-
-                    # DataFrameをそのまま返す
-                    return result_df, status
-
-            except Exception as e:
-                logging.exception(f"ドロップダウンファイルの処理中にエラーが発生しました: {dropdown_choice}")
-                error_msg = f"エラー: ファイル '{dropdown_choice}' の処理中に問題が発生しました。詳細: {repr(e)}"
-                # エラー時は空のDataFrameとエラーステータスを返す
-                return pd.DataFrame(), error_msg
-        else:
-            # ファイルが選択されていない場合
-            logging.warning("実行ボタンが押されましたが、ファイルが選択されていません。")
-            # 空のDataFrameとメッセージを返す
-            return pd.DataFrame(), "ファイルを選択してください。"
-
-    run_button.click(
-        fn=run_processing_wrapper,
-        inputs=[file_dropdown],  # file_upload を削除
-        outputs=[output_table, status_text],  # output_text を output_table に変更
-        # Progressを有効化
-        # api_name="run_processing" # 必要に応じてAPI名を有効化
-    )
+def list_input_files():
+    """data/input ディレクトリ内の入力ファイル名（Excel / CSV / Parquet）を返す（ソートして表示順を安定させる）"""
+    if not (INPUT_DIR.exists() and INPUT_DIR.is_dir()):
+        logging.warning(f"入力ディレクトリが見つかりません: {INPUT_DIR}")
+        return []
+    excel_files = sorted([f.name for f in INPUT_DIR.iterdir() if f.suffix.lower() in INPUT_SUFFIXES])
+    logging.info(f"検出されたExcelファイル: {excel_files}")
+    return excel_files
+
+
+def build_demo():
+    """
+    Gradio の UI を作成して返す
+    gradio の読み込みと data/input の走査はここで行うため、app をインポートするだけでは行われない
+    """
+    import gradio as gr
+    import pandas as pd
+
+    excel_files = list_input_files()
+    with gr.Blocks(theme=gr.themes.Soft()) as demo:
+        gr.Markdown("# Excel 時計情報 検索・抽出ツール")
+        gr.Markdown(
+            "`data/input` 内のExcelファイルを選択するか、新しいファイルをアップロードして「実行」ボタンを押してください。"
+        )
+
+        with gr.Row():
+            with gr.Column(scale=1):
+                gr.Markdown("### 入力設定")
+                # data/input内のファイルを選択するドロップダウン
+                file_dropdown = gr.Dropdown(
+                    label="既存のファイルを選択",
+                    choices=excel_files,
+                    value=excel_files[0] if excel_files else None,
+                    # ファイルがない場合は非表示にするか、メッセージを表示する
+                    info=(
+                        "`data/input` ディレクトリ内の .xlsx / .csv / .parquet ファイルが表示されます。"
+                        if excel_files
+                        else "`data/input` に入力ファイル (.xlsx / .csv / .parquet) が見つかりません。"
+                    ),
+                    interactive=bool(excel_files),  # ファイルがない場合は操作不可
+                )
+                # # または、ファイルをアップロード (一時的にコメントアウト)
+                # file_upload = gr.File(
+                #     label="または、Excelファイルをアップロード",
+                #     file_types=[".xlsx"],
+                # )
+                plan_queries_checkbox = gr.Checkbox(
+                    label="同じ型番の検索をまとめる",
+                    value=False,
+                    info="同じブランド・型番の行を1回の検索にまとめ、文字盤色・ブレス形状で振り分けます (CLI の --plan-queries と同じ)。",
+                )
+                run_button = gr.Button("実行", variant="primary")
+                status_text = gr.Textbox(label="ステータス", interactive=False, lines=1)
+                gr.Markdown("### ジョブ一覧")
+                # 全セッションの実行中・待機中・最近終了したジョブ
+                job_table = gr.DataFrame(label="実行中・待機中のジョブ", interactive=False)
+
+            with gr.Column(scale=3):
+                gr.Markdown("### 処理結果")
+                output_table = gr.DataFrame(label="抽出結果")  # TextboxからDataFrameに戻す
+                # output_text = gr.Textbox(label="抽出結果 (テキスト)", lines=15, interactive=False) # DataFrameを使うので削除
+
+        # --- イベントハンドラ ---
+        # ファイルがアップロードされたら、ドロップダウンの選択を解除
+        def clear_dropdown_on_upload(uploaded_file):
+            if uploaded_file is not None:
+                return gr.Dropdown(value=None)  # ドロップダウンの選択を解除
+                # アップロードがクリアされた場合などは元の値を維持 (あるいはNoneのまま)
+                # この動作は要件次第
+                return gr.Dropdown()  # 現状維持
+
+        # # file_upload.upload(fn=clear_dropdown_on_upload, inputs=[file_upload], outputs=[file_dropdown]) # 一時的にコメントアウト
+
+        # # ドロップダウンが選択されたら、アップロードされたファイルをクリア (不要に)
+        # def clear_upload_on_select(dropdown_value):
+        #     if dropdown_value is not None:
+        #         return gr.File(value=None)
+        #         return gr.File()
+
+        # # file_dropdown.change(fn=clear_upload_on_select, inputs=[file_dropdown], outputs=[file_upload]) # 一時的にコメントアウト
+
+        # 実行ボタンのクリックイベント (ファイルアップロードを除外, Progressを有効化)
+        def run_processing_wrapper(dropdown_choice, plan_queries, progress=gr.Progress(track_tqdm=True)):  # Progressのコメント解除
+            """実行ボタンクリック時の処理 (ドロップダウンのみ)。処理途中の結果を順次返す"""
+            target_file_obj = None
+            source_description = ""
+
+            if dropdown_choice is not None:
+                # ドロップダウンで選択されたファイルを使用
+                file_path = INPUT_DIR / dropdown_choice
+                source_description = f"選択されたファイル ({dropdown_choice})"
+                if not file_path.exists():
+                    logging.error(f"選択されたファイルが見つかりません: {file_path}")
+                    yield pd.DataFrame(), f"エラー: 選択されたファイル '{dropdown_choice}' が見つかりません。"
+                    return
+
+                # GradioのFileコンポーネントはファイルオブジェクトを期待するため、
+                # 選択されたファイルを一時ディレクトリにコピーして、そのオブジェクトを渡す
+                try:
+                    # 一時ファイルを作成 (接尾辞を元のファイルに合わせる)
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=file_path.suffix) as tmp_file:
+                        shutil.copyfile(file_path, tmp_file.name)
+                        logging.info(f"選択されたファイル {file_path} を一時ファイル {tmp_file.name} にコピーしました。")
+
+                        # GradioのFileコンポーネントが返すオブジェクトを模倣
+                        # Gradio内部で使われるかもしれない属性も設定しておく
+                        class MockFile:
+                            def __init__(self, name, orig_name):
+                                self.name = name  # 一時ファイルのフルパス
+                                self.orig_name = orig_name  # 元のファイル名
+
+                        mock_file_obj = MockFile(tmp_file.name, dropdown_choice)
+
+                        logging.info(f"処理を開始します。ソース: {source_description}")
+                        try:
+                            # 処理途中の結果テーブルをそのまま順次返す
+                            yield from process_excel_gradio(mock_file_obj, progress, plan_queries=plan_queries)  # Progressを渡すように修正
+                        finally:
+                            # 処理後（中断時も含む）、一時ファイルを削除
+                            # process_excel_gradio内で削除しようとすると、Gradioがまだ掴んでいる可能性があるため、ここで削除
+                            try:
+                                os.remove(tmp_file.name)
+                                logging.info(f"一時ファイル {tmp_file.name} を削除しました。")
+                            except OSError as e:
+                                logging.warning(f"一時ファイル {tmp_file.name} の削除に失敗しました: {e}")
+
+                except Exception as e:
+                    logging.exception(f"ドロップダウンファイルの処理中にエラーが発生しました: {dropdown_choice}")
+                    error_msg = f"エラー: ファイル '{dropdown_choice}' の処理中に問題が発生しました。詳細: {repr(e)}"
+                    # エラー時は空のDataFrameとエラーステータスを返す
+                    yield pd.DataFrame(), error_msg
+            else:
+                # ファイルが選択されていない場合
+                logging.warning("実行ボタンが押されましたが、ファイルが選択されていません。")
+                # 空のDataFrameとメッセージを返す
+                yield pd.DataFrame(), "ファイルを選択してください。"
+
+        run_button.click(
+            fn=run_processing_wrapper,
+            inputs=[file_dropdown, plan_queries_checkbox],  # file_upload を削除
+            outputs=[output_table, status_text],  # output_text を output_table に変更
+            # 同時実行数は job_scheduler で制御するため、Gradio側では制限しない（待機中も順番を表示できる）
+            concurrency_limit=None,
+            # Progressを有効化
+            # api_name="run_processing" # 必要に応じてAPI名を有効化
+        )
+
+        # ジョブ一覧を定期的に更新
+        job_list_timer = gr.Timer(JOB_LIST_REFRESH_INTERVAL)
+        job_list_timer.tick(fn=lambda: pd.DataFrame(job_scheduler.snapshot()), outputs=[job_table])
+    return demo
+
 
 if __name__ == "__main__":
     # 環境変数からポート番号を取得、なければデフォルト値
     port = int(os.environ.get("GRADIO_PORT", 7860))
+    # METRICS_PORT を設定した場合は、処理時間・API呼び出しの集計を Prometheus 形式で公開する (http://<host>:<port>/metrics)
+    metrics_port = os.environ.get("METRICS_PORT")
+    if metrics_port:
+        start_prometheus_server(int(metrics_port))
+        logging.info(f"メトリクスをポート {metrics_port} の /metrics で公開します。")
     logging.info(f"Gradioアプリケーションをポート {port} で起動します...")
     # share=True にするとパブリックURLが生成される
-    demo.launch(server_name="0.0.0.0", server_port=port, share=True)
+    build_demo().launch(server_name="0.0.0.0", server_port=port, share=True)
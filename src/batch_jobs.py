@@ -0,0 +1,384 @@
+import copy
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+from pipeline import merge_extracted, row_result
+from result_writer import write_json_array
+from watch_info_extractor import failed_watch_info
+
+logger = logging.getLogger(__name__)
+
+# OpenAI Batch API の1ファイルあたりの上限（リクエスト数・ファイルサイズ）
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 200 * 1000 * 1000  # 200 MB
+BATCH_ENDPOINT = "/v1/chat/completions"
+REQUESTS_FILE_PATTERN = "requests-{:05d}.jsonl"
+MANIFEST_FILE = "manifest.jsonl"    # 行ごとの検索キーワードとURLの一覧
+PREFILLED_FILE = "prefilled.jsonl"  # キャッシュ済みで送信不要だった結果（出力ファイルと同じ形式）
+CACHE_KEYS_FILE = "cache_keys.jsonl"  # custom_id と抽出結果キャッシュのキーの対応
+RULE_RESULTS_FILE = "rule_results.jsonl"  # ルールで一部の項目だけ確定できた結果（取り込み時に LLM の結果とマージする）
+STATE_FILE = "state.json"           # 送信したジョブの状態
+OUTPUT_DIR = "outputs"
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def url_custom_id(url: str) -> str:
+    """URL から Batch リクエストの custom_id を生成する（同じURLは同じIDになる）"""
+    return "url-" + hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+
+def _output_line(custom_id: str, content: str = None, error: str = None) -> dict:
+    """Batch API の出力ファイルと同じ形式の1行を作成する"""
+    if error is not None:
+        return {"custom_id": custom_id, "response": None, "error": {"message": error}}
+    return {
+        "custom_id": custom_id,
+        "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}},
+        "error": None,
+    }
+
+
+def _load_state(batch_dir: Path) -> dict:
+    state_path = batch_dir / STATE_FILE
+    if state_path.exists():
+        with open(state_path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"jobs": []}
+
+
+def _save_state(batch_dir: Path, state: dict):
+    with open(batch_dir / STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+
+class _RequestFileWriter:
+    """リクエストを max_requests 件・max_bytes バイトのどちらかに達するごとに別ファイルへ書き出す"""
+
+    def __init__(self, batch_dir: Path, max_requests: int, max_bytes: int = MAX_BYTES_PER_FILE):
+        self.batch_dir = batch_dir
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.file = None
+        self.file_count = 0
+        self.lines_in_file = 0
+        self.bytes_in_file = 0
+        self.total = 0
+
+    def write(self, line: dict):
+        data = (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+        if (self.file is None or self.lines_in_file >= self.max_requests
+                or (self.lines_in_file and self.bytes_in_file + len(data) > self.max_bytes)):
+            self.close()
+            self.file_count += 1
+            self.file = open(self.batch_dir / REQUESTS_FILE_PATTERN.format(self.file_count), "wb")
+            self.lines_in_file = 0
+            self.bytes_in_file = 0
+        self.file.write(data)
+        self.lines_in_file += 1
+        self.bytes_in_file += len(data)
+        self.total += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def prepare_batch(rows, tavily_client, watch_extractor, batch_dir, max_results: int, advance_search: bool,
+                  content_trimmer=None, max_requests_per_file: int = MAX_REQUESTS_PER_FILE, on_row=None,
+                  rule_extractor=None, max_bytes_per_file: int = MAX_BYTES_PER_FILE) -> dict:
+    """
+    手順1: 各行を検索し、抽出リクエストを Batch API 形式の JSONL ファイルに書き出す
+    同じURLのリクエストは1回だけ書き出し、抽出結果キャッシュにあるもの・ルールで全項目を確定できたものは
+    prefilled.jsonl に書き出す
+    パラメータ:
+    rows (Iterable[tuple]): (行番号, 検索キーワード, 型番) のイテラブル
+    batch_dir (str | Path): 書き出し先のディレクトリ（既存のリクエスト/マニフェストは上書き）
+    on_row (Callable): 1行処理するごとに (行番号, URL件数) で呼ばれるコールバック
+    rule_extractor (RuleExtractor): LLM の前にルールで抽出する。一部の項目だけ確定できた場合は全項目をリクエストし、
+        取り込み時に確定できなかった項目だけ LLM の値を使う
+    max_bytes_per_file (int): 1ファイルあたりの最大バイト数（Batch API のファイルサイズの上限）
+    戻り値:
+    dict: 行数・リクエスト数・キャッシュ済み件数・リクエストファイル数
+    """
+    batch_dir = Path(batch_dir)
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    for old_file in batch_dir.glob("requests-*.jsonl"):
+        old_file.unlink()
+    _save_state(batch_dir, {"jobs": []})
+
+    requests = _RequestFileWriter(batch_dir, max_requests_per_file, max_bytes_per_file)
+    seen_ids = set()
+    row_count = 0
+    prefilled_count = 0
+    try:
+        with open(batch_dir / MANIFEST_FILE, "w", encoding="utf-8") as manifest, \
+                open(batch_dir / PREFILLED_FILE, "w", encoding="utf-8") as prefilled, \
+                open(batch_dir / CACHE_KEYS_FILE, "w", encoding="utf-8") as cache_keys, \
+                open(batch_dir / RULE_RESULTS_FILE, "w", encoding="utf-8") as rule_results:
+            for row_index, input_keywords, model_number in rows:
+                urls = []
+                row_error = None
+                try:
+                    search_results = tavily_client.search_item(input_keywords, max_results=max_results,
+                                                               advance_search=advance_search)
+                except Exception as e:
+                    search_results = []
+                    row_error = f"商品検索エラー: {repr(e)}"
+
+                for item in search_results:
+                    url, content = item.get("url"), item.get("content")
+                    if not url or not content:
+                        continue
+                    urls.append(url)
+                    custom_id = url_custom_id(url)
+                    if custom_id in seen_ids:
+                        continue
+                    seen_ids.add(custom_id)
+
+                    rule_info = None
+                    if rule_extractor is not None:
+                        try:
+                            rule_info, unresolved = rule_extractor.resolve(content, model_number)
+                        except Exception as e:
+                            # ルールで抽出できない場合は全項目を LLM にリクエストする（バッチ全体は止めない）
+                            logger.warning(f"ルール抽出エラー（LLM にリクエストします）: {url}: {e!r}")
+                    if rule_info is not None:
+                        rule_extractor.record(unresolved)
+                        if not unresolved:
+                            prefilled.write(json.dumps(
+                                _output_line(custom_id, json.dumps(rule_info, ensure_ascii=False)), ensure_ascii=False) + "\n")
+                            prefilled_count += 1
+                            continue
+                        rule_results.write(json.dumps({"custom_id": custom_id, "result": rule_info, "fields": unresolved},
+                                                      ensure_ascii=False) + "\n")
+
+                    if content_trimmer is not None:
+                        content = content_trimmer.trim(content, model_number)
+                    cache_key = watch_extractor.cache_key(content)
+                    cached_result = watch_extractor.result_cache.get(cache_key) if cache_key is not None else None
+                    if cached_result is not None:
+                        prefilled.write(json.dumps(
+                            _output_line(custom_id, json.dumps(cached_result, ensure_ascii=False)), ensure_ascii=False) + "\n")
+                        prefilled_count += 1
+                        continue
+                    if cache_key is not None:
+                        cache_keys.write(json.dumps({"custom_id": custom_id, "cache_key": cache_key}) + "\n")
+                    requests.write({
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": BATCH_ENDPOINT,
+                        "body": watch_extractor.build_request_body(content),
+                    })
+
+                manifest.write(json.dumps({
+                    "row_index": row_index, "input_keywords": input_keywords, "urls": urls, "row_error": row_error,
+                }, ensure_ascii=False) + "\n")
+                row_count += 1
+                if on_row is not None:
+                    on_row(row_index, len(urls))
+    finally:
+        requests.close()
+
+    return {"rows": row_count, "requests": requests.total, "prefilled": prefilled_count,
+            "request_files": requests.file_count}
+
+
+def submit_batch(batch_dir, executor) -> list:
+    """
+    手順2: まだ送信していないリクエストファイルを executor に送信し、ジョブIDを state.json に記録する
+    送信後はプロセスを終了してよい（結果は ingest_batch で取り込む）
+    戻り値:
+    List[dict]: 今回送信したジョブ
+    """
+    batch_dir = Path(batch_dir)
+    state = _load_state(batch_dir)
+    submitted_files = {job["request_file"] for job in state["jobs"]}
+    new_jobs = []
+    for request_path in sorted(batch_dir.glob("requests-*.jsonl")):
+        if request_path.name in submitted_files:
+            continue
+        job = {"request_file": request_path.name, "executor": executor.name,
+               "job_id": executor.submit(request_path), "status": "submitted", "output_file": None}
+        state["jobs"].append(job)
+        new_jobs.append(job)
+        _save_state(batch_dir, state)  # 途中で失敗しても送信済みのジョブを失わないよう1件ごとに保存
+    return new_jobs
+
+
+def _parse_output_line(line: dict, failed_description: str):
+    """出力ファイルの1行から抽出結果を取り出す（失敗時は失敗理由の文字列を返す）"""
+    if line.get("error"):
+        return f"{failed_description}: {line['error'].get('message', line['error'])}"
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        return f"{failed_description}: HTTP {response.get('status_code')}"
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        result = json.loads(content)
+    except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+        return f"{failed_description}: {repr(e)}"
+    return result if result else "詳細抽出失敗"
+
+
+def ingest_batch(batch_dir, executor, output_path, result_cache=None) -> dict:
+    """
+    手順3: 完了したジョブの出力をダウンロードし、result.json と同じ構造のファイルを作成する
+    未完了のジョブがある場合は出力を作成せず、状態だけを更新して返す（あとで再実行する）
+    result_cache を渡した場合は、取り込んだ抽出結果を抽出結果キャッシュにも保存する
+    戻り値:
+    dict: {"completed": bool, "pending_jobs": 件数, "rows": 行数, "failed_urls": 件数}
+    """
+    batch_dir = Path(batch_dir)
+    state = _load_state(batch_dir)
+    (batch_dir / OUTPUT_DIR).mkdir(exist_ok=True)
+
+    pending_jobs = 0
+    for job in state["jobs"]:
+        if job["status"] in FINAL_STATUSES:
+            continue
+        job["status"] = executor.status(job["job_id"])
+        if job["status"] == "completed":
+            output_file = Path(OUTPUT_DIR) / (Path(job["request_file"]).stem + ".output.jsonl")
+            executor.download(job["job_id"], batch_dir / output_file)
+            job["output_file"] = str(output_file)
+        elif job["status"] not in FINAL_STATUSES:
+            pending_jobs += 1
+    _save_state(batch_dir, state)
+    if pending_jobs:
+        return {"completed": False, "pending_jobs": pending_jobs, "rows": 0, "failed_urls": 0}
+
+    # custom_id -> 抽出結果（または失敗理由）
+    results = {}
+    output_files = [batch_dir / PREFILLED_FILE] + [batch_dir / job["output_file"] for job in state["jobs"]
+                                                   if job.get("output_file")]
+    for output_file in output_files:
+        if not output_file.exists():
+            continue
+        with open(output_file, encoding="utf-8") as f:
+            for raw_line in f:
+                if raw_line.strip():
+                    line = json.loads(raw_line)
+                    results[line["custom_id"]] = _parse_output_line(line, "バッチ抽出エラー")
+
+    cache_keys_path = batch_dir / CACHE_KEYS_FILE
+    if result_cache is not None and cache_keys_path.exists():
+        with open(cache_keys_path, encoding="utf-8") as f:
+            for raw_line in f:
+                entry = json.loads(raw_line)
+                result = results.get(entry["custom_id"])
+                if isinstance(result, dict):
+                    result_cache.set(entry["cache_key"], result)
+
+    # ルールで一部の項目だけ確定できた URL は、確定できなかった項目だけ LLM の値を使う（同期の処理と同じマージ）
+    rule_results_path = batch_dir / RULE_RESULTS_FILE
+    if rule_results_path.exists():
+        with open(rule_results_path, encoding="utf-8") as f:
+            for raw_line in f:
+                entry = json.loads(raw_line)
+                result = results.get(entry["custom_id"])
+                if isinstance(result, dict):
+                    results[entry["custom_id"]] = merge_extracted(entry["result"], result, entry["fields"])
+
+    failed_urls = 0
+
+    def iter_rows():
+        nonlocal failed_urls
+        with open(batch_dir / MANIFEST_FILE, encoding="utf-8") as manifest:
+            for raw_line in manifest:
+                entry = json.loads(raw_line)
+                extracted_results = []
+                for url in entry["urls"]:
+                    result = results.get(url_custom_id(url), "バッチ抽出エラー: 結果なし")
+                    if isinstance(result, str):
+                        failed_urls += 1
+                        extracted_results.append(failed_watch_info(url, result))
+                    else:
+                        watch_detail = copy.deepcopy(result)
+                        watch_detail["url"] = url
+                        extracted_results.append(watch_detail)
+                yield row_result(entry["input_keywords"], extracted_results, entry["row_error"])
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    row_count = write_json_array(output_path, iter_rows())
+    return {"completed": True, "pending_jobs": 0, "rows": row_count, "failed_urls": failed_urls}
+
+
+class LocalFileExecutor:
+    """
+    Batch API のローカル代替となる executor
+    送信時にリクエストファイルを同期的に処理し、Batch API と同じ形式の出力ファイルを書き出す
+    テストや API キーを使わない検証、通常の API で少量を処理したい場合に利用する
+    """
+    name = "local"
+
+    def __init__(self, complete, work_dir):
+        """
+        パラメータ:
+        complete (Callable[[dict], str]): リクエストボディを受け取り、応答本文（JSON 文字列）を返す関数
+        work_dir (str | Path): 出力ファイルを置くディレクトリ
+        """
+        self.complete = complete
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+
+    def _output_path(self, job_id: str) -> Path:
+        return self.work_dir / f"{job_id}.local-output.jsonl"
+
+    def submit(self, request_path) -> str:
+        request_path = Path(request_path)
+        job_id = f"local-{request_path.stem}"
+        with open(request_path, encoding="utf-8") as requests, \
+                open(self._output_path(job_id), "w", encoding="utf-8") as output:
+            for raw_line in requests:
+                if not raw_line.strip():
+                    continue
+                request = json.loads(raw_line)
+                try:
+                    line = _output_line(request["custom_id"], self.complete(request["body"]))
+                except Exception as e:
+                    line = _output_line(request["custom_id"], error=repr(e))
+                output.write(json.dumps(line, ensure_ascii=False) + "\n")
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        return "completed" if self._output_path(job_id).exists() else "failed"
+
+    def download(self, job_id: str, output_path):
+        Path(output_path).write_bytes(self._output_path(job_id).read_bytes())
+
+
+class OpenAIBatchExecutor:
+    """OpenAI Batch API にリクエストファイルを送信する executor（24時間以内に非同期で処理される）"""
+    name = "openai"
+
+    def __init__(self, client, completion_window: str = "24h"):
+        """
+        パラメータ:
+        client (OpenAI): OpenAI クライアント
+        completion_window (str): Batch API の完了期限
+        """
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, request_path) -> str:
+        with open(request_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, job_id: str) -> str:
+        return self.client.batches.retrieve(job_id).status
+
+    def download(self, job_id: str, output_path):
+        batch = self.client.batches.retrieve(job_id)
+        with open(output_path, "wb") as f:
+            # 成功分（output_file）と失敗分（error_file）をまとめて1つの出力ファイルにする
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).content)
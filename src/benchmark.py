@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from fake_backends import FaultProfile, FakeTavilyClient, FakeOpenAI
+from tavily_processor import tavily_processor
+from watch_info_extractor import WatchInfoExtractor
+from content_trimmer import ContentTrimmer, DEFAULT_MAX_CHARS
+from rule_extractor import RuleExtractor
+from near_duplicates import NearDuplicateIndex
+from cache_store import SQLiteCache
+from pipeline import WatchSearchPipeline, UrlRegistry
+from metrics import get_metrics
+from retry import ApiCaller, RetryPolicy, DEFAULT_POLICIES, BASE_BACKOFF_SECONDS
+
+console = Console()
+
+BASE_DIR = Path(__file__).parent.parent
+DEFAULT_TEMPLATE_EXCEL = BASE_DIR / 'data' / 'target.xlsx'
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_LATENCY = 0.2   # 疑似 API の平均応答時間（秒）
+DEFAULT_JITTER = 0.1    # 疑似 API の応答時間のばらつき（秒）
+
+
+def build_synthetic_sheet(size: int, duplicate_ratio: float = 0.0, template_path=DEFAULT_TEMPLATE_EXCEL):
+    """
+    target.xlsx の行をもとに、指定した行数の入力データを作る
+    duplicate_ratio の割合の行は、前の行と同じ検索条件になる（キャッシュ・重複排除の効果を測る場合に使う）
+    """
+    template = pd.read_excel(template_path)
+    rows = []
+    unique_count = 0
+    for i in range(size):
+        if rows and int((i + 1) * duplicate_ratio) > int(i * duplicate_ratio):
+            rows.append(dict(rows[i // 2]))  # 前半の行と同じ検索条件
+            continue
+        row = template.iloc[unique_count % len(template)].to_dict()
+        if unique_count >= len(template):
+            # テンプレートを一巡した後は、行ごとに異なる検索条件にする
+            row["ブレス形状"] = f"{row['ブレス形状']} {unique_count // len(template)}"
+        rows.append(row)
+        unique_count += 1
+    return pd.DataFrame(rows, columns=template.columns)
+
+
+@contextlib.contextmanager
+def _offline_environment(with_rate_limits: bool):
+    """計測中だけ環境変数を設定し、終了後に元に戻す"""
+    overrides = {}
+    # API キーは使わないが、クライアントの初期化に必要
+    for name in ("TAVILY_API_KEY", "OPENAI_API_KEY"):
+        if not os.environ.get(name):
+            overrides[name] = "offline-benchmark"
+    if not with_rate_limits:
+        # 疑似 API の計測にレート制限の待ち時間を含めない（レート制限はプロセスで最初に使う時点の設定になる）
+        for name in ("TAVILY_RPM", "OPENAI_RPM", "OPENAI_TPM"):
+            overrides[name] = "0"
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _peak_rss_mb():
+    """プロセスの最大メモリ使用量（MB）。取得できない環境では None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except (ImportError, AttributeError):
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def run_benchmark(size: int, workers: int = 1, batch_size: int = 1, trim_chars: int = None, use_cache: bool = False,
+                  passes: int = 1, duplicate_ratio: float = 0.0, unique_pages: bool = False,
+                  latency: float = DEFAULT_LATENCY, jitter: float = DEFAULT_JITTER, error_rate: float = 0.0,
+                  rate_limit_rate: float = 0.0, seed: int = 0, with_rate_limits: bool = False,
+                  retry_base_delay: float = BASE_BACKOFF_SECONDS, fast_path: bool = False,
+                  near_duplicates: bool = False):
+    """
+    疑似 API を使ってパイプラインを実行し、処理性能を計測する（API は呼ばない）
+    パラメータ:
+    size (int): 入力データの行数
+    workers (int): 並列処理のワーカー数
+    batch_size (int): 1回のリクエストでまとめて抽出する件数
+    trim_chars (int): LLM に渡すテキストの最大文字数（0 でトリミングしない、None は既定値）
+    use_cache (bool): 一時ディレクトリの検索・抽出キャッシュを使う
+    passes (int): 同じ入力を続けて処理する回数（2回目以降はキャッシュ済みの状態を計測できる）
+    duplicate_ratio (float): 前の行と同じ検索条件になる行の割合
+    unique_pages (bool): 検索結果のページを行ごとに別のものにする
+    latency, jitter, error_rate, rate_limit_rate, seed: 疑似 API の設定（FaultProfile）
+    with_rate_limits (bool): 環境変数のレート制限（TAVILY_RPM など）を適用する。False の場合は無制限で計測する
+    retry_base_delay (float): 再試行の指数バックオフの初回待ち時間の上限（秒）
+    fast_path (bool): ルールによる抽出（RuleExtractor）を使い、確定できなかった項目だけを LLM に問い合わせる
+    near_duplicates (bool): 本文がほぼ同じページの抽出結果を再利用する（NearDuplicateIndex）
+    戻り値:
+    dict: 計測結果（最後の回の値。API 呼び出し回数は全体の合計）
+    """
+    search_faults = FaultProfile(latency, jitter, error_rate, rate_limit_rate, seed)
+    chat_faults = FaultProfile(latency, jitter, error_rate, rate_limit_rate, seed)
+    fake_tavily = FakeTavilyClient(search_faults, unique_pages=unique_pages)
+    fake_openai = FakeOpenAI(chat_faults)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        search_cache = SQLiteCache(Path(cache_dir) / "cache.sqlite3", table="search_results") if use_cache else None
+        extraction_cache = SQLiteCache(Path(cache_dir) / "cache.sqlite3", table="extraction_results") if use_cache else None
+        with _offline_environment(with_rate_limits):
+            tavily_client = tavily_processor(search_cache=search_cache)
+            watch_extractor = WatchInfoExtractor(result_cache=extraction_cache)
+        tavily_client.client = fake_tavily
+        watch_extractor.client = fake_openai
+        # サーキットブレーカーの状態を計測ごとに分ける
+        for client, name in ((tavily_client, "tavily"), (watch_extractor, "openai")):
+            client.api = ApiCaller(name, rate_limiter=client.rate_limiter,
+                                   policy=RetryPolicy(**DEFAULT_POLICIES[name], base_delay=retry_base_delay))
+
+        trim_chars = DEFAULT_MAX_CHARS if trim_chars is None else trim_chars
+        load_start = time.perf_counter()
+        df = build_synthetic_sheet(size, duplicate_ratio)
+        load_seconds = time.perf_counter() - load_start
+
+        for _ in range(passes):
+            rule_extractor = RuleExtractor() if fast_path else None
+            near_duplicate_index = NearDuplicateIndex() if near_duplicates else None
+            pipeline = WatchSearchPipeline(tavily_client, watch_extractor, max_results=10, advance_search=True,
+                                           workers=workers, batch_size=batch_size, url_registry=UrlRegistry(),
+                                           content_trimmer=ContentTrimmer(max_chars=trim_chars) if trim_chars > 0 else None,
+                                           log=lambda message: None, rule_extractor=rule_extractor,
+                                           near_duplicates=near_duplicate_index)
+            row_latencies = []
+            latency_lock = threading.Lock()
+            process_row = pipeline.process_row
+
+            def timed_process_row(*args, **kwargs):
+                start = time.perf_counter()
+                result = process_row(*args, **kwargs)
+                with latency_lock:
+                    row_latencies.append(time.perf_counter() - start)
+                return result
+
+            pipeline.process_row = timed_process_row
+            get_metrics().reset()
+            failed_urls = 0
+            row_errors = 0
+            start = time.perf_counter()
+            for _, result in pipeline.run(df.iterrows()):
+                row_errors += result.get("row_error") is not None
+                failed_urls += sum(1 for detail in result["extracted_results"] if detail.get("error"))
+            elapsed = time.perf_counter() - start
+
+        if search_cache is not None:
+            search_cache.close()
+            extraction_cache.close()
+
+    peak_rss = _peak_rss_mb()
+    return {
+        "rows": size,
+        "workers": workers,
+        "batch_size": batch_size,
+        "cache": use_cache,
+        "passes": passes,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(size / elapsed, 2) if elapsed > 0 else None,
+        "row_latency_p50": round(_percentile(row_latencies, 50), 3) if row_latencies else None,
+        "row_latency_p95": round(_percentile(row_latencies, 95), 3) if row_latencies else None,
+        "excel_build_seconds": round(load_seconds, 3),
+        "search_calls": search_faults.calls,
+        "chat_calls": chat_faults.calls,
+        "injected_errors": search_faults.errors + chat_faults.errors,
+        "injected_rate_limits": search_faults.rate_limited + chat_faults.rate_limited,
+        "retries": sum(value for name, value in get_metrics().snapshot()["counters"].items() if name.endswith("_retries")),
+        "row_errors": row_errors,
+        "failed_urls": failed_urls,
+        "prompt_tokens": fake_openai.prompt_tokens,
+        "completion_tokens": fake_openai.completion_tokens,
+        "fast_path_ratio": round(rule_extractor.stats()["fast_path_ratio"], 3) if rule_extractor else None,
+        "near_duplicates_reused": near_duplicate_index.reused if near_duplicate_index else None,
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        # 処理段階ごとの合計時間（秒、最後の回）
+        "stage_seconds": {name: span["total_seconds"] for name, span in get_metrics().snapshot()["spans"].items()},
+    }
+
+
+def print_results(results):
+    """計測結果を表で表示する"""
+    table = Table(title="オフラインベンチマーク結果")
+    columns = [("rows", "行数"), ("workers", "workers"), ("batch_size", "batch"), ("cache", "cache"),
+               ("rows_per_second", "rows/s"), ("row_latency_p50", "p50(s)"), ("row_latency_p95", "p95(s)"),
+               ("search_calls", "検索API"), ("chat_calls", "抽出API"), ("failed_urls", "抽出失敗"),
+               ("row_errors", "行エラー"), ("fast_path_ratio", "LLMなし率"), ("peak_rss_mb", "最大RSS(MB)")]
+    for _, title in columns:
+        table.add_column(title, justify="right")
+    for result in results:
+        table.add_row(*[str(result.get(key)) for key, _ in columns])
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='疑似 API (記録済みの応答を再生) を使ってパイプラインの処理性能を計測するスクリプト')
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help=f'計測する行数 (カンマ区切り、10〜10000 など) (デフォルト: {",".join(str(size) for size in DEFAULT_SIZES)})')
+    parser.add_argument('--workers', type=int, default=1, help='並列処理のワーカー数 (デフォルト: 1)')
+    parser.add_argument('--batch-size', type=int, default=1, help='1回のリクエストでまとめて抽出する件数 (デフォルト: 1)')
+    parser.add_argument('--trim-chars', type=int, default=None, help='LLMに渡すページテキストの最大文字数。0でトリミングしない')
+    parser.add_argument('--cache', action='store_true', help='一時ディレクトリの検索・抽出キャッシュを使う')
+    parser.add_argument('--passes', type=int, default=1, help='同じ入力を続けて処理する回数。2以上でキャッシュ済みの状態を計測 (デフォルト: 1)')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0, help='前の行と同じ検索条件になる行の割合 (デフォルト: 0)')
+    parser.add_argument('--unique-pages', action='store_true', help='検索結果のページを行ごとに別のものにする (URLの重複排除が効かない条件)')
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help=f'疑似APIの平均応答時間（秒） (デフォルト: {DEFAULT_LATENCY})')
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER, help=f'疑似APIの応答時間のばらつき（秒） (デフォルト: {DEFAULT_JITTER})')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='疑似APIが500エラーを返す割合 (デフォルト: 0)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='疑似APIが429エラーを返す割合 (デフォルト: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='疑似乱数のシード (デフォルト: 0)')
+    parser.add_argument('--with-rate-limits', action='store_true', help='環境変数のレート制限 (TAVILY_RPM など) を適用して計測する')
+    parser.add_argument('--retry-base-delay', type=float, default=BASE_BACKOFF_SECONDS,
+                        help=f'再試行の指数バックオフの初回待ち時間の上限（秒） (デフォルト: {BASE_BACKOFF_SECONDS})')
+    parser.add_argument('--fast-path', action='store_true', help='ルールによる抽出を使い、確定できなかった項目だけをLLMに問い合わせる')
+    parser.add_argument('--near-duplicates', action='store_true', help='本文がほぼ同じページの抽出結果を再利用する')
+    parser.add_argument('--output', default=None, help='計測結果を保存するJSONファイル')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)  # 1サイズ分を子プロセスで実行する
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    options = dict(workers=args.workers, batch_size=args.batch_size, trim_chars=args.trim_chars, use_cache=args.cache,
+                   passes=args.passes, duplicate_ratio=args.duplicate_ratio, unique_pages=args.unique_pages,
+                   latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   rate_limit_rate=args.rate_limit_rate, seed=args.seed, with_rate_limits=args.with_rate_limits,
+                   retry_base_delay=args.retry_base_delay, fast_path=args.fast_path,
+                   near_duplicates=args.near_duplicates)
+
+    if args.single:
+        print(json.dumps(run_benchmark(sizes[0], **options)))
+        return
+
+    results = []
+    for size in sizes:
+        console.print(f"計測中: {size} 行...")
+        # 最大メモリ使用量を行数ごとに測るため、別プロセスで実行する
+        command = [sys.executable, __file__] + sys.argv[1:] + ['--single', '--sizes', str(size)]
+        completed = subprocess.run(command, capture_output=True, text=True, encoding="utf-8")
+        if completed.returncode != 0:
+            console.print(f"[bold red]エラー:[/bold red] {size} 行の計測に失敗しました。\n{completed.stderr}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        console.print(f"計測結果を '{args.output}' に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
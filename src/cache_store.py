@@ -0,0 +1,99 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class SQLiteCache:
+    """
+    SQLite を使ったキー・バリュー形式の永続キャッシュ
+    値は JSON として保存し、TTL による期限切れと件数上限による LRU 削除を行う
+    複数スレッドから共有して利用できる
+    """
+
+    def __init__(self, path, table: str = "cache", ttl_seconds: float = None, max_entries: int = None, clock=time.time):
+        """
+        パラメータ:
+        path (str | Path): SQLite ファイルのパス（親ディレクトリがなければ作成）
+        table (str): 使用するテーブル名（1つのファイルに複数のキャッシュを置ける）
+        ttl_seconds (float): 有効期限（秒）。None の場合は期限なし
+        max_entries (int): 保持する最大件数。超えた分は最終アクセスが古い順に削除。None の場合は無制限
+        clock (Callable[[], float]): 現在時刻（UNIX時間）を返す関数（テストで差し替える）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_accessed ON {table} (last_accessed)")
+        self._conn.commit()
+        self._entry_count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """任意の JSON 化可能な値の組からキャッシュキー（SHA-256）を生成する"""
+        serialized = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """キーに対応する値を返す。存在しないか期限切れの場合は None を返す"""
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                self._entry_count -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value):
+        """値を保存する。件数上限を超えた場合は最終アクセスが古いものから削除する"""
+        now = self.clock()
+        serialized = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            exists = self._conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                (key, serialized, now, now),
+            )
+            if not exists:
+                self._entry_count += 1
+            if self.max_entries is not None and self._entry_count > self.max_entries:
+                excess = self._entry_count - self.max_entries
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_accessed ASC LIMIT ?)",
+                    (excess,),
+                )
+                self._entry_count -= excess
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """ヒット数・ミス数・保存件数を返す"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": self._entry_count}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,153 @@
+import re
+import threading
+import unicodedata
+
+from rate_limiter import estimate_tokens
+
+# 楽天市場ページのナビゲーション等、情報を含まない定型行（完全一致で除去）
+BOILERPLATE_LINES = {
+    "楽天市場", "ジャンル一覧", "買い物かご", "myクーポン", "閲覧履歴", "お気に入り", "購入履歴",
+    "ヘルプ / 不適切な商品を報告", "この商品の関連商品", "ログイン", "現在ご利用いただけません",
+    "「お知らせ」とは", "かごに追加", "商品をかごに 追加しました", "購入手続きへ", "販売期間前です",
+    "受賞歴", "人気の特集", "レビューを書く", "シェア", "リンクをコピー", "ROOMに投稿",
+    "商品についてのお問い合わせ", "不適切な商品を報告", "すべての配送方法と送料を見る", "内訳",
+    "ショップへ相談", "配送方法と送料", "エラーが発生しました", "OK", "この機能は現在利用できません",
+    "位", "(件)",
+    # ジャンル一覧
+    "レディースファッション", "メンズファッション", "バッグ・小物・ブランド雑貨", "靴", "腕時計",
+    "ジュエリー・アクセサリー", "インナー・下着・ナイトウェア", "タブレットPC・スマートフォン",
+    "パソコン・周辺機器", "光回線・モバイル通信", "家電", "TV・オーディオ・カメラ", "食品",
+    "スイーツ・お菓子", "ワイン", "ビール・洋酒", "日本酒・焼酎", "水・ソフトドリンク", "インテリア・収納",
+    "寝具・ベッド・マットレス", "キッチン用品・食器・調理器具", "日用品雑貨・文房具・手芸",
+    "スポーツ・アウトドア", "ゴルフ用品", "美容・コスメ・香水", "ダイエット・健康", "医薬品・コンタクト・介護",
+    "キッズ・ベビー・マタニティ", "おもちゃ", "ホビー", "ペットフード・ペット用品", "ガーデン・DIY・工具",
+    "花", "ゲーム", "CD・DVD", "楽器・音楽機材", "車用品・バイク用品", "車・バイク", "サービス・リフォーム",
+}
+
+# 情報を含まない定型行（部分一致で除去。長い行は本文を含むことがあるため対象外）
+BOILERPLATE_MAX_LINE_CHARS = 200
+BOILERPLATE_PATTERNS = [
+    re.compile(r"^カテゴリトップ"),
+    re.compile(r"ポイント.*(倍|ゲット|取得)"),
+    re.compile(r"楽天カード|楽天アフィリエイト|アフィリエイトリンク"),
+    re.compile(r"こんな商品(も|に)"),
+    re.compile(r"^※\s*(お届け日|送料|離島)"),
+    re.compile(r"^[\s\W_]*$"),                 # 記号・空白のみの行
+]
+
+# 行の長さによらず除去する行（計測用の画像は URL が長く、BOILERPLATE_MAX_LINE_CHARS を超える）
+MARKUP_PATTERNS = [
+    re.compile(r"^!\[Image"),                 # Markdown の画像
+    re.compile(r"^\[?https?://\S+\]?$"),       # URL のみの行
+]
+
+# 抽出対象の情報を含む行を検出するパターン（この行の前後を残す）
+KEYWORD_PATTERNS = [
+    re.compile(r"[\d,]{4,}\s*円|^[\d,]{5,}$|[¥￥]\s*[\d,]+"),  # 価格
+    re.compile(r"型番|型式|メーカー型番"),
+    re.compile(r"付属品|保証書|保証カード|ギャランティ|箱"),
+    re.compile(r"状態|ランク|コンディション"),
+    re.compile(r"文字盤|ダイヤル|ブレス"),
+    re.compile(r"^【[^】]+】"),                  # 【項目名】形式のスペック行
+]
+
+DEFAULT_MAX_CHARS = 4000   # トリミング後の最大文字数
+DEFAULT_WINDOW_BEFORE = 1  # キーワード行の前に残す行数
+DEFAULT_WINDOW_AFTER = 3   # キーワード行の後に残す行数
+
+
+class ContentTrimmer:
+    """
+    LLM に渡す前に、検索結果の raw_content から定型的なナビゲーション等を除去し、
+    価格・型番・付属品・状態などのキーワード周辺だけを残して文字数の上限内に収めるクラス
+    削減したトークン数（概算）を集計する
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS, window_before: int = DEFAULT_WINDOW_BEFORE,
+                 window_after: int = DEFAULT_WINDOW_AFTER):
+        """
+        パラメータ:
+        max_chars (int): トリミング後の最大文字数
+        window_before (int): キーワード行の前に残す行数
+        window_after (int): キーワード行の後に残す行数
+        """
+        self.max_chars = max_chars
+        self.window_before = window_before
+        self.window_after = window_after
+        self.documents = 0
+        self.original_tokens = 0
+        self.trimmed_tokens = 0
+        self._lock = threading.Lock()
+
+    def trim(self, text: str, model_number: str = None) -> str:
+        """
+        テキストをトリミングして返す
+        パラメータ:
+        text (str): 検索結果の raw_content
+        model_number (str): 検索対象の型番。含む行もキーワード行として扱う
+        戻り値:
+        str: トリミング後のテキスト（先頭のタイトル行は常に残す）
+        """
+        if not text:
+            return text
+
+        lines = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or any(pattern.search(line) for pattern in MARKUP_PATTERNS):
+                continue
+            if not lines:
+                # タイトル行は「ポイント2倍」などの定型の記載を含んでいても残す
+                lines.append(line)
+                continue
+            if line in BOILERPLATE_LINES:
+                continue
+            if len(line) <= BOILERPLATE_MAX_LINE_CHARS and any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS):
+                continue
+            lines.append(line)
+
+        model_key = unicodedata.normalize("NFKC", str(model_number)).casefold() if model_number else None
+        keep = set()
+        if lines:
+            keep.add(0)  # タイトル行（商品名・店舗名を含む）
+        for i, line in enumerate(lines):
+            normalized = unicodedata.normalize("NFKC", line)
+            is_keyword = any(pattern.search(normalized) for pattern in KEYWORD_PATTERNS)
+            if not is_keyword and model_key and model_key in normalized.casefold():
+                is_keyword = True
+            if is_keyword:
+                keep.update(range(max(0, i - self.window_before), min(len(lines), i + self.window_after + 1)))
+
+        kept_lines = []
+        seen = set()
+        length = 0
+        for i in sorted(keep):
+            line = lines[i]
+            if line in seen:  # 同じ行（重複表示される価格やタイトル等）は1回だけ残す
+                continue
+            if self.max_chars and length + len(line) + 1 > self.max_chars:
+                # 上限に達したら、入りきる分だけ行の先頭を残して打ち切る
+                remaining = self.max_chars - length - 1
+                if remaining > 0:
+                    kept_lines.append(line[:remaining])
+                break
+            seen.add(line)
+            kept_lines.append(line)
+            length += len(line) + 1
+
+        trimmed = "\n".join(kept_lines)
+        with self._lock:
+            self.documents += 1
+            self.original_tokens += estimate_tokens(text)
+            self.trimmed_tokens += estimate_tokens(trimmed)
+        return trimmed
+
+    def stats(self) -> dict:
+        """処理件数と、トリミング前後・削減トークン数（概算）を返す"""
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "original_tokens": self.original_tokens,
+                "trimmed_tokens": self.trimmed_tokens,
+                "saved_tokens": self.original_tokens - self.trimmed_tokens,
+            }
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import types
+from pathlib import Path
+
+from rate_limiter import estimate_tokens
+
+BASE_DIR = Path(__file__).parent.parent
+# 再生する記録済みの Tavily 検索結果
+SEARCH_RECORDINGS = [
+    BASE_DIR / "data" / "tavily_playground.json",
+    BASE_DIR / "test" / "results" / "tavily_search_results.json",
+]
+# 再生する記録済みの抽出結果（process_excel.py の出力）
+EXTRACTION_RECORDINGS = [BASE_DIR / "data" / "result_test.json"]
+FALLBACK_EXTRACTION = {
+    "name": "ロレックス ROLEX", "model_number": None, "dial_color": None, "bracelet_type": None, "price": None,
+    "seller": None, "warranty_date": None,
+    "accessories": {"has_warranty_card": None, "has_box": None, "other_description": None}, "condition": None,
+}
+
+
+class FakeAPIError(Exception):
+    """疑似的に発生させる API エラー"""
+
+    def __init__(self, message: str, status_code: int, retry_after_seconds: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after_seconds = retry_after_seconds
+
+
+def _unit(*parts) -> float:
+    """引数から決まる [0, 1) の疑似乱数（スレッドの実行順に依存しない）"""
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+class FaultProfile:
+    """
+    疑似 API の応答時間とエラーの設定
+    応答時間・エラーの有無はリクエスト内容と試行回数から決まるため、並列実行でも結果が再現する
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, seed: int = 0):
+        """
+        パラメータ:
+        latency (float): 1回の呼び出しの平均応答時間（秒）
+        jitter (float): 応答時間のばらつき（秒）。latency ± jitter の範囲で変動する
+        error_rate (float): 500 エラーを返す割合（0〜1）
+        rate_limit_rate (float): 429 エラー（レート制限）を返す割合（0〜1）
+        seed (int): 疑似乱数のシード
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def apply(self, kind: str, request_key: str):
+        """応答時間分待ち、設定した割合でエラーを発生させる"""
+        with self._lock:
+            attempt = self._attempts.get((kind, request_key), 0)
+            self._attempts[(kind, request_key)] = attempt + 1
+            self.calls += 1
+        delay = self.latency + (2 * _unit(self.seed, kind, request_key, attempt, "latency") - 1) * self.jitter
+        if delay > 0:
+            time.sleep(delay)
+        draw = _unit(self.seed, kind, request_key, attempt, "error")
+        if draw < self.rate_limit_rate:
+            with self._lock:
+                self.rate_limited += 1
+            raise FakeAPIError(f"{kind}: rate limited (fake)", 429, retry_after_seconds=0.0)
+        if draw < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise FakeAPIError(f"{kind}: internal error (fake)", 500)
+
+
+def load_search_pool(paths=None):
+    """記録済みの検索結果から、URL の重複を除いた {url, raw_content} のリストを作る"""
+    pool = {}
+    for path in paths or SEARCH_RECORDINGS:
+        with open(path, encoding="utf-8") as f:
+            for item in json.load(f).get("results", []):
+                if item.get("url") and item.get("raw_content"):
+                    pool.setdefault(item["url"], item["raw_content"])
+    return [{"url": url, "raw_content": content} for url, content in pool.items()]
+
+
+def load_extraction_pool(paths=None):
+    """記録済みの抽出結果（URL を除いたもの）のリストを作る"""
+    pool = []
+    for path in paths or EXTRACTION_RECORDINGS:
+        with open(path, encoding="utf-8") as f:
+            for row in json.load(f):
+                for detail in row.get("extracted_results", []):
+                    detail = {key: value for key, value in detail.items() if key not in ("url", "error")}
+                    if detail.get("name"):
+                        pool.append(detail)
+    return pool or [FALLBACK_EXTRACTION]
+
+
+class FakeTavilyClient:
+    """
+    TavilyClient の代わりに記録済みの検索結果を返すクライアント（search / extract）
+    クエリごとに記録の中から決まった組み合わせの URL を返す
+    unique_pages が True の場合はクエリごとに別の URL・本文にする（キャッシュ・重複排除が効かない条件）
+    """
+
+    def __init__(self, faults: FaultProfile = None, pool=None, unique_pages: bool = False):
+        self.faults = faults or FaultProfile()
+        self.pool = pool if pool is not None else load_search_pool()
+        self.unique_pages = unique_pages
+
+    def search(self, query, max_results=5, **kwargs):
+        self.faults.apply("search", query)
+        offset = int(_unit(self.faults.seed, "offset", query) * len(self.pool))
+        count = min(max_results, len(self.pool))
+        results = []
+        for i in range(count):
+            item = self.pool[(offset + i) % len(self.pool)]
+            if self.unique_pages:
+                page_id = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+                item = {"url": f"{item['url']}?page={page_id}", "raw_content": f"{query}\n{item['raw_content']}"}
+            results.append({"url": item["url"], "title": "", "content": "", "raw_content": item["raw_content"]})
+        return {"query": query, "results": results}
+
+    def extract(self, urls, **kwargs):
+        self.faults.apply("extract", ",".join(urls))
+        contents = {item["url"]: item["raw_content"] for item in self.pool}
+        results = [{"url": url, "raw_content": contents[url]} for url in urls if url in contents]
+        failed = [{"url": url, "error": "not recorded"} for url in urls if url not in contents]
+        return {"results": results, "failed_results": failed}
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner._complete(**kwargs)
+
+
+class FakeOpenAI:
+    """
+    OpenAI クライアントの代わりに、記録済みの抽出結果を JSON で返すクライアント（chat.completions.create）
+    同じテキストには常に同じ結果を返す。まとめて抽出（items 形式）のリクエストにも対応する
+    """
+
+    def __init__(self, faults: FaultProfile = None, pool=None):
+        self.faults = faults or FaultProfile()
+        self.pool = pool if pool is not None else load_extraction_pool()
+        self.chat = types.SimpleNamespace(completions=_FakeCompletions(self))
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def _pick(self, text):
+        return dict(self.pool[int(_unit(self.faults.seed, "extraction", text) * len(self.pool))])
+
+    def _complete(self, messages, **kwargs):
+        system_message, prompt = messages[0]["content"], messages[-1]["content"]
+        self.faults.apply("chat", hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        texts = re.split(r"\n### テキスト \d+\n", prompt)[1:]
+        if '{"items"' in system_message and texts:
+            content = {"items": [dict(self._pick(text), index=i) for i, text in enumerate(texts)]}
+        else:
+            # 一部の項目だけのスキーマで問い合わせた場合は、その項目だけを返す
+            schema = json.loads(system_message[system_message.index("{"):])
+            content = {field: value for field, value in self._pick(prompt).items() if field in schema["required"]}
+        content = json.dumps(content, ensure_ascii=False)
+        usage = types.SimpleNamespace(prompt_tokens=estimate_tokens(system_message) + estimate_tokens(prompt),
+                                      completion_tokens=estimate_tokens(content))
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
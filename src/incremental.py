@@ -0,0 +1,156 @@
+import json
+import time
+from pathlib import Path
+
+DEFAULT_MAX_AGE_HOURS = 24  # この時間より前に取得した行の結果は再検索する
+
+
+class PreviousRun:
+    """
+    前回の実行のジャーナルを読み込み、行の入力（検索キーワード）のハッシュから前回の結果を引けるようにする
+    行が挿入・削除されて行番号がずれても、入力が同じ行の結果を再利用できる
+    結果はファイル上の位置だけを保持し、必要になった時に1件ずつ読み出す
+    """
+
+    def __init__(self, path):
+        """
+        パラメータ:
+        path (str | Path): 前回の実行のジャーナルファイル（存在しない場合は前回の結果なしとして扱う）
+        """
+        self.path = Path(path)
+        self._entries = {}        # input_hash -> (ファイル上の位置, 取得時刻, 行レベルのエラーがあったか)
+        self._row_hashes = {}     # 前回の行番号 -> input_hash
+        self._file = None
+        if self.path.exists():
+            self._load_index()
+
+    def _load_index(self):
+        with open(self.path, "rb") as f:
+            offset = 0
+            for raw_line in f:
+                try:
+                    entry = json.loads(raw_line)
+                except ValueError:
+                    break  # 中断で途中までしか書かれていない末尾行
+                input_hash = entry["input_hash"]
+                has_error = bool((entry.get("result") or {}).get("row_error"))
+                # 取得時刻のない古い形式のジャーナルは、期限切れとして扱う
+                self._entries[input_hash] = (offset, entry.get("completed_at", 0), has_error)
+                self._row_hashes[entry["row_index"]] = input_hash
+                offset += len(raw_line)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, input_hash):
+        return input_hash in self._entries
+
+    def input_hashes(self):
+        return self._entries.keys()
+
+    def hash_at(self, row_index):
+        """前回の実行で row_index 行目だった行の入力のハッシュ（なければ None）"""
+        return self._row_hashes.get(row_index)
+
+    def completed_at(self, input_hash):
+        entry = self._entries.get(input_hash)
+        return None if entry is None else entry[1]
+
+    def is_fresh(self, input_hash, max_age_seconds: float, now: float = None) -> bool:
+        """前回の結果が max_age_seconds 以内に取得したもので、行レベルのエラーがなければ True"""
+        entry = self._entries.get(input_hash)
+        if entry is None or entry[2]:
+            return False
+        return (now if now is not None else time.time()) - entry[1] <= max_age_seconds
+
+    def read(self, input_hash) -> dict:
+        """前回の結果を読み出す（なければ None）"""
+        entry = self._entries.get(input_hash)
+        if entry is None:
+            return None
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        self._file.seek(entry[0])
+        return json.loads(self._file.readline())["result"]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _listings_by_url(result):
+    return {item.get("url"): item for item in (result or {}).get("extracted_results") or [] if item.get("url")}
+
+
+def diff_listings(old_result, new_result) -> dict:
+    """
+    同じ行の前回と今回の結果を URL ごとに比較する
+    戻り値:
+    dict: {"added": 今回だけある商品, "removed": 前回だけある商品, "price_changed": 価格が変わった商品}
+          （商品は {"url", "name", "price"}、価格の変更は {"url", "name", "old_price", "new_price"}）
+    """
+    old_items = _listings_by_url(old_result)
+    new_items = _listings_by_url(new_result)
+
+    def summary(item):
+        return {"url": item.get("url"), "name": item.get("name"), "price": item.get("price")}
+
+    return {
+        "added": [summary(item) for url, item in new_items.items() if url not in old_items],
+        "removed": [summary(item) for url, item in old_items.items() if url not in new_items],
+        "price_changed": [
+            {"url": url, "name": item.get("name"), "old_price": old_items[url].get("price"), "new_price": item.get("price")}
+            for url, item in new_items.items()
+            if url in old_items and old_items[url].get("price") != item.get("price")
+        ],
+    }
+
+
+class RunDiff:
+    """差分更新で再処理した行について、前回からの掲載・価格の変化を集計する"""
+
+    STATUSES = ("new", "edited", "stale")  # 新しい行 / 入力が変わった行 / 期限切れで再検索した行
+
+    def __init__(self):
+        self.reused_rows = 0
+        self.status_counts = {status: 0 for status in self.STATUSES}
+        self.rows = []           # 変化のあった行
+        self.removed_rows = []   # 前回はあったが今回の入力にない行の検索キーワード
+
+    def reuse(self):
+        self.reused_rows += 1
+
+    def record(self, row_index, status: str, old_result, new_result):
+        """再処理した行の変化を記録する（old_result は前回の同じ行の結果。新しい行は None）"""
+        self.status_counts[status] += 1
+        changes = diff_listings(old_result, new_result)
+        if status == "stale" and not any(changes.values()):
+            return
+        self.rows.append({"row_index": row_index, "input_keywords": new_result.get("input_keywords"),
+                          "status": status, **changes})
+
+    def record_removed(self, previous: PreviousRun, seen_hashes):
+        """今回の入力にない前回の行を記録する"""
+        for input_hash in previous.input_hashes():
+            if input_hash not in seen_hashes:
+                self.removed_rows.append(previous.read(input_hash).get("input_keywords"))
+
+    def summary(self) -> dict:
+        return {
+            "reused_rows": self.reused_rows,
+            "reprocessed_rows": sum(self.status_counts.values()),
+            **{f"{status}_rows": count for status, count in self.status_counts.items()},
+            "removed_rows": len(self.removed_rows),
+            "added_listings": sum(len(row["added"]) for row in self.rows),
+            "removed_listings": sum(len(row["removed"]) for row in self.rows),
+            "price_changes": sum(len(row["price_changed"]) for row in self.rows),
+        }
+
+    def write(self, path):
+        """差分を JSON ファイルに保存する"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "rows": self.rows, "removed_rows": self.removed_rows},
+                      f, ensure_ascii=False, indent=2)
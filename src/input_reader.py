@@ -0,0 +1,129 @@
+import csv
+from pathlib import Path
+
+from pipeline import KEYWORD_COLUMNS
+
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+CSV_SUFFIXES = (".csv",)
+PARQUET_SUFFIXES = (".parquet", ".pq")
+INPUT_SUFFIXES = EXCEL_SUFFIXES + CSV_SUFFIXES + PARQUET_SUFFIXES
+PARQUET_BATCH_ROWS = 10000  # Parquet を読み込む単位（行数）
+
+
+def _is_blank(record: dict) -> bool:
+    return all(value is None for value in record.values())
+
+
+def _skip_trailing_blank_rows(records):
+    """
+    空行を、後ろに空でない行が続く場合だけ返す（pandas.read_excel と同様に末尾の空行を読み込まない）
+    途中の空行は行番号を保つため、全ての値が None の行として返す
+    """
+    blank_rows = 0
+    for record in records:
+        if _is_blank(record):
+            blank_rows += 1
+            continue
+        for _ in range(blank_rows):
+            yield {column: None for column in record}
+        blank_rows = 0
+        yield record
+
+
+def _iter_excel(path: Path, columns):
+    from openpyxl import load_workbook  # Excel を読み込む場合だけ読み込む
+
+    # read_only モードはシートを先頭から1行ずつ解析するため、ファイル全体を展開しない
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = {str(name).strip(): i for i, name in enumerate(header) if name is not None}
+        selected = [(column, positions[column]) for column in columns if column in positions]
+        for values in rows:
+            yield {column: (values[i] if i < len(values) else None) for column, i in selected}
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path: Path, columns):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        positions = {name.strip(): i for i, name in enumerate(header)}
+        selected = [(column, positions[column]) for column in columns if column in positions]
+        for values in reader:
+            yield {column: (values[i] if i < len(values) and values[i] != "" else None) for column, i in selected}
+
+
+def _iter_parquet(path: Path, columns):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet ファイルの読み込みには pyarrow が必要です (uv sync --extra parquet)") from e
+
+    parquet_file = pq.ParquetFile(path)
+    selected = [column for column in columns if column in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=selected):
+        yield from batch.to_pylist()
+
+
+def iter_input_rows(path, columns=KEYWORD_COLUMNS, limit: int = None):
+    """
+    入力ファイルを先頭から順に読み込み、(行番号, 行データ) を返すジェネレータ
+    検索に使う列だけを読み込み、ファイル全体を読み終える前に先頭の行から処理を始められる
+    パラメータ:
+    path (str | Path): 入力ファイル（.xlsx / .csv / .parquet。Parquet は pyarrow が必要）
+    columns (List[str]): 読み込む列（ファイルにない列は読み込まない）
+    limit (int): 読み込む最大行数（None の場合は全行）
+    戻り値:
+    Iterator[(int, dict)]: 0始まりの行番号（見出し行を除く）と、列名 -> 値（空欄は None）の辞書
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(path)
+    suffix = path.suffix.lower()
+    if suffix in EXCEL_SUFFIXES:
+        records = _iter_excel(path, columns)
+    elif suffix in CSV_SUFFIXES:
+        records = _iter_csv(path, columns)
+    elif suffix in PARQUET_SUFFIXES:
+        records = _iter_parquet(path, columns)
+    else:
+        raise ValueError(f"対応していない入力ファイルの形式です: {path.name} (対応形式: {', '.join(INPUT_SUFFIXES)})")
+
+    for index, record in enumerate(_skip_trailing_blank_rows(records)):
+        if limit is not None and index >= limit:
+            break
+        yield index, record
+
+
+def count_input_rows(path, limit: int = None):
+    """
+    進捗表示用に入力ファイルの行数（見出し行を除く）を返す。ファイル全体を解析せずに求められない場合は None
+    Excel はシートに記録された範囲、Parquet はメタデータの行数を使う
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    count = None
+    if suffix in EXCEL_SUFFIXES:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        count = max(0, max_row - 1) if max_row else None
+    elif suffix in CSV_SUFFIXES:
+        with open(path, "rb") as f:
+            count = max(0, sum(1 for _ in f) - 1)
+    elif suffix in PARQUET_SUFFIXES:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            return None
+        count = pq.ParquetFile(path).metadata.num_rows
+    if count is not None and limit is not None:
+        count = min(count, limit)
+    return count
@@ -0,0 +1,107 @@
+import itertools
+import threading
+import time
+
+DEFAULT_MAX_CONCURRENT_JOBS = 2  # 同時に実行するジョブ数
+JOB_HISTORY_SIZE = 20            # 一覧に残す終了済みジョブの件数
+
+
+class Job:
+    """スケジューラに登録された1件のジョブ（Excelファイル1つ分の処理）"""
+
+    def __init__(self, job_id: int, name: str, total_rows: int):
+        self.job_id = job_id
+        self.name = name
+        self.total_rows = total_rows
+        self.done_rows = 0
+        self.status = "待機中"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+
+class JobScheduler:
+    """
+    複数のセッションから投入されたジョブを、同時実行数を制限して受付順に実行するスケジューラ
+    待機中・実行中のジョブは snapshot() で一覧できる
+    API の呼び出し回数はプロセス全体で共有するレート制限（rate_limiter）で別途制御される
+    """
+
+    def __init__(self, max_concurrent_jobs: int = DEFAULT_MAX_CONCURRENT_JOBS):
+        """
+        パラメータ:
+        max_concurrent_jobs (int): 同時に実行するジョブ数
+        """
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self._ids = itertools.count(1)
+        self._queue = []      # 待機中のジョブ（受付順）
+        self._running = []    # 実行中のジョブ
+        self._finished = []   # 終了済みのジョブ（新しい順に JOB_HISTORY_SIZE 件まで）
+        self._condition = threading.Condition()
+
+    def submit(self, name: str, total_rows: int) -> Job:
+        """ジョブを受け付けて待機列に並べる"""
+        with self._condition:
+            job = Job(next(self._ids), name, total_rows)
+            self._queue.append(job)
+            return job
+
+    def position(self, job: Job) -> int:
+        """待機列での順番（1始まり）。実行中・終了済みの場合は 0"""
+        with self._condition:
+            return self._queue.index(job) + 1 if job in self._queue else 0
+
+    def wait_turn(self, job: Job, timeout: float = None) -> bool:
+        """
+        ジョブの実行順が来るまで待つ
+        パラメータ:
+        job (Job): submit で受け付けたジョブ
+        timeout (float): 最大待ち時間（秒）。None の場合は実行順が来るまで待つ
+        戻り値:
+        bool: 実行を開始した場合は True、timeout までに順番が来なかった場合は False
+        """
+        with self._condition:
+            started = self._condition.wait_for(
+                lambda: self._queue[0] is job and len(self._running) < self.max_concurrent_jobs, timeout
+            )
+            if not started:
+                return False
+            self._queue.pop(0)
+            self._running.append(job)
+            job.status = "実行中"
+            job.started_at = time.time()
+            self._condition.notify_all()
+            return True
+
+    def update(self, job: Job, done_rows: int):
+        """ジョブの進捗（完了した行数）を更新する"""
+        with self._condition:
+            job.done_rows = done_rows
+
+    def finish(self, job: Job, status: str = "完了"):
+        """ジョブを終了し、次の待機中ジョブに実行枠を渡す（待機中のまま中断された場合は待機列から外す）"""
+        with self._condition:
+            if job in self._running:
+                self._running.remove(job)
+            elif job in self._queue:
+                self._queue.remove(job)
+            job.status = status
+            job.finished_at = time.time()
+            self._finished.insert(0, job)
+            del self._finished[JOB_HISTORY_SIZE:]
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """実行中・待機中・最近終了したジョブの一覧を返す"""
+        with self._condition:
+            jobs = self._running + self._queue + self._finished
+            return [
+                {
+                    "ID": job.job_id,
+                    "ファイル": job.name,
+                    "状態": job.status,
+                    "順番": self._queue.index(job) + 1 if job in self._queue else "",
+                    "進捗": f"{job.done_rows}/{job.total_rows}",
+                }
+                for job in jobs
+            ]
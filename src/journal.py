@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_FSYNC_EVERY = 20        # この件数を追記するごとに fsync する
+DEFAULT_FSYNC_INTERVAL = 5.0    # 前回の fsync からこの秒数が経過したら fsync する
+
+
+def row_input_hash(input_keywords: str) -> str:
+    """行の入力（検索キーワード）のハッシュ。入力が変わった行を再処理するために使う"""
+    return hashlib.sha256(input_keywords.encode("utf-8")).hexdigest()[:16]
+
+
+class RowJournal:
+    """
+    完了した行の結果を1行1件の JSONL として追記するジャーナル
+    追記のたびに flush し、fsync は一定件数・一定時間ごとにまとめて行う
+    行の結果はファイル上の位置だけを保持し、最終出力時に1件ずつ読み直すため、メモリ使用量は行数に依存しない
+    """
+
+    def __init__(self, path, resume: bool = False, fsync_every: int = DEFAULT_FSYNC_EVERY,
+                 fsync_interval: float = DEFAULT_FSYNC_INTERVAL):
+        """
+        パラメータ:
+        path (str | Path): ジャーナルファイルのパス
+        resume (bool): True の場合は既存のジャーナルを読み込んで続きから追記する。False の場合は空にして開始
+        fsync_every (int): fsync する間隔（件数）
+        fsync_interval (float): fsync する間隔（秒）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._entries = {}  # row_index -> (ファイル上の位置, input_hash)
+        self._lock = threading.Lock()
+
+        if resume and self.path.exists():
+            self._load_index()
+        else:
+            self.path.write_bytes(b"")
+        self._file = open(self.path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _load_index(self):
+        """既存のジャーナルを走査して位置の索引を作る（中断で途中までしか書かれていない末尾行は切り捨てる）"""
+        valid_end = 0
+        with open(self.path, "rb") as f:
+            offset = 0
+            for raw_line in f:
+                try:
+                    entry = json.loads(raw_line)
+                    if not raw_line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                except ValueError:
+                    break
+                self._entries[entry["row_index"]] = (offset, entry["input_hash"])
+                offset += len(raw_line)
+                valid_end = offset
+        if valid_end < self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def is_completed(self, row_index, input_hash: str) -> bool:
+        """同じ入力の行が既に完了しているかどうか"""
+        entry = self._entries.get(row_index)
+        return entry is not None and entry[1] == input_hash
+
+    def completed_count(self) -> int:
+        return len(self._entries)
+
+    def append(self, row_index, input_hash: str, result: dict, completed_at: float = None):
+        """
+        行の結果を追記する
+        completed_at は結果を取得した時刻（UNIX時間）。None の場合は現在時刻（前回の結果を引き継ぐ場合は元の時刻を渡す）
+        """
+        if completed_at is None:
+            completed_at = time.time()
+        line = json.dumps({"row_index": row_index, "input_hash": input_hash, "completed_at": completed_at,
+                           "result": result}, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._entries[row_index] = (offset, input_hash)
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def iter_results(self, row_indexes):
+        """指定した行の結果を、指定した順序で1件ずつ読み出す（ジャーナルにない行は飛ばす）"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+        with open(self.path, "rb") as f:
+            for row_index in row_indexes:
+                entry = self._entries.get(row_index)
+                if entry is None:
+                    continue
+                f.seek(entry[0])
+                yield json.loads(f.readline())["result"]
+
+    def read(self, row_index) -> dict:
+        """指定した行の結果を読み出す"""
+        return next(self.iter_results([row_index]))
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
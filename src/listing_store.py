@@ -0,0 +1,253 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+from result_writer import iter_jsonl
+
+BASE_DIR = Path(__file__).parent.parent  # プロジェクトのルートディレクトリ
+DEFAULT_STORE_PATH = BASE_DIR / "data" / "listings.sqlite3"
+INSERT_BATCH_ROWS = 500  # 1トランザクションでまとめて書き込む行数（Excel の行単位）
+DEFAULT_QUERY_LIMIT = 100
+
+# 商品ごとの列（extracted_results の項目 -> 列名）
+LISTING_COLUMNS = (
+    "url", "name", "model_number", "dial_color", "bracelet_type", "price", "seller", "warranty_date",
+    "has_warranty_card", "has_box", "other_accessories", "condition", "error",
+)
+
+
+def normalize_model_number(model_number):
+    """型番を検索用に正規化する（全角/半角・大文字/小文字・空白の揺れを吸収）。空の場合は None"""
+    if model_number is None:
+        return None
+    normalized = "".join(unicodedata.normalize("NFKC", str(model_number)).upper().split())
+    return normalized or None
+
+
+def _as_int(value):
+    """価格を整数にする（"4,428,000" のような文字列も受け付け、変換できない場合は None）"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = "".join(ch for ch in str(value) if ch.isdigit())
+    return int(digits) if digits else None
+
+
+def _as_flag(value):
+    return None if value is None else int(bool(value))
+
+
+def listing_record(item: dict) -> tuple:
+    """抽出結果1件を LISTING_COLUMNS の順の値に変換する"""
+    accessories = item.get("accessories") or {}
+    return (
+        item.get("url"), item.get("name"), normalize_model_number(item.get("model_number")),
+        item.get("dial_color"), item.get("bracelet_type"), _as_int(item.get("price")), item.get("seller"),
+        item.get("warranty_date"), _as_flag(accessories.get("has_warranty_card")), _as_flag(accessories.get("has_box")),
+        accessories.get("other_description"), item.get("condition"), item.get("error"),
+    )
+
+
+class ListingStore:
+    """
+    抽出した商品（掲載・価格）を実行ごとに蓄積する SQLite のストア
+    型番・URL・価格・実行時刻に索引を付け、過去の実行をまたいだ検索を JSON ファイルを読み直さずに行う
+    複数スレッドから共有して利用できる
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+        パラメータ:
+        path (str | Path): SQLite ファイルのパス（親ディレクトリがなければ作成）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "run_id INTEGER PRIMARY KEY AUTOINCREMENT, run_at REAL NOT NULL, source TEXT, row_count INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            "run_id INTEGER NOT NULL REFERENCES runs (run_id), run_at REAL NOT NULL, row_index INTEGER, input_keywords TEXT, "
+            + ", ".join(f"{column} {'INTEGER' if column in ('price', 'has_warranty_card', 'has_box') else 'TEXT'}"
+                        for column in LISTING_COLUMNS)
+            + ")"
+        )
+        for column in ("model_number", "url", "price", "run_at"):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_listings_{column} ON listings ({column})")
+        self._conn.commit()
+
+    def add_run(self, rows, source: str = None, run_at: float = None) -> dict:
+        """
+        1回の実行の結果（CLI の出力と同じ行データ）を保存する
+        INSERT_BATCH_ROWS 行ごとに1トランザクションでまとめて書き込むため、行数が多くてもメモリを一定に保つ
+        パラメータ:
+        rows (Iterable[dict]): {"input_keywords", "extracted_results", ...} の行データ（入力順）
+        source (str): 結果の出力先など、実行を識別する説明
+        run_at (float): 実行時刻（UNIX時間）。None の場合は現在時刻
+        戻り値:
+        dict: {"run_id", "rows", "listings"}
+        """
+        run_at = time.time() if run_at is None else run_at
+        placeholders = ", ".join("?" * (4 + len(LISTING_COLUMNS)))
+        insert = f"INSERT INTO listings (run_id, run_at, row_index, input_keywords, {', '.join(LISTING_COLUMNS)}) VALUES ({placeholders})"
+        with self._lock:
+            run_id = self._conn.execute("INSERT INTO runs (run_at, source) VALUES (?, ?)", (run_at, source)).lastrowid
+            row_count = listing_count = 0
+            pending = []
+            for row_index, row in enumerate(rows):
+                row_count += 1
+                for item in row.get("extracted_results") or []:
+                    pending.append((run_id, run_at, row_index, row.get("input_keywords")) + listing_record(item))
+                if row_count % INSERT_BATCH_ROWS == 0:
+                    self._conn.executemany(insert, pending)
+                    self._conn.commit()
+                    listing_count += len(pending)
+                    pending = []
+            self._conn.executemany(insert, pending)
+            listing_count += len(pending)
+            self._conn.execute("UPDATE runs SET row_count = ? WHERE run_id = ?", (row_count, run_id))
+            self._conn.commit()
+        return {"run_id": run_id, "rows": row_count, "listings": listing_count}
+
+    def query(self, model_number=None, url=None, min_price=None, max_price=None, has_box=None,
+              has_warranty_card=None, since=None, latest_run_only=False, limit=DEFAULT_QUERY_LIMIT):
+        """
+        条件に合う商品を新しい実行から順に返す（None の条件は使わない）
+        パラメータ:
+        model_number (str): 型番（正規化して完全一致）
+        url (str): 商品ページの URL
+        min_price / max_price (int): 価格の範囲（両端を含む）
+        has_box / has_warranty_card (bool): 箱・保証書の有無
+        since (float): この時刻（UNIX時間）以降の実行だけを対象にする
+        latest_run_only (bool): True の場合は最新の実行だけを対象にする
+        limit (int): 最大件数（None の場合は無制限）
+        戻り値:
+        List[dict]: 商品ごとの辞書（LISTING_COLUMNS と run_id・run_at・row_index・input_keywords）
+        """
+        conditions, params = [], []
+        for column, value in (("model_number", normalize_model_number(model_number)), ("url", url),
+                              ("has_box", _as_flag(has_box)), ("has_warranty_card", _as_flag(has_warranty_card))):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if min_price is not None:
+            conditions.append("price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("price <= ?")
+            params.append(max_price)
+        if since is not None:
+            conditions.append("run_at >= ?")
+            params.append(since)
+        if latest_run_only:
+            conditions.append("run_id = (SELECT run_id FROM runs ORDER BY run_at DESC, run_id DESC LIMIT 1)")
+        sql = "SELECT * FROM listings"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY run_at DESC, row_index, price"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def price_history(self, url: str):
+        """URL ごとの価格の推移を古い順に返す: [(実行時刻, 価格), ...]"""
+        with self._lock:
+            return [(row["run_at"], row["price"]) for row in self._conn.execute(
+                "SELECT run_at, price FROM listings WHERE url = ? ORDER BY run_at", (url,))]
+
+    def runs(self):
+        """保存済みの実行を新しい順に返す"""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM runs ORDER BY run_at DESC, run_id DESC")]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def iter_result_file(path):
+    """CLI の出力ファイル（.json / .jsonl / .jsonl.gz）の行データを1件ずつ読み出す"""
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        yield from iter_jsonl(path)
+
+
+def format_listing(listing: dict) -> str:
+    price = "-" if listing["price"] is None else f"¥{listing['price']:,}"
+    accessories = f"箱{'あり' if listing['has_box'] else 'なし'}/保証書{'あり' if listing['has_warranty_card'] else 'なし'}"
+    run_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(listing["run_at"]))
+    return f"{run_at}  {listing['model_number'] or '-'}  {price:>12}  {accessories}  {listing['seller'] or '-'}  {listing['url']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抽出した商品（掲載・価格）を蓄積する SQLite ストアへの取り込みと検索を行うスクリプト')
+    parser.add_argument('--store', default=str(DEFAULT_STORE_PATH), help=f'ストアのファイル (デフォルト: {DEFAULT_STORE_PATH})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='既存の出力ファイル (result.json / .jsonl) を1回の実行として取り込む')
+    import_parser.add_argument('paths', nargs='+', help='取り込む出力ファイル')
+
+    query_parser = subparsers.add_parser('query', help='条件に合う商品を新しい実行から順に表示する')
+    query_parser.add_argument('--model', default=None, help='型番 (例: 126500LN)')
+    query_parser.add_argument('--url', default=None, help='商品ページの URL')
+    query_parser.add_argument('--min-price', type=int, default=None, help='価格の下限 (円)')
+    query_parser.add_argument('--max-price', type=int, default=None, help='価格の上限 (円)')
+    query_parser.add_argument('--with-box', action='store_true', help='箱ありの商品だけ')
+    query_parser.add_argument('--with-papers', action='store_true', help='保証書ありの商品だけ')
+    query_parser.add_argument('--days', type=float, default=None, help='直近この日数の実行だけを対象にする')
+    query_parser.add_argument('--latest', action='store_true', help='最新の実行だけを対象にする')
+    query_parser.add_argument('--limit', type=int, default=DEFAULT_QUERY_LIMIT, help=f'最大件数 (デフォルト: {DEFAULT_QUERY_LIMIT})')
+    query_parser.add_argument('--json', action='store_true', help='JSON で出力する')
+
+    history_parser = subparsers.add_parser('history', help='URL の価格の推移を表示する')
+    history_parser.add_argument('url', help='商品ページの URL')
+
+    subparsers.add_parser('runs', help='保存済みの実行を表示する')
+    args = parser.parse_args()
+
+    store = ListingStore(args.store)
+    try:
+        if args.command == 'import':
+            for path in args.paths:
+                summary = store.add_run(iter_result_file(path), source=str(path), run_at=Path(path).stat().st_mtime)
+                print(f"'{path}': {summary['rows']} 行 / 商品 {summary['listings']} 件を取り込みました (run_id={summary['run_id']})")
+        elif args.command == 'query':
+            listings = store.query(model_number=args.model, url=args.url, min_price=args.min_price, max_price=args.max_price,
+                                   has_box=True if args.with_box else None,
+                                   has_warranty_card=True if args.with_papers else None,
+                                   since=time.time() - args.days * 86400 if args.days is not None else None,
+                                   latest_run_only=args.latest, limit=args.limit)
+            if args.json:
+                print(json.dumps(listings, ensure_ascii=False, indent=2))
+            else:
+                for listing in listings:
+                    print(format_listing(listing))
+                print(f"{len(listings)} 件")
+        elif args.command == 'history':
+            for run_at, price in store.price_history(args.url):
+                print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(run_at))}  {'-' if price is None else f'¥{price:,}'}")
+        else:
+            for run in store.runs():
+                print(f"{run['run_id']:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(run['run_at']))}  "
+                      f"{run['row_count'] or 0} 行  {run['source'] or ''}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
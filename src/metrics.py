@@ -0,0 +1,208 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# 処理時間ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_PREFIX = "rolex_search"  # Prometheus 形式で出力する際のメトリクス名の接頭辞
+
+
+class Histogram:
+    """処理時間の分布（バケットごとの件数・合計・最大値・エラー件数）を記録するヒストグラム"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # 最後は上限なし（+Inf）
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """バケット内を線形補間して q 分位点（0〜1）を推定する"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - cumulative) / bucket_count)
+            cumulative += bucket_count
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50_seconds": round(self.quantile(0.5), 6),
+            "p95_seconds": round(self.quantile(0.95), 6),
+            "max_seconds": round(self.max, 6),
+            "buckets": {str(upper): count for upper, count in zip(self.buckets + ("+Inf",), self.bucket_counts)},
+        }
+
+
+class Metrics:
+    """
+    処理段階ごとの処理時間（span）と、再試行回数・トークン使用量などのカウンタを集計するクラス
+    複数スレッドから同時に記録できる。実行終了時に JSON ファイル・rich の集計表・Prometheus 形式で出力する
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """記録をすべて消去する"""
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+            self.started_at = time.time()
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        """name の処理時間を1件記録する"""
+        with self._lock:
+            histogram = self.spans.get(name)
+            if histogram is None:
+                histogram = self.spans[name] = Histogram()
+            histogram.observe(seconds, error)
+
+    def increment(self, name: str, amount: int = 1):
+        """カウンタ name に amount を加算する"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def span(self, name: str):
+        """with ブロックの処理時間を name として記録する（例外で抜けた場合はエラーとして数える）"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, error)
+
+    def record_usage(self, prefix: str, usage):
+        """API 応答の usage（prompt_tokens / completion_tokens）をカウンタ <prefix>_*_tokens に加算する"""
+        if usage is None:
+            return
+        for field in ("prompt_tokens", "completion_tokens"):
+            value = getattr(usage, field, None)
+            if isinstance(value, int):
+                self.increment(f"{prefix}_{field}", value)
+
+    def snapshot(self) -> dict:
+        """記録内容を JSON に変換できる辞書で返す"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed_seconds": round(time.time() - self.started_at, 3),
+                "spans": {name: histogram.to_dict() for name, histogram in sorted(self.spans.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write_json(self, path):
+        """記録内容を JSON ファイルに保存する"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+    def summary_table(self):
+        """処理段階ごとの集計表（rich の Table）を作る"""
+        from rich.table import Table
+
+        snapshot = self.snapshot()
+        table = Table(title=f"処理時間の内訳 (経過 {snapshot['elapsed_seconds']:.1f} 秒)")
+        for column in ("処理", "回数", "エラー", "合計(秒)", "平均(秒)", "p50(秒)", "p95(秒)", "最大(秒)"):
+            table.add_column(column, justify="left" if column == "処理" else "right")
+        for name, span in snapshot["spans"].items():
+            table.add_row(
+                name, str(span["count"]), str(span["errors"]), f"{span['total_seconds']:.2f}",
+                f"{span['mean_seconds']:.3f}", f"{span['p50_seconds']:.3f}", f"{span['p95_seconds']:.3f}",
+                f"{span['max_seconds']:.3f}",
+            )
+        if snapshot["counters"]:
+            table.add_section()
+            for name, value in snapshot["counters"].items():
+                table.add_row(name, f"{value:,}", "", "", "", "", "", "")
+        return table
+
+    def to_prometheus(self) -> str:
+        """記録内容を Prometheus のテキスト形式で返す（ヒストグラムは累積バケット）"""
+        lines = []
+        with self._lock:
+            for name, histogram in sorted(self.spans.items()):
+                metric = f"{PROMETHEUS_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for upper, count in zip(histogram.buckets + ("+Inf",), histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{upper}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram.total}")
+                lines.append(f"{metric}_count {histogram.count}")
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_errors_total counter")
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}_errors_total {histogram.errors}")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter")
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """プロセス全体で共有する Metrics を返す"""
+    return _metrics
+
+
+def start_prometheus_server(port: int, host: str = "0.0.0.0", metrics: Metrics = None) -> "ThreadingHTTPServer":
+    """
+    /metrics で Prometheus 形式のメトリクスを返す HTTP サーバーをバックグラウンドで起動する
+    パラメータ:
+    port (int): 待ち受けるポート番号（0 の場合は空いているポート）
+    host (str): 待ち受けるアドレス
+    metrics (Metrics): 公開する Metrics。None の場合はプロセス全体で共有するもの
+    戻り値:
+    ThreadingHTTPServer: 起動したサーバー（停止する場合は shutdown() を呼ぶ）
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # 公開する場合だけ読み込む
+
+    metrics = metrics or get_metrics()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # スクレイプごとのアクセスログは出さない
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
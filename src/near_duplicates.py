@@ -0,0 +1,118 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from rule_extractor import MIN_PRICE
+
+SHINGLE_CHARS = 5           # 文字 n-gram（シングル）の文字数
+FINGERPRINT_BITS = 64       # SimHash のビット数
+DEFAULT_MAX_DISTANCE = 3    # 同じ商品とみなす SimHash のハミング距離の上限
+DEFAULT_MAX_ENTRIES = 20000  # 保持するページの最大件数（超えた分は抽出済みの古い順に破棄する）
+PRICE_PATTERN = re.compile(r"\d{1,3}(?:,\d{3})+|\d{5,}(?=\s*円)")  # 桁区切りの数値・「円」の付いた数値
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+def simhash(text: str, shingle_chars: int = SHINGLE_CHARS) -> int:
+    """
+    ページテキストの SimHash（64ビット）を計算する
+    正規化したテキストの文字 n-gram の集合から作るため、ほぼ同じテキストはハミング距離の小さい値になる
+    """
+    import numpy as np  # 類似ページの検出を使う場合だけ読み込む
+
+    normalized = _normalize(text)
+    shingles = {normalized[i:i + shingle_chars] for i in range(max(1, len(normalized) - shingle_chars + 1))}
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=FINGERPRINT_BITS // 8).digest()
+                       for shingle in shingles)
+    # ビットごとに、1 のシングルが過半数なら 1 にする
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), -1), axis=1)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def price_signature(text: str) -> frozenset:
+    """テキストに含まれる価格（MIN_PRICE 以上の数値）の集合。価格が異なるページは同じ商品とみなさない"""
+    prices = (int(value.replace(",", "")) for value in PRICE_PATTERN.findall(_normalize(text)))
+    return frozenset(price for price in prices if price >= MIN_PRICE)
+
+
+class NearDuplicateIndex:
+    """
+    ほぼ同じ本文のページ（同じ商品を複数のショップ・URL で掲載したもの）をまとめるインデックス
+    最初に登録したページを代表として抽出し、後から見つかった類似ページは代表の抽出結果を再利用する
+    SimHash を max_distance + 1 個の帯に分け、帯の値ごとのバケットから候補を探すため（LSH）、
+    件数が増えても1件あたりの検索は候補の件数分だけで済む
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE, max_entries: int = DEFAULT_MAX_ENTRIES):
+        """
+        パラメータ:
+        max_distance (int): 同じ商品とみなす SimHash のハミング距離の上限
+        max_entries (int): 保持するページの最大件数（None の場合は無制限）
+        """
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        # ハミング距離が max_distance 以下なら、max_distance + 1 個の帯のどれかは必ず一致する
+        self.bands = max_distance + 1
+        self.band_bits = -(-FINGERPRINT_BITS // self.bands)
+        self._buckets = {}              # (帯の番号, 帯の値) -> 登録番号の集合
+        self._entries = OrderedDict()   # 登録番号 -> (SimHash, 価格の集合, Future)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.reused = 0                 # 類似ページの抽出結果を再利用した件数
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def claim(self, text: str, future: Future = None):
+        """
+        テキストに類似する登録済みページの Future を返す。なければ新しく登録する
+        パラメータ:
+        text (str): ページテキスト（LLM に渡すトリミング後のもの）
+        future (Future): 代表として登録する場合に使う Future（None の場合は新しく作る）
+        戻り値:
+        (Future, bool): bool が True の場合は呼び出し側が代表として抽出を行い、Future に結果を設定する
+        """
+        fingerprint = simhash(text)
+        prices = price_signature(text)
+        band_keys = self._band_keys(fingerprint)
+        with self._lock:
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(self._buckets.get(band_key, ()))
+            for entry_id in sorted(candidates):
+                entry_fingerprint, entry_prices, entry_future = self._entries[entry_id]
+                if entry_prices == prices and bin(entry_fingerprint ^ fingerprint).count("1") <= self.max_distance:
+                    self.reused += 1
+                    return entry_future, False
+
+            future = future or Future()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (fingerprint, prices, future)
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(entry_id)
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._evict_completed()
+            return future, True
+
+    def _evict_completed(self):
+        """抽出済みの古いページから破棄する（抽出中のものは類似ページが待っている可能性があるため残す）"""
+        for entry_id in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            fingerprint, _, future = self._entries[entry_id]
+            if not future.done():
+                continue
+            del self._entries[entry_id]
+            for band_key in self._band_keys(fingerprint):
+                bucket = self._buckets[band_key]
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
@@ -0,0 +1,508 @@
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from watch_info_extractor import failed_watch_info
+from rule_extractor import title_seller
+from metrics import get_metrics
+
+DEFAULT_MAX_RESULTS = 10                 # 検索結果の最大取得数
+MAX_IN_FLIGHT_ROWS_PER_WORKER = 2        # 並列モードでワーカー1つあたりに投入しておく行数
+KEYWORD_COLUMNS = ["ブランド", "型番", "文字盤色", "ブレス形状"]  # 検索キーワードに使う Excel の列
+KEYWORD_SUFFIX = "中古"
+
+
+def _is_missing(value) -> bool:
+    """Excel のセルが空欄（None・NaN）かどうか"""
+    if value is None or isinstance(value, str):
+        return value is None
+    import pandas as pd  # 行データ（pandas.Series）を扱う時点で読み込み済み
+    return bool(pd.isna(value))
+
+
+def build_initial_keywords(row) -> str:
+    """
+    Excel行データから検索キーワードを組み立てる
+    列がない・空欄（NaN）の項目は飛ばす
+    """
+    parts = []
+    for column in KEYWORD_COLUMNS:
+        value = row.get(column)
+        if _is_missing(value):
+            continue
+        value = str(value).strip()
+        if value:
+            parts.append(value)
+    parts.append(KEYWORD_SUFFIX)
+    return " ".join(parts)
+
+
+def row_model_number(row):
+    """Excel行データの型番を文字列で返す（列がない・空欄の場合は None。数値のセルは 124200 のように整数表記にする）"""
+    value = row.get("型番")
+    if _is_missing(value):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # 空欄を含む列は float で読み込まれるため "124200.0" にしない
+    return str(value).strip() or None
+
+
+def merge_extracted(rule_info: dict, llm_result: dict, fields) -> dict:
+    """
+    ルールで抽出した結果に、LLM に問い合わせた項目の値を上書きする
+    戻り値:
+    dict: マージした抽出結果。LLM の結果が空（抽出失敗）の場合は None
+    """
+    if not llm_result:
+        return None
+    merged = dict(rule_info)
+    for field in fields:
+        merged[field] = llm_result.get(field)
+    return merged
+
+
+def row_result(input_keywords: str, extracted_results: list, row_error: str = None) -> dict:
+    """
+    1行分の処理結果（CLI の出力 JSON と Gradio の表で共通の形式）
+    行レベルのエラー（検索の失敗など）があった場合だけ row_error を加え、出力 JSON の形式は従来どおりに保つ
+    """
+    result = {
+        "input_keywords": input_keywords,
+        "extracted_results": extracted_results,
+    }
+    if row_error is not None:
+        result["row_error"] = row_error
+    return result
+
+
+class UrlRegistry:
+    """
+    実行全体で URL ごとの抽出結果を共有するレジストリ
+    最初にその URL を見つけた行だけが抽出を行い、他の行は同じ結果（Future）を待って再利用する
+    """
+
+    def __init__(self, max_completed=None):
+        """
+        パラメータ:
+        max_completed (int): 保持する抽出済み結果の最大件数。超えた分は古い順に破棄する（None の場合は無制限）
+        """
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_completed = max_completed
+        self.reused = 0  # 他の行の抽出結果を再利用した件数
+        self.unique = 0  # 抽出を行ったユニークなURLの件数
+
+    def claim(self, url):
+        """
+        URL に対応する Future を返す
+        戻り値:
+        (Future, bool): bool が True の場合は呼び出し側が抽出を行い、Future に結果を設定する
+        """
+        with self._lock:
+            future = self._futures.get(url)
+            if future is not None:
+                self.reused += 1
+                return future, False
+            future = Future()
+            self._futures[url] = future
+            self.unique += 1
+            if self.max_completed is not None and len(self._futures) > self.max_completed:
+                self._evict_completed()
+            return future, True
+
+    def _evict_completed(self):
+        """抽出済みの古い結果から破棄する（抽出中のものは他の行が待っている可能性があるため残す）"""
+        for url in list(self._futures):
+            if len(self._futures) <= self.max_completed:
+                break
+            if self._futures[url].done():
+                del self._futures[url]
+
+    def unique_urls(self):
+        with self._lock:
+            return self.unique
+
+
+class WatchSearchPipeline:
+    """
+    Excel の1行から 検索 → 抽出 → 組み立て を行う処理エンジン
+    CLI (process_excel.py) と Gradio (app.py) の両方から使い、並列化・キャッシュ・重複排除・トリミング・
+    まとめて抽出などの最適化を共通に適用する
+    検索・抽出の各ステージは search_stage / extract_stage / extract_many_stage で差し替えられる
+    rule_extractor を渡した場合は、ルールで確定できなかった項目だけを LLM に問い合わせる
+    near_duplicates を渡した場合は、本文がほぼ同じページ（別ショップ・別URLの同じ商品）の抽出を1回にまとめる
+    query_planner を渡した場合は、同じブランド・型番の行の検索を1回にまとめ、抽出結果を文字盤色・ブレス形状で振り分ける
+    """
+
+    def __init__(self, tavily_client, watch_extractor, max_results: int = DEFAULT_MAX_RESULTS,
+                 advance_search: bool = True, workers: int = 1, content_trimmer=None, batch_size: int = 1,
+                 url_registry=None, log=print, search_stage=None, extract_stage=None, extract_many_stage=None,
+                 rule_extractor=None, near_duplicates=None, query_planner=None):
+        """
+        パラメータ:
+        tavily_client (tavily_processor): 検索クライアント
+        watch_extractor (WatchInfoExtractor): 情報抽出クライアント
+        max_results (int): 検索結果の最大取得数
+        advance_search (bool): 検索深度を深めるかどうか
+        workers (int): 並列処理のワーカー数。検索・抽出それぞれの同時実行数の上限（1の場合は逐次処理）
+        content_trimmer (ContentTrimmer): LLM に渡す前にページテキストをトリミングする。None の場合はそのまま渡す
+        batch_size (int): 1回のリクエストでまとめて抽出する件数（1の場合は1件ずつ）
+        url_registry (UrlRegistry): 実行全体で URL ごとの抽出を1回にまとめるレジストリ。None の場合は新規作成
+        log (Callable[[str], None]): 進捗メッセージの出力先
+        search_stage (Callable[[str], list]): 検索キーワードから検索結果（url/content の辞書のリスト）を返す関数。
+            query_planner を使う場合は max_results（最大取得数）も受け取る
+        extract_stage (Callable[[str], dict]): ページテキストから抽出結果を返す関数。
+            rule_extractor を使う場合は fields（問い合わせる項目名のリスト）も受け取る
+        extract_many_stage (Callable[[list], list]): 複数のページテキストをまとめて抽出する関数
+        rule_extractor (RuleExtractor): LLM の前にルールで抽出する。None の場合は全項目を LLM で抽出する
+        near_duplicates (NearDuplicateIndex): 類似ページを検出するインデックス。None の場合は URL の一致だけで重複排除する
+        query_planner (QueryPlanner): 行の検索をブランド・型番ごとにまとめる。plan() 済みのものを渡す。None の場合は行ごとに検索する
+        """
+        self.tavily_client = tavily_client
+        self.watch_extractor = watch_extractor
+        self.max_results = max_results
+        self.advance_search = advance_search
+        self.workers = max(1, workers)
+        self.content_trimmer = content_trimmer
+        self.batch_size = batch_size
+        self.url_registry = url_registry if url_registry is not None else UrlRegistry()
+        self.log = log
+        self.search_stage = search_stage or self._search
+        self.extract_stage = extract_stage or watch_extractor.extract_info
+        self.extract_many_stage = extract_many_stage or watch_extractor.extract_many
+        self.rule_extractor = rule_extractor
+        self.near_duplicates = near_duplicates
+        self.query_planner = query_planner
+
+    # --- ステージ ---
+    def _search(self, initial_keywords, max_results=None):
+        return self.tavily_client.search_item(initial_keywords, max_results=max_results or self.max_results,
+                                              advance_search=self.advance_search)
+
+    def _prepare_text(self, content, model_number):
+        """LLM に渡すページテキスト（content_trimmer があればトリミングする）"""
+        if self.content_trimmer is not None:
+            with get_metrics().span("trim"):
+                return self.content_trimmer.trim(content, model_number)
+        return content
+
+    def _item_text(self, item, model_number):
+        """検索結果1件の LLM に渡すテキスト（類似ページの検出でトリミング済みならそれを使う）"""
+        if "text" in item:
+            return item["text"]
+        return self._prepare_text(item["content"], model_number)
+
+    def _resolve_by_rules(self, item, model_number):
+        """
+        ルールで抽出する（トリミング前の本文を使う）
+        戻り値:
+        (dict, List[str]): (ルールの抽出結果, LLM に問い合わせる項目名のリスト)。rule_extractor がない場合は (None, None)
+        """
+        if self.rule_extractor is None:
+            return None, None
+        try:
+            rule_info, unresolved = self.rule_extractor.resolve(item["content"], model_number)
+        except Exception as e:
+            # ルールで抽出できない場合は全項目を LLM で抽出する
+            self.log(f"ルール抽出エラー（LLM で抽出します）: {repr(e)}")
+            return None, None
+        self.rule_extractor.record(unresolved)
+        return rule_info, unresolved
+
+    def _finish_watch_detail(self, watch_detail, product_url):
+        """抽出結果にURLを追加して表示する（結果が空の場合は失敗として記録）"""
+        if watch_detail:
+            # URLの追加
+            watch_detail["url"] = product_url
+
+            # 主要情報を表示
+            price_str = f"¥{watch_detail.get('price'):,}" if watch_detail.get('price') else "N/A"
+            self.log(f"      -> 抽出成功: {watch_detail.get('name', 'N/A')} ({watch_detail.get('model_number', 'N/A')}) / {price_str}")
+            return watch_detail
+
+        self.log("      -> 詳細抽出失敗")
+        # 詳細抽出失敗時も、URLは記録
+        return failed_watch_info(product_url, "詳細抽出失敗")
+
+    def extract_watch_detail(self, item, item_index, total_items, model_number=None):
+        """検索結果1件から時計情報を抽出する"""
+        product_url = item["url"]
+        self.log(f"    ({item_index+1}/{total_items}) URL: {product_url}")
+        try:
+            rule_info, unresolved = self._resolve_by_rules(item, model_number)
+            if rule_info is None:
+                watch_detail = self.extract_stage(self._item_text(item, model_number))
+            elif unresolved:
+                llm_result = self.extract_stage(self._item_text(item, model_number), fields=unresolved)
+                watch_detail = merge_extracted(rule_info, llm_result, unresolved)
+            else:
+                self.log("      -> ルールで抽出 (LLM なし)")
+                watch_detail = rule_info
+            return self._finish_watch_detail(watch_detail, product_url)
+        except Exception as e:
+            self.log(f"    -> URL {product_url} の処理中にエラー発生: {repr(e)}")
+            # エラー時も基本情報は記録
+            return failed_watch_info(product_url, f"処理中エラー: {repr(e)}")
+
+    def extract_watch_details_batch(self, items, model_number=None):
+        """
+        検索結果の複数件を1回のリクエストにまとめて抽出する
+        rule_extractor がある場合、ルールで全項目を確定できた件はリクエストに含めず、
+        それ以外の件は全項目を抽出してルールで確定した項目だけルールの値を使う
+        戻り値:
+        List[dict]: items と同じ順序の抽出結果
+        """
+        product_urls = [item["url"] for item in items]
+        self.log(f"    まとめて抽出 ({len(items)}件): {', '.join(product_urls)}")
+        try:
+            resolved = [self._resolve_by_rules(item, model_number) for item in items]
+            llm_indexes = [i for i, (rule_info, unresolved) in enumerate(resolved) if rule_info is None or unresolved]
+            texts = [self._item_text(items[i], model_number) for i in llm_indexes]
+            llm_results = dict(zip(llm_indexes, self.extract_many_stage(texts) if texts else []))
+            watch_details = []
+            for i, (rule_info, unresolved) in enumerate(resolved):
+                if rule_info is None:
+                    watch_details.append(llm_results[i])
+                elif unresolved:
+                    confident = [field for field in rule_info if field not in unresolved]
+                    watch_details.append(merge_extracted(llm_results[i], rule_info, confident) if llm_results[i] else None)
+                else:
+                    watch_details.append(rule_info)
+            return [self._finish_watch_detail(watch_detail, product_url)
+                    for watch_detail, product_url in zip(watch_details, product_urls)]
+        except Exception as e:
+            self.log(f"    -> まとめての抽出中にエラー発生: {repr(e)}")
+            return [failed_watch_info(product_url, f"処理中エラー: {repr(e)}") for product_url in product_urls]
+
+    def _extract_into_future(self, future, item, item_index, total_items, model_number):
+        """抽出結果をレジストリの Future に設定する（他の行が待っているため例外も必ず伝える）"""
+        try:
+            future.set_result(self.extract_watch_detail(item, item_index, total_items, model_number))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+
+    def _copy_near_duplicate(self, future, representative_future, item, item_index, total_items, model_number,
+                             extract_executor):
+        """
+        類似ページ（代表）の抽出結果を、自身の URL・ショップ名に置き換えて future に設定する
+        代表の抽出に失敗していた場合は、自身のページを抽出する
+        """
+        def on_representative_done(done_future):
+            try:
+                representative = done_future.result()
+            except BaseException:
+                representative = None
+            if not representative or representative.get("error"):
+                if extract_executor is None:
+                    self._extract_into_future(future, item, item_index, total_items, model_number)
+                else:
+                    extract_executor.submit(self._extract_into_future, future, item, item_index, total_items, model_number)
+                return
+            watch_detail = copy.deepcopy(representative)
+            watch_detail["url"] = item["url"]
+            watch_detail["seller"] = title_seller(item["content"]) or watch_detail.get("seller")
+            future.set_result(watch_detail)
+
+        representative_future.add_done_callback(on_representative_done)
+
+    def _extract_batch_into_futures(self, futures, items, model_number):
+        """複数件をまとめて抽出し、それぞれの結果をレジストリの Future に設定する"""
+        try:
+            watch_details = self.extract_watch_details_batch(items, model_number)
+        except BaseException as e:
+            for future in futures:
+                future.set_exception(e)
+            raise
+        for future, watch_detail in zip(futures, watch_details):
+            future.set_result(watch_detail)
+
+    # --- 行単位の処理 ---
+    def process_row(self, row, row_index, total_rows, extract_executor=None):
+        """
+        Excel行データから楽天の時計情報を検索し、詳細情報を抽出する
+        実行全体で同じURLの抽出は1回にまとめ、batch_size が2以上の場合はその件数ずつまとめて抽出する
+        extract_executor を渡した場合は、抽出をそのワーカープールで並列に行う
+        1行全体の処理時間は row として記録する
+        戻り値:
+        dict: row_result の形式の処理結果
+        """
+        with get_metrics().span("row"):
+            return self._process_row(row, row_index, total_rows, extract_executor)
+
+    def _process_row(self, row, row_index, total_rows, extract_executor):
+        initial_keywords = build_initial_keywords(row)
+        self.log(f"({row_index+1}/{total_rows}) 処理開始: {initial_keywords}")
+
+        grouped = self.query_planner is not None and self.query_planner.is_grouped(row)
+        try:
+            # Tavilyを使用して楽天の商品を検索（同じブランド・型番の行はまとめた検索の結果を共有する）
+            if grouped:
+                self.log(f"  -> 商品検索クエリ実行中 (型番ごとにまとめて検索): {self.query_planner.group_keywords(row)}")
+                search_results = self.query_planner.search(row, self.search_stage)
+            else:
+                self.log(f"  -> 商品検索クエリ実行中: {initial_keywords}")
+                search_results = self.search_stage(initial_keywords)
+            self.log(f"  -> 検索結果 ({len(search_results)}件)")
+        except Exception as e:
+            self.log(f"  -> 商品検索中にエラー発生: {repr(e)}")
+            return row_result(initial_keywords, [], f"商品検索エラー: {repr(e)}")
+
+        # 個別商品情報の抽出
+        self.log(f"  -> 個別商品ページ情報取得中 ({len(search_results)}件)...")
+
+        # 各URLの抽出結果（Future）を検索結果の順序で集める
+        # 他の行で既に抽出中/抽出済みのURLは、その結果を再利用する
+        pending = []
+        owned = []  # この行が抽出を担当する (Future, 検索結果, 位置)
+        model_number = row_model_number(row)
+        for i, item in enumerate(search_results):
+            product_url = item.get("url")
+            if not product_url or not item.get("content"):
+                self.log(f"    ({i+1}/{len(search_results)}) URL/コンテンツなしでスキップ")
+                continue
+
+            future, is_owner = self.url_registry.claim(product_url)
+            if is_owner:
+                if self.near_duplicates is not None:
+                    # 類似ページの検出には LLM に渡すテキストを使い、抽出時に同じものを使い回す
+                    item = dict(item, text=self._prepare_text(item["content"], model_number))
+                    representative_future, is_representative = self.near_duplicates.claim(item["text"], future)
+                    if not is_representative:
+                        self.log(f"    ({i+1}/{len(search_results)}) URL: {product_url} (類似ページの抽出結果を再利用)")
+                        self._copy_near_duplicate(future, representative_future, item, i, len(search_results),
+                                                  model_number, extract_executor)
+                        pending.append(future)
+                        continue
+                owned.append((future, item, i))
+            else:
+                self.log(f"    ({i+1}/{len(search_results)}) URL: {product_url} (他の行の抽出結果を再利用)")
+            pending.append(future)
+
+        if self.batch_size <= 1:
+            for future, item, i in owned:
+                extract_args = (future, item, i, len(search_results), model_number)
+                if extract_executor is None:
+                    # 逐次モード: その場で抽出
+                    self._extract_into_future(*extract_args)
+                else:
+                    # 並列モード: 抽出処理をワーカープールに投入
+                    extract_executor.submit(self._extract_into_future, *extract_args)
+        else:
+            # batch_size 件ずつ1回のリクエストにまとめて抽出
+            for start in range(0, len(owned), self.batch_size):
+                batch = owned[start:start + self.batch_size]
+                extract_args = ([future for future, _, _ in batch], [item for _, item, _ in batch], model_number)
+                if extract_executor is None:
+                    self._extract_batch_into_futures(*extract_args)
+                else:
+                    extract_executor.submit(self._extract_batch_into_futures, *extract_args)
+
+        # 同じ結果を複数の行で共有するため、行ごとにコピーして格納
+        extracted_watches_details = [copy.deepcopy(future.result()) for future in pending]
+        if grouped:
+            # まとめた検索の結果から、この行の文字盤色・ブレス形状に合う商品を残す
+            extracted_watches_details = [watch_detail for watch_detail in extracted_watches_details
+                                         if self.query_planner.matches(watch_detail, row)][:self.max_results]
+            self.log(f"  -> 文字盤色・ブレス形状で振り分け: {len(extracted_watches_details)}/{len(pending)}件")
+        return row_result(initial_keywords, extracted_watches_details)
+
+    def lookup_cached(self, row, known_details=None):
+        """
+        検索結果と全URLの抽出結果がキャッシュ済みの行について、API を呼ばずに1行分の処理結果を返す
+        query_planner でまとめて検索する行は、process_row と同じくグループの検索キーワード・最大取得数でキャッシュを引き、
+        文字盤色・ブレス形状で振り分ける（キャッシュから返した行はグループの残り行数から除く）
+        パラメータ:
+        known_details (dict): URL -> 抽出結果。複数行を入力順に調べる場合に共有すると、
+            process_row と同様に先の行で見つかった URL の抽出結果を後の行でも使う
+        戻り値:
+        dict または None: process_row と同じ形式の処理結果。キャッシュにない部分がある場合は None
+        """
+        if known_details is None:
+            known_details = {}
+        initial_keywords = build_initial_keywords(row)
+        grouped = self.query_planner is not None and self.query_planner.is_grouped(row)
+        if grouped:
+            search_results = self.tavily_client.cached_search(self.query_planner.group_keywords(row),
+                                                              max_results=self.query_planner.max_results,
+                                                              advance_search=self.advance_search)
+        else:
+            search_results = self.tavily_client.cached_search(initial_keywords, max_results=self.max_results,
+                                                              advance_search=self.advance_search)
+        if search_results is None:
+            return None
+
+        model_number = row_model_number(row)
+        extracted_watches_details = []
+        seen_urls = set()
+        for item in search_results:
+            product_url = item.get("url")
+            if not product_url or not item.get("content") or product_url in seen_urls:
+                continue
+            seen_urls.add(product_url)
+            if product_url not in known_details:
+                watch_detail = self._cached_watch_detail(item, model_number)
+                if watch_detail is None:
+                    return None
+                watch_detail["url"] = product_url
+                known_details[product_url] = watch_detail
+            extracted_watches_details.append(copy.deepcopy(known_details[product_url]))
+        if grouped:
+            extracted_watches_details = [watch_detail for watch_detail in extracted_watches_details
+                                         if self.query_planner.matches(watch_detail, row)][:self.max_results]
+            self.query_planner.release(row)
+        return row_result(initial_keywords, extracted_watches_details)
+
+    def _cached_watch_detail(self, item, model_number):
+        """キャッシュ済みの抽出結果（ルールで確定できる項目はルールの値）を返す。LLM の結果が必要でキャッシュにない場合は None"""
+        rule_info = None
+        if self.rule_extractor is not None:
+            try:
+                rule_info, unresolved = self.rule_extractor.resolve(item["content"], model_number)
+            except Exception:
+                pass  # 処理時と同じく全項目を LLM で抽出した結果を探す
+        if rule_info is None:
+            return self.watch_extractor.cached_info(self._prepare_text(item["content"], model_number))
+        if not unresolved:
+            return rule_info
+        cached_result = self.watch_extractor.cached_info(self._prepare_text(item["content"], model_number),
+                                                         fields=unresolved)
+        if cached_result is None:
+            return None
+        return merge_extracted(rule_info, cached_result, unresolved)
+
+    # --- 複数行の処理 ---
+    def run(self, rows, total_rows=None):
+        """
+        複数の行を処理し、完了した順に (行番号, 処理結果) を返すジェネレータ
+        workers が2以上の場合は、行（検索）と URL（抽出）を別々のプールで並列化し、同時実行数をそれぞれ workers に制限する
+        投入済みで未完了の行も workers の数倍までに抑え、行数が多くてもメモリを一定に保つ
+        パラメータ:
+        rows (Iterable[tuple]): (行番号, Excel行データ) の組
+        total_rows (int): 進捗表示に使う全体の行数。指定した場合は rows を先頭から順に読みながら処理する
+                          （None の場合は rows を全て読み込んでから件数を数える）
+        """
+        if total_rows is None:
+            rows = list(rows)
+            total_rows = len(rows)
+        if self.workers == 1:
+            for row_index, row in rows:
+                yield row_index, self.process_row(row, row_index, total_rows)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as row_executor, \
+                ThreadPoolExecutor(max_workers=self.workers) as extract_executor:
+            in_flight = {}
+            rows_iter = iter(rows)
+            while True:
+                for row_index, row in rows_iter:
+                    future = row_executor.submit(self.process_row, row, row_index, total_rows, extract_executor)
+                    in_flight[future] = row_index
+                    if len(in_flight) >= self.workers * MAX_IN_FLIGHT_ROWS_PER_WORKER:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
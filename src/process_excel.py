@@ -1,19 +1,40 @@
-import pandas as pd
-import time
 import argparse
 import json
 import os
+import time
 from pathlib import Path
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
 
-# 新しく追加されたクラスをインポート
+# pandas・rich・API クライアント (openai/tavily) は使う段階で読み込む（--help などの起動を速くするため）
 from tavily_processor import tavily_processor
 from watch_info_extractor import WatchInfoExtractor
+from cache_store import SQLiteCache
+from content_trimmer import ContentTrimmer, DEFAULT_MAX_CHARS
+from rule_extractor import RuleExtractor, DEFAULT_MIN_CONFIDENCE
+from near_duplicates import NearDuplicateIndex, DEFAULT_MAX_DISTANCE
+from batch_jobs import prepare_batch, submit_batch, ingest_batch, LocalFileExecutor, OpenAIBatchExecutor
+from journal import RowJournal, row_input_hash
+from result_writer import write_json_array, JsonlWriter
+from input_reader import iter_input_rows, count_input_rows
+from listing_store import ListingStore
+from query_planner import QueryPlanner, GROUP_MAX_RESULTS
+from result_table import results_to_frame, export_results, export_path_for, EXPORT_FORMATS
+from incremental import PreviousRun, RunDiff, DEFAULT_MAX_AGE_HOURS
+from pipeline import WatchSearchPipeline, UrlRegistry, build_initial_keywords, row_model_number
+from metrics import get_metrics
+
+class _LazyConsole:
+    """最初に使われたときに rich の Console を作るプロキシ"""
+
+    def __getattr__(self, name):
+        global console
+        from rich.console import Console
+        if isinstance(console, _LazyConsole):
+            console = Console()
+        return getattr(console, name)
+
 
 # richコンソール初期化
-console = Console()
+console = _LazyConsole()
 
 # --- 設定 ---
 # pathlibを使用してパスを定義
@@ -24,97 +45,150 @@ DEFAULT_OUTPUT_JSON = DATA_DIR / 'result.json'
 TEST_OUTPUT_JSON = DATA_DIR / 'result_test.json'
 DEFAULT_LIMIT = None # Noneの場合は全件処理
 TEST_LIMIT = 2       # テストモード時の処理行数
-SLEEP_SECONDS = 1    # APIリクエスト間の待機時間（秒）
 MAX_URLS_TO_FETCH = 10 # 検索結果の最大取得数
 ADVANCE_SEARCH =  True #検索深度を深める
+DEFAULT_WORKERS = 1    # 並列処理のワーカー数（1の場合は従来どおり逐次処理）
+CACHE_DIR = DATA_DIR / 'cache'  # 永続キャッシュの保存先
+SEARCH_CACHE_PATH = CACHE_DIR / 'search_cache.sqlite3'
+SEARCH_CACHE_TTL_HOURS = 24       # 検索結果キャッシュの有効期限（時間）
+SEARCH_CACHE_MAX_ENTRIES = 10000  # 検索結果キャッシュの最大件数（超えた分は古い順に削除）
+EXTRACTION_CACHE_PATH = CACHE_DIR / 'extraction_cache.sqlite3'
+EXTRACTION_CACHE_TTL_DAYS = 30         # 抽出結果キャッシュの有効期限（日）
+EXTRACTION_CACHE_MAX_ENTRIES = 100000  # 抽出結果キャッシュの最大件数（超えた分は古い順に削除）
+TRIM_MAX_CHARS = DEFAULT_MAX_CHARS     # LLMに渡すページテキストの最大文字数（0の場合はトリミングしない）
+EXTRACT_BATCH_SIZE = 1                 # 1回のリクエストでまとめて抽出する件数（1の場合は1件ずつ）
+BATCH_DIR = DATA_DIR / 'batch'         # オフライン一括抽出モードの作業ディレクトリ
+JOURNAL_SUFFIX = '.journal.jsonl'      # 完了した行を追記するジャーナル（出力ファイル名に付ける接尾辞）
+OUTPUT_FORMATS = ['json', 'jsonl']     # json=終了時に result.json を作成 / jsonl=完了した行から1行ずつ書き出す
+URL_REGISTRY_MAX_ENTRIES = 20000       # 実行中に保持するURLごとの抽出結果の最大件数（超えた分は抽出キャッシュから再取得）
+METRICS_SUFFIX = '.metrics.json'       # 処理時間・API呼び出しの集計ファイル（出力ファイル名に付ける接尾辞）
+FAST_PATH_CONFIDENCE = DEFAULT_MIN_CONFIDENCE  # ルールの抽出結果をLLMに問い合わせずに使う信頼度の下限
+NEAR_DUPLICATE_DISTANCE = DEFAULT_MAX_DISTANCE  # 類似ページとみなす本文の SimHash のハミング距離の上限（64ビット中）
+INCREMENTAL_MAX_AGE_HOURS = DEFAULT_MAX_AGE_HOURS  # 差分更新で前回の結果を再利用する期限（時間）
+INCREMENTAL_JOURNAL_SUFFIX = '.new'    # 差分更新中に書き込むジャーナル（完了後に前回のジャーナルと置き換える）
+LISTING_STORE_PATH = DATA_DIR / 'listings.sqlite3'  # 実行ごとの商品（掲載・価格）を蓄積するストア
+DIFF_SUFFIX = '.diff.json'             # 差分更新で前回から変わった掲載・価格（出力ファイル名に付ける接尾辞）
 
-def process_row_data(row, row_index, total_rows, tavily_client, watch_extractor, advance_search):
-    """Excel行データから楽天の時計情報を検索し、詳細情報を抽出する"""
-    initial_keywords = f"{row['ブランド']} {row['型番']} {row['文字盤色']} {row['ブレス形状']} 中古"
-    console.print(f"[dim]({row_index+1}/{total_rows})[/dim] 処理開始: [cyan]{initial_keywords}[/cyan]")
+def open_search_cache(ttl_hours=SEARCH_CACHE_TTL_HOURS):
+    """検索結果の永続キャッシュを開く"""
+    return SQLiteCache(SEARCH_CACHE_PATH, table="search_results",
+                       ttl_seconds=ttl_hours * 3600, max_entries=SEARCH_CACHE_MAX_ENTRIES)
 
-    search_query = f"{initial_keywords}"
-    extracted_watches_details = []  # 最終的な抽出結果リスト
-    search_results = []  # 検索結果リスト
+def open_extraction_cache():
+    """抽出結果（ページテキストのハッシュ単位）の永続キャッシュを開く"""
+    return SQLiteCache(EXTRACTION_CACHE_PATH, table="extraction_results",
+                       ttl_seconds=EXTRACTION_CACHE_TTL_DAYS * 86400, max_entries=EXTRACTION_CACHE_MAX_ENTRIES)
 
-    try:
-        # Tavilyを使用して楽天の商品を検索
-        console.print(f"  -> 商品検索クエリ実行中: {search_query}")
-        search_results = tavily_client.search_item(search_query, max_results=MAX_URLS_TO_FETCH, advance_search=advance_search)
-        console.print(f"  -> 検索結果 ({len(search_results)}件):")
-        
-        for i, item in enumerate(search_results):
-            console.print(f"    - URL: {item.get('url', 'N/A')}")
+class OrderedRowEmitter:
+    """
+    並列処理で前後して完了した行を、入力順に揃えて書き出す
+    先行する行が完了するまで後続の行を保留する
+    """
 
-    except Exception as e:
-        console.print(f"  -> 商品検索中にエラー発生: {repr(e)}")
-        search_results = []
+    def __init__(self, row_indexes, write, load_completed):
+        """
+        パラメータ:
+        row_indexes (list): 出力順（入力順）の行番号（処理中に追加されてもよい）
+        write (Callable[[dict], None]): 1行分のデータを書き出す関数
+        load_completed (Callable[[int], dict]): 前回の実行で完了済みの行のデータを読み出す関数
+        """
+        self._order = row_indexes
+        self._position = 0
+        self._ready = {}  # 完了済みでまだ書き出していない行（None は前回完了分）
+        self._write = write
+        self._load_completed = load_completed
 
-    # 個別商品情報の抽出ループ
-    console.print(f"  -> 個別商品ページ情報取得中 ({len(search_results)}件)...")
-    
-    for i, item in enumerate(search_results):
-        product_url = item.get("url")
-        product_content = item.get("content")
-        
-        if not product_url or not product_content:
-            console.print(f"    ({i+1}/{len(search_results)}) URL/コンテンツなしでスキップ")
-            continue
+    def done(self, row_index, result=None):
+        """行の完了を通知し、書き出せるところまで入力順に書き出す（result が None の行は前回完了分を読み出す）"""
+        self._ready[row_index] = result
+        self.flush()
 
-        console.print(f"    ({i+1}/{len(search_results)}) URL: {product_url}")
-        
-        try:
-            # WatchInfoExtractorを使って時計情報を抽出
-            watch_detail = watch_extractor.extract_info(product_content)
-            
-            if watch_detail:
-                # URLの追加
-                watch_detail["url"] = product_url
-                
-                # 抽出結果をリストに追加
-                extracted_watches_details.append(watch_detail)
-                
-                # コンソールに主要情報表示
-                price_str = f"¥{watch_detail.get('price'):,}" if watch_detail.get('price') else "N/A"
-                console.print(f"      -> 抽出成功: {watch_detail.get('name', 'N/A')} ({watch_detail.get('model_number', 'N/A')}) / {price_str}")
-            else:
-                console.print("      -> 詳細抽出失敗")
-                # 詳細抽出失敗時も、URLは記録
-                extracted_watches_details.append({
-                    "name": None, "model_number": None, "dial_color": None, "bracelet_type": None,
-                    "price": None, "url": product_url,
-                    "seller": None, "warranty_date": None,
-                    "accessories": {"has_warranty_card": None, "has_box": None, "other_description": "詳細抽出失敗"},
-                    "condition": None
-                })
-
-            # APIのレート制限を避けるために待機
-            time.sleep(SLEEP_SECONDS)
+    def flush(self):
+        """書き出せるところまで入力順に書き出す（行番号は読み込みながら row_indexes に追加されるため、最後にも呼び出す）"""
+        while self._position < len(self._order) and self._order[self._position] in self._ready:
+            next_index = self._order[self._position]
+            next_result = self._ready.pop(next_index)
+            self._write(next_result if next_result is not None else self._load_completed(next_index))
+            self._position += 1
 
-        except Exception as e:
-            console.print(f"    -> URL {product_url} の処理中にエラー発生: {repr(e)}")
-            # エラー時も基本情報は記録
-            extracted_watches_details.append({
-                "name": None, "model_number": None, "dial_color": None, "bracelet_type": None,
-                "price": None, "url": product_url,
-                "seller": None, "warranty_date": None,
-                "accessories": {"has_warranty_card": None, "has_box": None, "other_description": f"処理中エラー: {repr(e)}"},
-                "condition": None
-            })
-
-    # 結果を辞書で返す（search_resultsフィールドは除外）
-    return {
-        "input_keywords": initial_keywords,
-        "extracted_results": extracted_watches_details
-    }
+
+def create_batch_executor(name, watch_extractor, batch_dir):
+    """オフライン一括抽出モードの executor を作成する（openai: Batch API / local: 通常APIで逐次処理）"""
+    if name == "openai":
+        return OpenAIBatchExecutor(watch_extractor.client)
+
+    def complete(body):
+        response = watch_extractor.api.call(watch_extractor.client.chat.completions.create, **body)
+        return response.choices[0].message.content
+
+    return LocalFileExecutor(complete, Path(batch_dir) / "local")
+
+def run_batch_step(step, batch_dir, executor, output_json_path, extraction_cache):
+    """オフライン一括抽出モードの送信 (submit) / 取り込み (ingest) を実行する"""
+    if step == "submit":
+        jobs = submit_batch(batch_dir, executor)
+        for job in jobs:
+            console.print(f"送信完了: {job['request_file']} -> ジョブID [cyan]{job['job_id']}[/cyan]")
+        console.print(f"{len(jobs)} 件のジョブを送信しました。完了後に --batch-mode ingest で結果を取り込んでください。")
+        return
+
+    from rich.panel import Panel
+
+    summary = ingest_batch(batch_dir, executor, output_json_path, result_cache=extraction_cache)
+    if not summary["completed"]:
+        console.print(f"[yellow]未完了のジョブが {summary['pending_jobs']} 件あります。[/yellow]しばらくしてから再実行してください。")
+        return
+    console.print(Panel(f"[bold green]✓ 取り込み完了[/bold green]\n"
+                        f"{summary['rows']} 行 (抽出失敗 {summary['failed_urls']} URL) を '{output_json_path}' に保存しました。",
+                        border_style="green"))
 
 def main():
     # コマンドライン引数の設定
     parser = argparse.ArgumentParser(description='Excelの時計情報からTavily APIとOpenAI APIを使って検索・抽出し、結果をJSONファイルに出力するスクリプト')
     parser.add_argument('--test', action='store_true', help='最初の2件のみ処理するテストモード')
-    parser.add_argument('--input', default=str(DEFAULT_INPUT_EXCEL), help=f'入力Excelファイル名 (デフォルト: {DEFAULT_INPUT_EXCEL})')
-    parser.add_argument('--output', default=None, help='出力JSONファイル名 (デフォルト: testモード時はresult_test.json, 通常時はresult.json)')
+    parser.add_argument('--input', default=str(DEFAULT_INPUT_EXCEL), help=f'入力ファイル名 (.xlsx / .csv / .parquet、デフォルト: {DEFAULT_INPUT_EXCEL})')
+    parser.add_argument('--output', default=None, help='出力JSONファイル名 (デフォルト: testモード時はresult_test.json, 通常時はresult.json。jsonl形式では拡張子が .jsonl)')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='json',
+                        help='出力形式: json=終了時にまとめて出力 / jsonl=完了した行から入力順に1行ずつ出力 (デフォルト: json)')
+    parser.add_argument('--gzip', action='store_true', help='jsonl形式の出力を gzip 圧縮する（拡張子 .gz）')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'並列処理のワーカー数。検索・抽出それぞれの同時実行数の上限 (デフォルト: {DEFAULT_WORKERS})')
+    parser.add_argument('--no-cache', action='store_true', help='検索結果・抽出結果のキャッシュを使わずに毎回APIを呼び出す')
+    parser.add_argument('--refresh-cache', action='store_true', help='キャッシュを読まずに検索し、結果でキャッシュを更新する')
+    parser.add_argument('--trim-chars', type=int, default=TRIM_MAX_CHARS, help=f'LLMに渡すページテキストの最大文字数。0でトリミングしない (デフォルト: {TRIM_MAX_CHARS})')
+    parser.add_argument('--batch-size', type=int, default=EXTRACT_BATCH_SIZE, help=f'1回のOpenAIリクエストでまとめて抽出する件数 (デフォルト: {EXTRACT_BATCH_SIZE})')
+    parser.add_argument('--no-fast-path', action='store_true', help='ルールによる抽出を行わず、全項目をLLMで抽出する')
+    parser.add_argument('--fast-path-confidence', type=float, default=FAST_PATH_CONFIDENCE,
+                        help=f'ルールの抽出結果をLLMに問い合わせずに使う信頼度の下限 (デフォルト: {FAST_PATH_CONFIDENCE})')
+    parser.add_argument('--no-near-duplicates', action='store_true', help='本文がほぼ同じページ（別ショップ・別URLの同じ商品）の抽出結果を再利用しない')
+    parser.add_argument('--near-duplicate-distance', type=int, default=NEAR_DUPLICATE_DISTANCE,
+                        help=f'類似ページとみなす本文の SimHash のハミング距離の上限 (デフォルト: {NEAR_DUPLICATE_DISTANCE})')
+    parser.add_argument('--plan-queries', action='store_true',
+                        help='同じブランド・型番の行の検索を1回にまとめる。処理の前に入力全体を1回読んでブランド・型番ごとの行数を数えるため、'
+                             '最初の行の処理が読み終わるまで遅れ、型番の種類数に比例したメモリを使う')
+    parser.add_argument('--batch-mode', choices=['prepare', 'submit', 'ingest'], default=None,
+                        help='オフライン一括抽出モード: prepare=検索してリクエストJSONLを作成 / submit=送信 / ingest=結果を取り込んでJSONを出力')
+    parser.add_argument('--batch-dir', default=str(BATCH_DIR), help=f'オフライン一括抽出モードの作業ディレクトリ (デフォルト: {BATCH_DIR})')
+    parser.add_argument('--batch-executor', choices=['openai', 'local'], default='openai',
+                        help='オフライン一括抽出モードの送信先: openai=Batch API / local=通常APIで逐次処理 (デフォルト: openai)')
+    parser.add_argument('--resume', action='store_true', help='前回中断した実行を再開する（ジャーナルに完了済みの行は処理しない）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='差分更新: 前回のジャーナルと比べて、新しい行・入力が変わった行・期限切れの行だけを再検索し、残りは前回の結果を使う')
+    parser.add_argument('--max-age', type=float, default=INCREMENTAL_MAX_AGE_HOURS,
+                        help=f'差分更新で前回の結果を再利用する期限（時間） (デフォルト: {INCREMENTAL_MAX_AGE_HOURS})')
+    parser.add_argument('--journal', default=None, help=f'完了した行を追記するジャーナルファイル (デフォルト: 出力ファイル名 + {JOURNAL_SUFFIX})')
+    parser.add_argument('--export', choices=list(EXPORT_FORMATS), nargs='+', default=[],
+                        help='結果テーブル（商品1件を1行、価格は数値）を出力ファイルと同じ場所に書き出す形式 (複数指定可、parquet / arrow は pyarrow が必要)')
+    parser.add_argument('--store', default=str(LISTING_STORE_PATH), help=f'商品（掲載・価格）を実行ごとに蓄積するSQLiteファイル (デフォルト: {LISTING_STORE_PATH})')
+    parser.add_argument('--no-store', action='store_true', help='結果を商品ストアに保存しない')
+    parser.add_argument('--metrics-output', default=None, help=f'処理時間・再試行回数・トークン使用量の集計を保存するJSONファイル (デフォルト: 出力ファイル名 + {METRICS_SUFFIX})')
+    parser.add_argument('--cache-ttl', type=float, default=SEARCH_CACHE_TTL_HOURS, help=f'検索結果キャッシュの有効期限（時間） (デフォルト: {SEARCH_CACHE_TTL_HOURS})')
     args = parser.parse_args()
+    if args.incremental and args.resume:
+        parser.error('--incremental と --resume は同時に指定できません')
+    workers = max(1, args.workers)
+
+    from rich.panel import Panel
+    from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
 
     # 入力/出力ファイルパスと処理行数制限の設定
     input_excel_path = Path(args.input)
@@ -124,76 +198,214 @@ def main():
         output_json_path = Path(args.output)
     else:
         output_json_path = TEST_OUTPUT_JSON if args.test else DEFAULT_OUTPUT_JSON
+        if args.output_format == 'jsonl':
+            output_json_path = output_json_path.with_suffix('.jsonl')
+    if args.output_format == 'jsonl' and args.gzip and output_json_path.suffix != '.gz':
+        output_json_path = output_json_path.with_name(output_json_path.name + '.gz')
 
     console.print(Panel(f"[bold green]Rolex Search Tool 開始[/bold green]\n"
                         f"入力ファイル: [cyan]{input_excel_path}[/cyan]\n"
-                        f"出力ファイル: [cyan]{output_json_path}[/cyan]\n"
-                        f"テストモード: {'[bold yellow]有効[/bold yellow]' if args.test else '[dim]無効[/dim]'}",
+                        f"出力ファイル: [cyan]{output_json_path}[/cyan] ({args.output_format})\n"
+                        f"テストモード: {'[bold yellow]有効[/bold yellow]' if args.test else '[dim]無効[/dim]'}\n"
+                        f"ワーカー数: {workers}\n"
+                        f"検索キャッシュ: {'[dim]無効[/dim]' if args.no_cache else ('[bold yellow]更新[/bold yellow]' if args.refresh_cache else '有効')}",
                         title="設定", border_style="blue"))
 
+    if args.batch_mode not in ('submit', 'ingest') and not input_excel_path.is_file():
+        # 入力ファイルは処理の前に確認する（処理中のキャッシュ・ストアなどのファイルのエラーと区別するため）
+        console.print(f"[bold red]エラー:[/bold red] ファイル '{input_excel_path}' が見つかりません。")
+        return
+
     try:
         # APIクライアントの初期化
         console.print("Tavily APIクライアントを初期化中...")
-        tavily_client = tavily_processor()
+        search_cache = None if args.no_cache else open_search_cache(args.cache_ttl)
+        tavily_client = tavily_processor(search_cache=search_cache, refresh_cache=args.refresh_cache)
         
         console.print("OpenAI APIクライアントを初期化中...")
-        watch_extractor = WatchInfoExtractor()
-        
-        # 入力Excelファイルを読み込む
-        console.print(f"読み込み中: [cyan]{input_excel_path}[/cyan]...")
-        df = pd.read_excel(input_excel_path)
-        console.print(f"[green]✓[/green] '{input_excel_path}' を読み込みました。")
+        extraction_cache = None if args.no_cache else open_extraction_cache()
+        watch_extractor = WatchInfoExtractor(result_cache=extraction_cache)
+        content_trimmer = ContentTrimmer(max_chars=args.trim_chars) if args.trim_chars > 0 else None
+        rule_extractor = None if args.no_fast_path else RuleExtractor(min_confidence=args.fast_path_confidence)
+        near_duplicates = None if args.no_near_duplicates else NearDuplicateIndex(max_distance=args.near_duplicate_distance,
+                                                                                   max_entries=URL_REGISTRY_MAX_ENTRIES)
+        query_planner = QueryPlanner(max_results=GROUP_MAX_RESULTS) if args.plan_queries else None
 
-        # 処理行数を制限 (テストモード時)
+        if args.batch_mode in ('submit', 'ingest'):
+            executor = create_batch_executor(args.batch_executor, watch_extractor, args.batch_dir)
+            run_batch_step(args.batch_mode, args.batch_dir, executor, output_json_path, extraction_cache)
+            return
+
+        # 入力ファイルは検索に使う列だけを先頭から1行ずつ読み込み、全体を読み終える前に処理を始める
+        metrics = get_metrics()
+        with metrics.span("excel_load"):
+            total_rows = count_input_rows(input_excel_path, limit=limit)
+        console.print(f"読み込み中: [cyan]{input_excel_path}[/cyan] ({'行数不明' if total_rows is None else f'{total_rows} 行'})")
         if limit is not None:
-            df_process = df.head(limit).copy()
             console.print(f"[yellow]テストモード:[/yellow] 最初の {limit} 行のみ処理します。")
         else:
-            df_process = df.copy()
-            console.print(f"全 {len(df_process)} 行を処理します。")
-
-        total_rows = len(df_process)
-        final_results_list = []  # 最終結果を格納するリスト
-
-        # プログレスバーの設定
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            BarColumn(),
-            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-            TimeElapsedColumn(),
-            console=console,
-            transient=True  # 完了したら消す
-        ) as progress:
-            task = progress.add_task("[cyan]処理中...", total=total_rows)
-
-            # 各行に関数を適用して結果を取得
-            for index, row in df_process.iterrows():
-                # 行ごとの処理を実行
-                result_data_for_row = process_row_data(row, index, total_rows, tavily_client, watch_extractor, ADVANCE_SEARCH)
-                
-                # 結果をリストに追加
-                final_results_list.append(result_data_for_row)
-                
-                # デバッグ用に結果確認
-                console.print(f"[dim]行 {index+1} の結果: {len(result_data_for_row['extracted_results'])} 件の情報抽出[/dim]")
-                
-                # プログレスバーを進める
-                progress.update(task, advance=1)
-        
+            console.print(f"全 {'' if total_rows is None else f'{total_rows} '}行を処理します。")
+
+        def input_rows():
+            # 読み込み時間は行ごとに excel_load として記録する（処理と交互に行うため）
+            rows_iter = iter_input_rows(input_excel_path, limit=limit)
+            while True:
+                with metrics.span("excel_load"):
+                    row = next(rows_iter, None)
+                if row is None:
+                    return
+                yield row
+
+        url_registry = UrlRegistry(max_completed=URL_REGISTRY_MAX_ENTRIES)  # 実行全体でURLごとの抽出を1回にまとめる
+        pipeline = WatchSearchPipeline(tavily_client, watch_extractor, max_results=MAX_URLS_TO_FETCH,
+                                       advance_search=ADVANCE_SEARCH, workers=workers, content_trimmer=content_trimmer,
+                                       batch_size=args.batch_size, url_registry=url_registry, log=console.print,
+                                       rule_extractor=rule_extractor, near_duplicates=near_duplicates,
+                                       query_planner=query_planner)
+
+        if args.batch_mode == 'prepare':
+            rows = ((index, build_initial_keywords(row), row_model_number(row)) for index, row in input_rows())
+            summary = prepare_batch(rows, tavily_client, watch_extractor, args.batch_dir, MAX_URLS_TO_FETCH,
+                                    ADVANCE_SEARCH, content_trimmer, rule_extractor=rule_extractor,
+                                    on_row=lambda index, url_count: console.print(f"[dim]行 {index+1}: {url_count} URL[/dim]"))
+            console.print(Panel(f"[bold green]✓ リクエスト作成完了[/bold green]\n"
+                                f"{summary['rows']} 行 / リクエスト {summary['requests']} 件 ({summary['request_files']} ファイル) / "
+                                f"キャッシュ済み {summary['prefilled']} 件\n"
+                                f"次に --batch-mode submit で送信してください。",
+                                border_style="green"))
+            return
+
+        # 完了した行はジャーナルに逐次追記し、--resume 時は入力が同じ完了済みの行を飛ばす
+        journal_path = Path(args.journal) if args.journal else output_json_path.with_name(output_json_path.name + JOURNAL_SUFFIX)
+        previous_run = None
+        if args.incremental:
+            # 前回のジャーナルは今回の実行が完了するまで残し、新しいジャーナルを書き終えてから置き換える
+            previous_run = PreviousRun(journal_path)
+            journal = RowJournal(journal_path.with_name(journal_path.name + INCREMENTAL_JOURNAL_SUFFIX))
+            run_diff = RunDiff()
+            console.print(f"[yellow]差分更新:[/yellow] 前回の結果 {len(previous_run)} 行 (取得から {args.max_age:g} 時間以内の行は再利用)")
+        else:
+            journal = RowJournal(journal_path, resume=args.resume)
+        row_indexes = []  # 出力順（入力順）の行番号
+        jsonl_writer = None
+        try:
+            if args.resume:
+                # 入力を先に読み直さず、処理の際に1行ずつジャーナルと照合して完了済みの行を飛ばす
+                console.print(f"[yellow]再開:[/yellow] ジャーナルの完了済み {journal.completed_count()} 行のうち、入力が同じ行をスキップします。")
+            skipped_rows = 0  # 再開: 完了済みで飛ばした行数
+            input_hashes = {}  # 処理中の行番号 -> 入力のハッシュ
+            seen_hashes = set()  # 差分更新: 今回の入力にある行の入力のハッシュ
+            row_changes = {}  # 差分更新: 処理中の行番号 -> (変化の種類, 比較する前回の行の入力のハッシュ)
+            started_at = time.time()
+
+            def is_fresh(input_hash):
+                # 差分更新: 前回の結果を再利用できる行かどうか
+                return previous_run is not None and previous_run.is_fresh(input_hash, args.max_age * 3600, now=started_at)
+
+            def is_completed(index, input_hash):
+                # 検索しない行（再開: ジャーナルに完了済み / 差分更新: 前回の結果を再利用）かどうか
+                return (args.resume and journal.is_completed(index, input_hash)) or is_fresh(input_hash)
+
+            if query_planner is not None:
+                # 今回検索する行（再開・差分更新で飛ばす行を除く）をブランド・型番ごとに数え、まとめて検索するグループを決める
+                with metrics.span("plan"):
+                    query_planner.plan((index, row) for index, row in input_rows()
+                                       if not is_completed(index, row_input_hash(build_initial_keywords(row))))
+
+            def pending_rows():
+                # 出力順を記録しながら、未完了の行だけを読み込んだ順に処理へ渡す
+                nonlocal skipped_rows
+                for index, row in input_rows():
+                    row_indexes.append(index)
+                    input_hash = row_input_hash(build_initial_keywords(row))
+                    if args.resume and journal.is_completed(index, input_hash):
+                        skipped_rows += 1
+                        if row_emitter is not None:
+                            row_emitter.done(index)  # 前回完了分はジャーナルから読み出して書き出す
+                        progress.update(task, advance=1)
+                        continue
+                    if previous_run is not None:
+                        seen_hashes.add(input_hash)
+                        if is_fresh(input_hash):
+                            reuse_row(index, input_hash)
+                            continue
+                        if input_hash in previous_run:
+                            row_changes[index] = ("stale", input_hash)
+                        elif previous_run.hash_at(index) is not None:
+                            row_changes[index] = ("edited", previous_run.hash_at(index))
+                        else:
+                            row_changes[index] = ("new", None)
+                    input_hashes[index] = input_hash
+                    yield index, row
+
+            row_emitter = None
+            if args.output_format == 'jsonl':
+                # 完了した行から入力順に書き出す（前回完了分はジャーナルから読み出す）
+                output_json_path.parent.mkdir(parents=True, exist_ok=True)
+                jsonl_writer = JsonlWriter(output_json_path)
+                row_emitter = OrderedRowEmitter(row_indexes, jsonl_writer.write, journal.read)
+
+            # プログレスバーの設定
+            with Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(),
+                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+                TimeElapsedColumn(),
+                console=console,
+                transient=True  # 完了したら消す
+            ) as progress:
+                task = progress.add_task("[cyan]処理中...", total=total_rows)
+
+                def record_row(index, input_hash, result_data_for_row):
+                    # 結果をジャーナルに追記（メモリには保持しない）
+                    journal.append(index, input_hash, result_data_for_row)
+                    if row_emitter is not None:
+                        row_emitter.done(index, result_data_for_row)
+                    if previous_run is not None:
+                        status, previous_hash = row_changes.pop(index)
+                        previous_result = previous_run.read(previous_hash) if previous_hash is not None else None
+                        run_diff.record(index, status, previous_result, result_data_for_row)
+                    # デバッグ用に結果確認
+                    console.print(f"[dim]行 {index+1} の結果: {len(result_data_for_row['extracted_results'])} 件の情報抽出[/dim]")
+                    # プログレスバーを進める
+                    progress.update(task, advance=1)
+
+                def reuse_row(index, input_hash):
+                    # 差分更新: 前回の結果を取得時刻ごと新しいジャーナルに引き継ぐ（期限は最初に取得した時刻から数える）
+                    result_data_for_row = previous_run.read(input_hash)
+                    journal.append(index, input_hash, result_data_for_row, completed_at=previous_run.completed_at(input_hash))
+                    if row_emitter is not None:
+                        row_emitter.done(index, result_data_for_row)
+                    run_diff.reuse()
+                    progress.update(task, advance=1)
+
+                # 行ごとの処理を実行（workers が2以上の場合は並列に処理し、完了した順に結果を受け取る）
+                for index, result_data_for_row in pipeline.run(pending_rows(), total_rows="?" if total_rows is None else total_rows):
+                    record_row(index, input_hashes.pop(index), result_data_for_row)
+                if row_emitter is not None:
+                    row_emitter.flush()  # 末尾の前回完了分を書き出す
+            if args.resume:
+                console.print(f"[yellow]再開:[/yellow] 完了済み {skipped_rows} 行をスキップしました。")
+        finally:
+            if jsonl_writer is not None:
+                jsonl_writer.close()
+            journal.close()
+            if previous_run is not None:
+                previous_run.close()
+
         # 出力ディレクトリの確認と作成
         output_dir = Path(output_json_path).parent
         output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # ループ外でまとめて保存
-        console.print(f"最終結果を保存中... ({len(final_results_list)} 行のデータ)")
-        
+
+        # ジャーナルから入力順に1行ずつ読み出して保存（jsonl形式は処理中に書き出し済み）
+        console.print(f"最終結果を保存中... ({journal.completed_count()} 行のデータ)")
+
         try:
-            with open(output_json_path, 'w', encoding='utf-8') as f:
-                json.dump(final_results_list, f, ensure_ascii=False, indent=2)
-                f.flush()  # 強制的にバッファをフラッシュ
-                os.fsync(f.fileno())  # OSレベルでの書き込み完了を保証
-                
+            if jsonl_writer is None:
+                with metrics.span("json_write"):
+                    write_json_array(output_json_path, journal.iter_results(row_indexes))
+
             # ファイル存在確認
             if output_json_path.exists():
                 file_size = output_json_path.stat().st_size
@@ -204,12 +416,73 @@ def main():
             console.print(f"[bold red]JSONへの書き込みエラー:[/bold red] {str(e)}")
             console.print_exception(show_locals=True)
 
+        if not args.no_store:
+            # 商品ごとに索引付きのストアへまとめて書き込み、実行をまたいだ検索に使う
+            listing_store = ListingStore(args.store)
+            try:
+                with metrics.span("store_write"):
+                    store_summary = listing_store.add_run(journal.iter_results(row_indexes), source=str(output_json_path))
+            finally:
+                listing_store.close()
+            console.print(f"商品ストア: {store_summary['rows']} 行 / 商品 {store_summary['listings']} 件を '{args.store}' に保存しました (run_id={store_summary['run_id']})")
+
+        if args.export:
+            # 結果テーブルに展開して列形式・Excel で書き出す（出力ファイル名の拡張子を置き換える）
+            with metrics.span("export"):
+                result_frame = results_to_frame(journal.iter_results(row_indexes))
+            for export_format in args.export:
+                export_path = export_path_for(output_json_path, export_format)
+                try:
+                    with metrics.span("export"):
+                        export_results(result_frame, export_path)
+                    console.print(f"結果テーブル: {len(result_frame)} 件を '{export_path}' に保存しました。")
+                except ImportError as e:
+                    console.print(f"[bold red]書き出しエラー:[/bold red] {e}")
+            del result_frame
+
+        if previous_run is not None:
+            # 今回の入力にない行を記録し、新しいジャーナルを次回の比較対象にする
+            run_diff.record_removed(previous_run, seen_hashes)
+            previous_run.close()  # record_removed で開き直したファイルを閉じる
+            os.replace(journal.path, journal_path)
+            diff_path = output_json_path.with_name(output_json_path.name + DIFF_SUFFIX)
+            run_diff.write(diff_path)
+            diff_stats = run_diff.summary()
+            console.print(f"差分更新: 再利用 {diff_stats['reused_rows']} 行 / 再検索 {diff_stats['reprocessed_rows']} 行 "
+                          f"(新規 {diff_stats['new_rows']} / 変更 {diff_stats['edited_rows']} / 期限切れ {diff_stats['stale_rows']}) / "
+                          f"削除 {diff_stats['removed_rows']} 行")
+            console.print(f"前回からの変化: 掲載追加 {diff_stats['added_listings']} 件 / 掲載終了 {diff_stats['removed_listings']} 件 / "
+                          f"価格変更 {diff_stats['price_changes']} 件 ('{diff_path}' に保存しました)")
+
+        console.print(f"URL重複排除: ユニークURL {url_registry.unique_urls()} 件 / 他の行の結果を再利用 {url_registry.reused} 件")
+        if near_duplicates is not None:
+            console.print(f"類似ページ: 抽出結果を再利用 {near_duplicates.reused} 件")
+        if query_planner is not None:
+            plan_stats = query_planner.stats()
+            console.print(f"クエリプランナー: 型番ごとにまとめた検索 {plan_stats['groups']} 件 ({plan_stats['grouped_rows']} 行) / 削減した検索 {plan_stats['saved_searches']} 回")
+        if content_trimmer is not None:
+            trim_stats = content_trimmer.stats()
+            console.print(f"テキストトリミング: {trim_stats['documents']} 件 / 推定 {trim_stats['original_tokens']:,} → {trim_stats['trimmed_tokens']:,} トークン (削減 {trim_stats['saved_tokens']:,})")
+        if rule_extractor is not None:
+            rule_stats = rule_extractor.stats()
+            console.print(f"ルールによる抽出: LLMなし {rule_stats['fast_path']}/{rule_stats['documents']} 件 ({rule_stats['fast_path_ratio']:.0%}) / LLMに問い合わせた項目 {rule_stats['llm_fields']} 件")
+        if search_cache is not None:
+            cache_stats = search_cache.stats()
+            console.print(f"検索キャッシュ: ヒット {cache_stats['hits']} 件 / ミス {cache_stats['misses']} 件 (保存件数 {cache_stats['entries']})")
+        if extraction_cache is not None:
+            cache_stats = extraction_cache.stats()
+            console.print(f"抽出キャッシュ: ヒット {cache_stats['hits']} 件 / ミス {cache_stats['misses']} 件 (保存件数 {cache_stats['entries']})")
+
+        # 処理時間の内訳・API呼び出しの集計を表示して保存
+        metrics_path = Path(args.metrics_output) if args.metrics_output else output_json_path.with_name(output_json_path.name + METRICS_SUFFIX)
+        console.print(metrics.summary_table())
+        metrics.write_json(metrics_path)
+        console.print(f"集計を '{metrics_path}' に保存しました。")
+
         # 最終結果の保存完了メッセージ
         console.print(Panel(f"[bold green]✓ 処理完了[/bold green]\n結果を '{output_json_path}' に保存しました。",
                             border_style="green"))
 
-    except FileNotFoundError:
-        console.print(f"[bold red]エラー:[/bold red] ファイル '{input_excel_path}' が見つかりません。")
     except Exception as e:
         console.print(f"[bold red]エラー:[/bold red] 処理中に問題が発生しました。")
         console.print_exception(show_locals=True)  # 詳細なエラー情報を表示
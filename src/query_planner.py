@@ -0,0 +1,147 @@
+import threading
+import unicodedata
+from concurrent.futures import Future
+
+from pipeline import KEYWORD_SUFFIX, _is_missing
+from watch_info_extractor import WATCH_INFO_SCHEMA
+
+GROUP_MAX_RESULTS = 20  # まとめた検索の最大取得数（Tavily の max_results の上限）
+MIN_GROUP_ROWS = 2      # この行数以上が同じブランド・型番の場合だけ検索をまとめる
+BRACELET_TYPES = WATCH_INFO_SCHEMA["properties"]["bracelet_type"]["enum"]
+UNKNOWN_VALUES = ("", "不明", "そのほか")  # 抽出結果がこの値の場合は行の振り分けに使わない
+
+
+def _normalize(value) -> str:
+    """比較用に正規化する（全角/半角・大文字/小文字・空白の揺れを吸収）。空欄は空文字列"""
+    if _is_missing(value):
+        return ""
+    return "".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+
+def _bracelet_type(value) -> str:
+    """行のブレス形状を抽出スキーマの選択肢に揃える（最も長く一致する選択肢。なければ空文字列）"""
+    normalized = _normalize(value)
+    matches = [bracelet for bracelet in BRACELET_TYPES if _normalize(bracelet) in normalized]
+    return _normalize(max(matches, key=len)) if matches else ""
+
+
+def matches_row(watch_detail: dict, row) -> bool:
+    """
+    まとめた検索で見つかった商品が、行の文字盤色・ブレス形状に合うかどうか
+    行または抽出結果のどちらかが空欄・不明の項目は判定に使わない（合うものとして残す）
+    """
+    row_dial = _normalize(row.get("文字盤色"))
+    dial = _normalize(watch_detail.get("dial_color"))
+    if row_dial and dial not in UNKNOWN_VALUES and row_dial not in dial and dial not in row_dial:
+        return False
+    row_bracelet = _bracelet_type(row.get("ブレス形状"))
+    bracelet = _normalize(watch_detail.get("bracelet_type"))
+    if row_bracelet and bracelet not in UNKNOWN_VALUES and row_bracelet != bracelet:
+        return False
+    return True
+
+
+class QueryPlanner:
+    """
+    同じブランド・型番の行（文字盤色・ブレス形状違い）の検索を1回にまとめる
+    処理の前に plan() で行をブランド・型番ごとに数え、MIN_GROUP_ROWS 行以上のグループは
+    「ブランド 型番 中古」で max_results 件まで1回だけ検索し、抽出後に文字盤色・ブレス形状で各行に振り分ける
+    検索結果はグループの全行が受け取ったら破棄し、行数が多くてもグループ数分だけを保持する
+    複数スレッドから共有して利用できる
+    """
+
+    def __init__(self, max_results: int = GROUP_MAX_RESULTS, min_group_rows: int = MIN_GROUP_ROWS):
+        """
+        パラメータ:
+        max_results (int): まとめた検索の最大取得数
+        min_group_rows (int): 検索をまとめる最小の行数
+        """
+        self.max_results = max_results
+        self.min_group_rows = min_group_rows
+        self._remaining = {}  # グループ -> まだ検索結果を受け取っていない行数
+        self._searches = {}   # グループ -> 検索結果の Future
+        self._lock = threading.Lock()
+        self.groups = 0        # 検索をまとめたグループ数
+        self.grouped_rows = 0  # 検索をまとめた行数
+        self.saved_searches = 0  # まとめたことで行わなかった検索の回数
+
+    @staticmethod
+    def group_key(row):
+        """行のグループ（正規化したブランドと型番）。型番が空欄の場合は None"""
+        model_number = _normalize(row.get("型番"))
+        if not model_number:
+            return None
+        return _normalize(row.get("ブランド")), model_number
+
+    def plan(self, rows):
+        """
+        処理する行をブランド・型番ごとに数え、検索をまとめるグループを決める
+        パラメータ:
+        rows (Iterable[tuple]): (行番号, 行データ) の組
+        """
+        counts = {}
+        for _, row in rows:
+            key = self.group_key(row)
+            if key is not None:
+                counts[key] = counts.get(key, 0) + 1
+        with self._lock:
+            self._remaining = {key: count for key, count in counts.items() if count >= self.min_group_rows}
+            self._searches = {}
+            self.groups = len(self._remaining)
+            self.grouped_rows = sum(self._remaining.values())
+
+    def is_grouped(self, row) -> bool:
+        """行の検索をグループでまとめるかどうか"""
+        with self._lock:
+            return self.group_key(row) in self._remaining
+
+    @staticmethod
+    def group_keywords(row) -> str:
+        """グループの検索キーワード（ブランド 型番 中古）"""
+        parts = [str(row.get(column)).strip() for column in ("ブランド", "型番") if not _is_missing(row.get(column))]
+        return " ".join([part for part in parts if part] + [KEYWORD_SUFFIX])
+
+    def search(self, row, search):
+        """
+        行のグループの検索結果を返す。グループで最初の行だけが search を呼び出し、他の行はその結果を待って再利用する
+        パラメータ:
+        search (Callable[..., list]): 検索キーワードと max_results を受け取り、検索結果を返す関数
+        """
+        key = self.group_key(row)
+        with self._lock:
+            future = self._searches.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._searches[key] = Future()
+            else:
+                self.saved_searches += 1
+        try:
+            if is_owner:
+                try:
+                    future.set_result(search(self.group_keywords(row), max_results=self.max_results))
+                except Exception as e:
+                    future.set_exception(e)
+            return future.result()
+        finally:
+            # グループの全行が受け取ったら検索結果を破棄する
+            self.release(row)
+
+    def release(self, row):
+        """検索せずに結果を返した行（キャッシュ済みなど）をグループの残り行数から除く（全行がそろえば検索結果を破棄する）"""
+        key = self.group_key(row)
+        with self._lock:
+            if key not in self._remaining:
+                return
+            self._remaining[key] -= 1
+            if self._remaining[key] <= 0:
+                del self._remaining[key]
+                self._searches.pop(key, None)
+
+    @staticmethod
+    def matches(watch_detail: dict, row) -> bool:
+        """まとめた検索で見つかった商品を行に振り分けるかどうか（matches_row）"""
+        return matches_row(watch_detail, row)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"groups": self.groups, "grouped_rows": self.grouped_rows, "saved_searches": self.saved_searches}
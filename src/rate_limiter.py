@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+import time
+import logging
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# API ごとのデフォルト上限（環境変数 <NAME>_RPM / <NAME>_TPM で上書き可能。0 の場合は無制限）
+DEFAULT_LIMITS = {
+    "tavily": {"requests_per_minute": 100, "tokens_per_minute": 0},
+    "openai": {"requests_per_minute": 500, "tokens_per_minute": 200000},
+}
+MIN_RATE_FACTOR = 0.1        # 429 を受けた際に下げられる速度係数の下限
+RATE_DECREASE_FACTOR = 0.5   # 429 を受けた際に速度係数へ掛ける値
+RATE_RECOVERY_STEP = 0.05    # 成功時に速度係数へ加算する値
+DEFAULT_BACKOFF_SECONDS = 5  # Retry-After が無い 429 の場合の一時停止時間（秒）
+_NON_ASCII = re.compile(r"[^\x00-\x7f]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのおおよそのトークン数を見積もる
+    日本語は1文字あたり約1トークン、英数字は約4文字で1トークンとして概算する
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text) if text.isascii() else len(_NON_ASCII.sub("", text))
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """例外が 429 (レート制限) を表すかどうかを判定する"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return type(error).__name__ in ("RateLimitError", "UsageLimitExceededError")
+
+
+def get_retry_after(error: Exception):
+    """例外から Retry-After（秒）を取り出す。取得できなければ None を返す"""
+    retry_after = getattr(error, "retry_after_seconds", None)
+    if retry_after is not None:
+        return float(retry_after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _TokenBucket:
+    """1分あたりの上限から補充速度を決めるトークンバケット（ロックは呼び出し側で取得する）"""
+
+    def __init__(self, per_minute: float, now: float):
+        self.per_minute = per_minute
+        self.available = float(per_minute)
+        self.updated_at = now
+
+    def refill(self, now: float, factor: float):
+        capacity = max(1.0, self.per_minute * factor)
+        elapsed = now - self.updated_at
+        self.available = min(capacity, self.available + elapsed * self.per_minute * factor / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount: float, factor: float) -> float:
+        """amount を取得できるまでの待機秒数（0 なら即時取得可能）"""
+        capacity = max(1.0, self.per_minute * factor)
+        amount = min(amount, capacity)  # 1回の要求がバケット容量を超えても永久に待たないようにする
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / (self.per_minute * factor)
+
+
+class RateLimiter:
+    """
+    API ごとのリクエスト数/分・トークン数/分を制御するトークンバケット型のレート制限クラス
+    429 を受けると速度を下げて一時停止し、成功が続くと徐々に元の速度へ戻す（AIMD）
+    再試行は retry.ApiCaller が行う
+    """
+
+    def __init__(self, name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+        パラメータ:
+        name (str): API 名（メトリクス名・ログに使う）
+        requests_per_minute (int): リクエスト数/分の上限（0 の場合は無制限）
+        tokens_per_minute (int): トークン数/分の上限（0 の場合は無制限）
+        clock (Callable[[], float]) / sleep (Callable[[float], None]): 時刻の取得と待機（テストで差し替える）
+        """
+        self.name = name
+        self.clock = clock
+        self.sleep = sleep
+        self.requests = _TokenBucket(requests_per_minute, clock()) if requests_per_minute else None
+        self.tokens = _TokenBucket(tokens_per_minute, clock()) if tokens_per_minute else None
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0):
+        """リクエスト1件分（と tokens 分のトークン）の枠が空くまで待機して確保する（待機時間は <name>_rate_limit_wait に記録）"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                wait = max(0.0, self.paused_until - now)
+                if wait == 0.0:
+                    for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                        if bucket is not None and amount:
+                            bucket.refill(now, self.rate_factor)
+                            wait = max(wait, bucket.wait_time(amount, self.rate_factor))
+                if wait == 0.0:
+                    if self.requests is not None:
+                        self.requests.available -= 1
+                    if self.tokens is not None and tokens:
+                        self.tokens.available -= min(tokens, self.tokens.available)
+                    break
+            self.sleep(wait)
+            waited += wait
+        if waited:
+            get_metrics().observe(f"{self.name}_rate_limit_wait", waited)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """見積もりと実際のトークン使用量の差分をバケットに反映する"""
+        if self.tokens is None or actual_tokens is None:
+            return
+        with self._lock:
+            self.tokens.available -= actual_tokens - estimated_tokens
+
+    def on_success(self):
+        """成功時に速度係数を少しずつ戻す"""
+        if self.rate_factor < 1.0:
+            with self._lock:
+                self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after: float = None):
+        """429 を受けた際に速度係数を下げ、Retry-After（なければ既定値）の間すべての呼び出しを止める"""
+        with self._lock:
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * RATE_DECREASE_FACTOR)
+            pause = retry_after if retry_after is not None else DEFAULT_BACKOFF_SECONDS
+            self.paused_until = max(self.paused_until, self.clock() + pause)
+        logger.warning(f"{self.name}: レート制限を検知しました。{pause:.1f}秒停止し、速度係数を {self.rate_factor:.2f} に下げます。")
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _read_limit(env_name: str, default: int) -> int:
+    value = os.getenv(env_name)
+    if value is None or value.strip() == "":
+        return default
+    return int(value)
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    API 名ごとにプロセス全体で共有する RateLimiter を返す
+    上限は環境変数 <NAME>_RPM（リクエスト数/分）と <NAME>_TPM（トークン数/分）で設定する
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            defaults = DEFAULT_LIMITS.get(name, {})
+            prefix = name.upper()
+            _limiters[name] = RateLimiter(
+                name,
+                requests_per_minute=_read_limit(f"{prefix}_RPM", defaults.get("requests_per_minute", 0)),
+                tokens_per_minute=_read_limit(f"{prefix}_TPM", defaults.get("tokens_per_minute", 0)),
+            )
+        return _limiters[name]
@@ -0,0 +1,137 @@
+import argparse
+from pathlib import Path
+
+from listing_store import iter_result_file
+
+# 結果テーブルの列: json_normalize で展開した項目 -> 列名（accessories 内のキーも展開）
+TABLE_COLUMNS = {
+    "input_keywords": "検索キーワード",
+    "name": "商品名",
+    "model_number": "型番",
+    "dial_color": "文字盤色",
+    "bracelet_type": "ブレス形状",
+    "price": "価格",
+    "seller": "販売店",
+    "warranty_date": "保証書日付",
+    "accessories.has_warranty_card": "保証書あり",
+    "accessories.has_box": "箱あり",
+    "accessories.other_description": "付属品詳細",
+    "condition": "状態",
+    "url": "URL",
+    "error": "エラー",
+}
+OUTPUT_COLUMNS = list(TABLE_COLUMNS.values())
+NO_RESULT_NAME = "該当なし"  # 検索結果が0件の行の商品名
+# 書き出し形式 -> 拡張子（parquet / arrow は pyarrow が必要）
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "xlsx": ".xlsx"}
+EXCEL_PRICE_FORMAT = '"¥"#,##0'  # Excel では価格を数値のまま保存し、表示形式で円表記にする
+
+
+def results_to_frame(rows):
+    """
+    処理結果（pipeline.row_result の形式）を、商品1件を1行とする結果テーブルに展開する
+    商品の展開は pandas.json_normalize でまとめて行い、価格は数値（Int64）、付属品の有無は真偽値（boolean）の列にする
+    行レベルのエラーがあった行・検索結果が0件の行は、検索キーワードとエラー（または「該当なし」）だけの1行にする
+    パラメータ:
+    rows (Iterable[dict]): 入力順の処理結果
+    戻り値:
+    pandas.DataFrame: OUTPUT_COLUMNS の列を持つ結果テーブル（入力順）
+    """
+    import pandas as pd
+
+    listing_rows, placeholder_rows = [], []
+    for position, row in enumerate(rows):
+        if row.get("row_error") or not row.get("extracted_results"):
+            placeholder_rows.append({
+                "_row": position, "input_keywords": row.get("input_keywords"),
+                "name": None if row.get("row_error") else NO_RESULT_NAME, "error": row.get("row_error"),
+            })
+        else:
+            listing_rows.append({"_row": position, "input_keywords": row.get("input_keywords"),
+                                 "extracted_results": row["extracted_results"]})
+
+    frames = []
+    if listing_rows:
+        frames.append(pd.json_normalize(listing_rows, record_path="extracted_results", meta=["_row", "input_keywords"]))
+    if placeholder_rows:
+        frames.append(pd.DataFrame(placeholder_rows))
+    if not frames:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS)
+    frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    frame = frame.sort_values("_row", kind="stable").reindex(columns=list(TABLE_COLUMNS)).reset_index(drop=True)
+    frame["price"] = pd.to_numeric(frame["price"], errors="coerce").astype("Int64")
+    for column in ("accessories.has_warranty_card", "accessories.has_box"):
+        frame[column] = frame[column].astype("boolean")
+    return frame.rename(columns=TABLE_COLUMNS)
+
+
+def format_for_display(frame):
+    """
+    結果テーブルを画面表示用に整形する（価格を「¥1,234,567」の文字列にし、空欄を空文字列にする）
+    商品の行で価格がない場合は N/A と表示する
+    """
+    display = frame.astype(object).where(frame.notna(), "")
+    prices = frame["価格"]
+    display["価格"] = ("¥" + prices.astype(object).map("{:,}".format, na_action="ignore")).where(
+        prices.notna(), frame["URL"].notna().map({True: "N/A", False: ""})).astype(object)  # 行ごとに整形して連結しても型をそろえる
+    return display
+
+
+def export_results(frame, path):
+    """
+    結果テーブルをファイルに書き出す（拡張子で形式を判定: .parquet / .arrow / .xlsx）
+    価格などの型はそのまま保存し、Excel では表示形式だけを円表記にする
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    suffix = path.suffix.lower()
+    if suffix in (EXPORT_FORMATS["parquet"], EXPORT_FORMATS["arrow"]):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Parquet / Arrow 形式の書き出しには pyarrow が必要です (uv sync --extra parquet)") from e
+        if suffix == EXPORT_FORMATS["parquet"]:
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_feather(path)
+    elif suffix == EXPORT_FORMATS["xlsx"]:
+        import pandas as pd
+
+        with pd.ExcelWriter(path, engine="openpyxl") as writer:
+            frame.to_excel(writer, index=False, sheet_name="result")
+            sheet = writer.sheets["result"]
+            price_column = OUTPUT_COLUMNS.index("価格") + 1
+            for (cell,) in sheet.iter_rows(min_row=2, min_col=price_column, max_col=price_column):
+                cell.number_format = EXCEL_PRICE_FORMAT
+    else:
+        raise ValueError(f"対応していない書き出し形式です: {path.name} (対応形式: {', '.join(EXPORT_FORMATS.values())})")
+    return path
+
+
+def export_path_for(input_path, export_format):
+    """
+    書き出し先のパス（出力ファイルの拡張子 .gz・.jsonl/.json だけを除き、書き出し形式の拡張子にする）
+    例: result.jsonl.gz -> result.parquet / run.2024-05-01.jsonl.gz -> run.2024-05-01.parquet
+    """
+    input_path = Path(input_path)
+    name = input_path.name
+    for suffixes in ((".gz",), (".jsonl", ".json")):
+        name = next((name[:-len(suffix)] for suffix in suffixes if name.endswith(suffix)), name)
+    return input_path.with_name(name + EXPORT_FORMATS[export_format])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='出力ファイル (result.json / .jsonl) を結果テーブルとして Parquet / Arrow / Excel に書き出すスクリプト')
+    parser.add_argument('input', help='入力ファイル (.json / .jsonl / .jsonl.gz)')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), nargs='+', default=['parquet'],
+                        help='書き出し形式 (複数指定可、デフォルト: parquet)')
+    args = parser.parse_args()
+
+    frame = results_to_frame(iter_result_file(args.input))
+    for export_format in args.format:
+        path = export_results(frame, export_path_for(args.input, export_format))
+        print(f"{len(frame)} 件を '{path}' に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import gzip
+import json
+import os
+import textwrap
+from pathlib import Path
+
+
+def write_json_array(path, rows):
+    """
+    行データを1件ずつ書き出して JSON 配列のファイルを作成する
+    json.dump(rows, f, ensure_ascii=False, indent=2) と同じ形式になるが、全件をメモリに保持しない
+    パラメータ:
+    path (str | Path): 出力先のファイルパス
+    rows (Iterable[dict]): 行データ（ジェネレータ可）
+    戻り値:
+    int: 書き出した行数
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write("[\n" if count == 0 else ",\n")
+            f.write(textwrap.indent(json.dumps(row, ensure_ascii=False, indent=2), "  "))
+            count += 1
+        f.write("\n]" if count else "[]")
+        f.flush()  # 強制的にバッファをフラッシュ
+        os.fsync(f.fileno())  # OSレベルでの書き込み完了を保証
+    return count
+
+
+def is_gzip_path(path) -> bool:
+    return Path(path).suffix == ".gz"
+
+
+def _open_text(path, mode):
+    """拡張子が .gz の場合は gzip として開く"""
+    if is_gzip_path(path):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class JsonlWriter:
+    """
+    行データを1行1件の JSON (JSONL / NDJSON) として逐次書き出すクラス
+    1件ごとに flush するため、実行中でも書き出し済みの行を読み取れる（tail -f 等）
+    拡張子が .gz の場合は gzip 圧縮して書き出す（flush ごとに同期フラッシュするので途中まで展開できる）
+    """
+
+    def __init__(self, path):
+        """
+        パラメータ:
+        path (str | Path): 出力先のファイルパス（.jsonl または .jsonl.gz）
+        """
+        self.path = Path(path)
+        self.count = 0
+        self._file = _open_text(self.path, "w")
+
+    def write(self, row: dict):
+        """1行分のデータを書き出す"""
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            # gzip の終端まで書き終えてから、OSレベルでの書き込み完了を保証
+            with open(self.path, "rb") as f:
+                os.fsync(f.fileno())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_jsonl(path):
+    """JSONL（.gz 可）ファイルの行データを1件ずつ読み出す（書き込み途中の末尾行は読み飛ばす）"""
+    with _open_text(path, "r") as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                if line.strip():
+                    yield json.loads(line)
+        except EOFError:
+            # 実行中の gzip ファイル（終端が未書き込み）は読めたところまでを返す
+            return
+
+
+def convert_jsonl_to_json(jsonl_path, json_path) -> int:
+    """JSONL（.gz 可）の出力を、通常の result.json と同じ形式（インデント付き JSON 配列）に変換する"""
+    return write_json_array(json_path, iter_jsonl(jsonl_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSONL形式の出力 (--output-format jsonl) を result.json と同じ形式のJSONに変換するスクリプト')
+    parser.add_argument('input', help='入力JSONLファイル (.jsonl / .jsonl.gz)')
+    parser.add_argument('output', help='出力JSONファイル')
+    args = parser.parse_args()
+    count = convert_jsonl_to_json(args.input, args.output)
+    print(f"{count} 行を '{args.output}' に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
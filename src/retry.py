@@ -0,0 +1,239 @@
+import random
+import threading
+import time
+import logging
+
+from rate_limiter import get_rate_limiter, is_rate_limit_error, get_retry_after, DEFAULT_BACKOFF_SECONDS
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# API ごとの再試行の設定
+# max_attempts: 最大試行回数 / deadline: 再試行を含めた1回の呼び出し全体の期限（秒） / attempt_timeout: 1回の試行のタイムアウト（秒）
+DEFAULT_POLICIES = {
+    "tavily": {"max_attempts": 4, "deadline": 120.0, "attempt_timeout": 60.0},
+    "openai": {"max_attempts": 4, "deadline": 180.0, "attempt_timeout": 90.0},
+}
+BASE_BACKOFF_SECONDS = 1.0         # 指数バックオフの初回待ち時間の上限（秒）
+MAX_BACKOFF_SECONDS = 30.0         # 指数バックオフの待ち時間の上限（秒）
+CIRCUIT_FAILURE_THRESHOLD = 5      # 連続で何回失敗したら API 停止とみなして呼び出しを止めるか
+CIRCUIT_RECOVERY_SECONDS = 30.0    # 呼び出しを止めてから試しに1件呼び出すまでの時間（秒）
+# ステータスコードを持たない一時的なエラー（接続エラー・タイムアウト）の例外クラス名
+TRANSIENT_ERROR_NAMES = (
+    "APIConnectionError", "APITimeoutError", "TimeoutError", "Timeout", "ReadTimeout", "ConnectTimeout",
+    "ConnectionError", "ChunkedEncodingError", "RemoteDisconnected",
+)
+
+
+class CircuitOpenError(Exception):
+    """API が停止中と判定され、期限内に呼び出しを再開できなかった場合の例外"""
+
+
+def error_status_code(error: Exception):
+    """例外から HTTP ステータスコードを取り出す。取得できなければ None を返す"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """再試行で回復する見込みのある一時的なエラー（429・5xx・408・接続エラー・タイムアウト）かどうかを判定する"""
+    if is_rate_limit_error(error):
+        return True
+    status_code = error_status_code(error)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 408
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+class RetryPolicy:
+    """再試行の回数・期限と、指数バックオフ（フルジッター）の待ち時間を決めるクラス"""
+
+    def __init__(self, max_attempts: int = 4, deadline: float = 120.0, attempt_timeout: float = None,
+                 base_delay: float = BASE_BACKOFF_SECONDS, max_delay: float = MAX_BACKOFF_SECONDS):
+        """
+        パラメータ:
+        max_attempts (int): 最大試行回数（1 の場合は再試行しない）
+        deadline (float): 再試行を含めた1回の呼び出し全体の期限（秒）
+        attempt_timeout (float): 1回の試行のタイムアウト（秒）。None の場合は API クライアントの既定値
+        base_delay (float): 初回の待ち時間の上限（秒）。試行ごとに2倍になる
+        max_delay (float): 待ち時間の上限（秒）
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        """attempt 回目（0始まり）の失敗後の待ち時間。0〜上限の一様乱数にして、同時に失敗した呼び出しの再試行をずらす"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    API が停止しているときに呼び出しをまとめて止めるサーキットブレーカー
+    一時的なエラーが failure_threshold 回続くと開き（全スレッドの呼び出しを止める）、
+    recovery_seconds 後に1件だけ試しに呼び出して、成功すれば閉じ、失敗すればまた止める
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 recovery_seconds: float = CIRCUIT_RECOVERY_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"  # closed=通常 / open=停止中 / half_open=試しに1件呼び出し中
+        self.failures = 0
+        self.opened_at = 0.0
+        self._condition = threading.Condition()
+
+    def before_call(self, deadline: float):
+        """
+        呼び出してよい状態になるまで待つ
+        パラメータ:
+        deadline (float): time.monotonic() 基準の期限。期限までに再開できない場合は CircuitOpenError
+        戻り値:
+        bool: この呼び出しが試しの1件の場合は True（結果を on_success / on_failure で記録しなかった場合は release_trial を呼ぶ）
+        """
+        waited_from = None
+        trial = False
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == "closed":
+                    break
+                if self.state == "open" and now >= self.opened_at + self.recovery_seconds:
+                    self.state = "half_open"  # この呼び出しを試しの1件にする
+                    trial = True
+                    break
+                # 停止中、または試しの1件の結果待ち
+                resume_at = self.opened_at + self.recovery_seconds if self.state == "open" else deadline
+                if resume_at > deadline or now >= deadline:
+                    raise CircuitOpenError(f"{self.name}: API が停止中のため呼び出しを中止しました。")
+                waited_from = waited_from or now
+                self._condition.wait(max(0.0, min(resume_at, deadline) - now))
+        if waited_from is not None:
+            get_metrics().observe(f"{self.name}_circuit_wait", time.monotonic() - waited_from)
+        return trial
+
+    def on_success(self):
+        """API が応答した（成功、または一時的でないエラー）場合に呼ぶ"""
+        with self._condition:
+            if self.state != "closed":
+                logger.info(f"{self.name}: API の応答が回復したため呼び出しを再開します。")
+            self.state = "closed"
+            self.failures = 0
+            self._condition.notify_all()
+
+    def release_trial(self):
+        """
+        試しの1件が成功・失敗を記録せずに終わった場合（KeyboardInterrupt など）に呼ぶ
+        試しの枠を空けて停止中に戻し、次の呼び出しをすぐに試しの1件にする（結果を記録済みの場合は何もしない）
+        """
+        with self._condition:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic() - self.recovery_seconds
+                self._condition.notify_all()
+
+    def on_failure(self):
+        """一時的なエラー（5xx・接続エラー・タイムアウト）の場合に呼ぶ"""
+        with self._condition:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                get_metrics().increment(f"{self.name}_circuit_opened")
+                logger.warning(f"{self.name}: エラーが {self.failures} 回続いたため、{self.recovery_seconds:.0f}秒間呼び出しを止めます。")
+            self._condition.notify_all()
+
+
+class ApiCaller:
+    """
+    レート制限・再試行・サーキットブレーカーをまとめて適用して API を呼び出すクラス
+    tavily_processor と WatchInfoExtractor が共通で使う
+    """
+
+    def __init__(self, name: str, rate_limiter=None, circuit_breaker: CircuitBreaker = None, policy: RetryPolicy = None,
+                 timeout_argument: str = "timeout"):
+        """
+        パラメータ:
+        name (str): API 名（メトリクス名・ログに使う）
+        rate_limiter (RateLimiter): レート制限。None の場合はプロセス全体で共有するもの
+        circuit_breaker (CircuitBreaker): None の場合は新しく作る
+        policy (RetryPolicy): 再試行の設定。None の場合は DEFAULT_POLICIES の値
+        timeout_argument (str): 試行ごとのタイムアウトを渡す引数名。None の場合は渡さない
+        """
+        self.name = name
+        self.rate_limiter = rate_limiter or get_rate_limiter(name)
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(name)
+        self.policy = policy or RetryPolicy(**DEFAULT_POLICIES.get(name, {}))
+        self.timeout_argument = timeout_argument
+
+    def call(self, func, *args, tokens: int = 0, **kwargs):
+        """
+        func を呼び出し、一時的なエラーの場合は期限内で再試行する
+        429 は Retry-After（なければ既定値）だけ API 全体の呼び出しを止めてから、
+        5xx・接続エラー・タイムアウトは指数バックオフで待ってから再試行する
+        パラメータ:
+        func (callable): API を呼び出す関数
+        tokens (int): レート制限（トークン数/分）用の見積もりトークン数
+        戻り値:
+        func の戻り値
+        """
+        metrics = get_metrics()
+        deadline = time.monotonic() + self.policy.deadline
+        for attempt in range(self.policy.max_attempts):
+            trial = self.circuit_breaker.before_call(deadline)
+            try:
+                self.rate_limiter.acquire(tokens)
+                if self.timeout_argument and self.policy.attempt_timeout and self.timeout_argument not in kwargs:
+                    call_kwargs = dict(kwargs)
+                    call_kwargs[self.timeout_argument] = max(1.0, min(self.policy.attempt_timeout, deadline - time.monotonic()))
+                else:
+                    call_kwargs = kwargs
+                try:
+                    result = func(*args, **call_kwargs)
+                except Exception as e:
+                    if not is_retryable_error(e):
+                        self.circuit_breaker.on_success()  # API 自体は応答している
+                        raise
+                    if is_rate_limit_error(e):
+                        self.circuit_breaker.on_success()
+                        retry_after = get_retry_after(e)
+                        self.rate_limiter.on_rate_limited(retry_after)  # 次の acquire で Retry-After の間待つ
+                        delay = 0.0
+                        wait_estimate = retry_after if retry_after is not None else DEFAULT_BACKOFF_SECONDS
+                    else:
+                        self.circuit_breaker.on_failure()
+                        delay = self.policy.backoff(attempt)
+                        wait_estimate = delay
+                    if attempt == self.policy.max_attempts - 1 or time.monotonic() + wait_estimate >= deadline:
+                        raise
+                    metrics.increment(f"{self.name}_retries")
+                    logger.info(f"{self.name}: 一時的なエラーのため再試行します ({attempt + 1}/{self.policy.max_attempts - 1}): {e!r}")
+                    if delay:
+                        time.sleep(delay)
+                    continue
+                self.circuit_breaker.on_success()
+                self.rate_limiter.on_success()
+                return result
+            finally:
+                if trial:
+                    # 試しの1件が中断された場合も枠を空け、後続の呼び出しが止まったままにならないようにする
+                    self.circuit_breaker.release_trial()
+
+
+_callers = {}
+_callers_lock = threading.Lock()
+
+
+def get_api_caller(name: str) -> ApiCaller:
+    """API 名ごとにプロセス全体で共有する ApiCaller を返す（サーキットブレーカーも全スレッドで共有される）"""
+    with _callers_lock:
+        if name not in _callers:
+            _callers[name] = ApiCaller(name)
+        return _callers[name]
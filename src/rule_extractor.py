@@ -0,0 +1,280 @@
+import re
+import threading
+import unicodedata
+
+from metrics import get_metrics
+
+DEFAULT_MIN_CONFIDENCE = 0.8  # この信頼度以上の項目はルールの結果を使い、LLM には問い合わせない
+MIN_PRICE = 100_000           # 価格として扱う範囲（円）
+MAX_PRICE = 100_000_000
+MAX_VALUE_CHARS = 60          # 項目の値として取り出す最大文字数
+
+TITLE_PREFIX = "【楽天市場】"    # 楽天市場の商品ページのタイトル行の先頭
+
+# 項目名（ラベル）→ 抽出する項目。ページの「【型番】126500LN」「型番：126500LN」「型番\n126500LN」形式の行から値を取り出す
+FIELD_LABELS = {
+    "model_number": ["型番", "型番(型式番号)", "型式番号", "型式", "メーカー型番", "型番/モデル名", "品番", "リファレンス"],
+    "dial_color": ["文字盤", "文字盤カラー", "文字盤色", "ダイヤル", "ダイアル", "時計の文字盤の代表カラー"],
+    "bracelet": ["ブレスレット", "ブレス", "ブレス形状", "ベルト", "バンド"],
+    "condition": ["状態", "商品の状態", "状態ランク", "商品ランク", "コンディション"],
+    "accessories": ["付属品", "付属"],
+}
+LABEL_FIELDS = {label: field for field, labels in FIELD_LABELS.items() for label in labels}
+BRACKET_LABEL = re.compile(r"^【([^】]{1,15})】\s*(.*)$")
+COLON_LABEL = re.compile(r"^([^:\s]{1,15})\s*:\s*(.*)$")
+
+# ブレス形状（スキーマの enum）。長い名前から順に照合する
+BRACELET_TYPES = [
+    ("オイスターフレックス", "オイスターフレックス"), ("パールマスター", "パールマスター"), ("プレジデント", "プレジデント"),
+    ("ジュビリー", "ジュビリー"), ("オイスター", "オイスター"), ("レザー", "レザー"), ("革", "レザー"),
+]
+HEADLINE_PRICE = re.compile(r"^([\d,]{5,})\s*(円)?$")
+WARRANTY_WORDS = re.compile(r"保証書|ギャランティ|保証カード|保証証明書|warranty|guarantee", re.IGNORECASE)
+NO_WARRANTY = re.compile(r"(保証書|ギャランティ(ー)?カード|保証カード)\s*(なし|無し|無|欠品)")
+BOX_WORDS = re.compile(r"箱|BOX|ボックス|専用ケース|内箱|外箱", re.IGNORECASE)
+NO_BOX = re.compile(r"(箱|BOX|ボックス)\s*(なし|無し|無|欠品)", re.IGNORECASE)
+WARRANTY_DATE = re.compile(r"(\d{4})\s*[年/.]\s*(\d{1,2})\s*月?")
+WARRANTY_YEAR = re.compile(r"(\d{4})\s*年")
+ACCESSORY_SEPARATORS = re.compile(r"[\s・/、,]+")
+ACCESSORY_NOISE = re.compile(r"^(あり|有り|有|付き|付|その他|メーカー|純正|[\d年月/.\-]+)$")
+ACCESSORY_LINE = re.compile(r"保証|ギャランティ|箱|BOX|ボックス|ケース|冊子|説明書|タグ|カード|コマ|付属", re.IGNORECASE)
+PARENTHESES = re.compile(r"\([^)]*\)")
+# 状態として信頼できる記載（ランク・未使用など）。「中古」だけの記載は楽天共通の項目のため信頼度を下げる
+CONDITION_WORDS = re.compile(r"ランク|未使用|新品|美品|新古|^[NSABC][A-Z+\-]?$|使用感|傷")
+DIAL_COLORS = [
+    "アイスブルー", "ブラック", "ホワイト", "ブルー", "グリーン", "シルバー", "グレー", "ゴールド", "シャンパン",
+    "ピンク", "ブラウン", "チョコレート", "レッド", "イエロー", "パープル", "オレンジ", "メテオライト", "マザーオブパール",
+    "黒", "白", "青", "緑", "銀", "金",
+]
+DIAL_IN_TITLE = re.compile("(" + "|".join(DIAL_COLORS) + ")(文字盤|ダイヤル)")
+TITLE_TAGS = re.compile(r"【[^】]*】|〔[^〕]*〕|\[[^\]]*\]|＜[^＞]*＞")
+TITLE_NOISE = re.compile(r"\b(中古|新品|未使用|送料無料|メンズ|レディース|腕時計|時計)\b")
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text)
+
+
+def _clip(value: str) -> str:
+    return value.strip()[:MAX_VALUE_CHARS] or None
+
+
+def split_title(title_line: str):
+    """
+    ページタイトル「【楽天市場】商品名：ショップ名」を分割する
+    戻り値:
+    (str, str): (商品名部分, ショップ名)。楽天市場のタイトル形式でない場合は ("", None)
+    """
+    title_line = _normalize(title_line).strip()
+    if not title_line.startswith(TITLE_PREFIX) or ":" not in title_line:
+        return "", None
+    title, _, seller = title_line[len(TITLE_PREFIX):].rpartition(":")
+    return title, _clip(seller)
+
+
+def title_seller(text: str):
+    """ページ本文の先頭のタイトル行からショップ名（出品者）を返す。取り出せない場合は None"""
+    lines = (text or "").strip().splitlines()
+    return split_title(lines[0])[1] if lines else None
+
+
+class RuleExtractor:
+    """
+    LLM を使わずに、楽天の商品ページの定型的な記載（価格・型番・付属品など）から時計情報を抽出するクラス
+    WatchInfoExtractor.extract_info と同じスキーマの結果と、項目ごとの信頼度（0〜1）を返す
+    信頼度が min_confidence 未満の項目だけを LLM に問い合わせるために使う
+    """
+
+    def __init__(self, min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        """
+        パラメータ:
+        min_confidence (float): ルールの結果を確定とみなす信頼度の下限
+        """
+        self.min_confidence = min_confidence
+        self.documents = 0       # 抽出したページ数
+        self.fast_path = 0       # 全項目をルールで確定できた（LLM を呼ばなかった）ページ数
+        self.llm_fields = 0      # LLM に問い合わせた項目数の合計
+        self._lock = threading.Lock()
+
+    # --- ページの解析 ---
+    @staticmethod
+    def _labeled_values(lines):
+        """ラベル付きの行から (項目, 値) を出現順に取り出す"""
+        values = []
+        for i, line in enumerate(lines):
+            match = BRACKET_LABEL.match(line) or COLON_LABEL.match(line)
+            label, value = (match.group(1), match.group(2)) if match else (line, "")
+            field = LABEL_FIELDS.get(label.replace(" ", ""))
+            if field is None:
+                continue
+            if not value:
+                # 値が次の行にある形式（付属品は複数行にわたることがあるため次のラベルまでまとめる）
+                following = []
+                for next_line in lines[i + 1:i + 4]:
+                    if BRACKET_LABEL.match(next_line) or next_line.replace(" ", "") in LABEL_FIELDS:
+                        break
+                    if following and not ACCESSORY_LINE.search(next_line):
+                        break
+                    following.append(next_line)
+                    if field != "accessories":
+                        break
+                value = " ".join(following)
+            if value:
+                values.append((field, value))
+        return values
+
+    @staticmethod
+    def _headline_price(lines):
+        """商品名の直後に表示される価格（同じ価格が複数回表示されていれば信頼度を上げる）"""
+        prices = []
+        for i, line in enumerate(lines):
+            match = HEADLINE_PRICE.match(line)
+            if not match or (match.group(2) is None and (i + 1 >= len(lines) or lines[i + 1] != "円")):
+                continue
+            price = int(match.group(1).replace(",", ""))
+            if MIN_PRICE <= price < MAX_PRICE:
+                prices.append(price)
+        if not prices:
+            return None, 0.0
+        return prices[0], 0.9 if prices.count(prices[0]) >= 2 else 0.6
+
+    @staticmethod
+    def _parse_accessories(value: str):
+        """付属品の記載から (保証書の有無, 箱の有無, その他の付属品, 保証書の日付) を取り出す"""
+        has_warranty = False if NO_WARRANTY.search(value) else bool(WARRANTY_WORDS.search(value))
+        has_box = False if NO_BOX.search(value) else bool(BOX_WORDS.search(value))
+        others = []
+        for token in ACCESSORY_SEPARATORS.split(PARENTHESES.sub(" ", value)):
+            token = token.split(":")[-1] if ":" in token and WARRANTY_WORDS.search(token) is None else token
+            if not token or WARRANTY_WORDS.search(token) or BOX_WORDS.search(token) or ACCESSORY_NOISE.match(token):
+                continue
+            if WARRANTY_DATE.search(token):
+                continue
+            others.append(token)
+        warranty_date = None
+        if has_warranty:
+            date = WARRANTY_DATE.search(value)
+            year = WARRANTY_YEAR.search(value)
+            if date:
+                warranty_date = f"{date.group(1)}年{int(date.group(2))}月"
+            elif year:
+                warranty_date = f"{year.group(1)}年"
+        return has_warranty, has_box, "・".join(others) or None, warranty_date
+
+    def extract(self, text: str, model_number: str = None):
+        """
+        ページテキストから時計情報を抽出する
+        パラメータ:
+        text (str): 検索結果のページ本文（トリミング前）
+        model_number (str): 検索した型番。タイトルか型番の項目に含まれていれば型番として確定する
+        戻り値:
+        (dict, dict): (スキーマと同じ形式の抽出結果, 項目ごとの信頼度)
+        """
+        model_number = str(model_number).strip() if model_number is not None else None
+        lines = [line.strip() for line in _normalize(text or "").splitlines()]
+        lines = [line for line in lines if line]
+        info = {
+            "name": None, "model_number": None, "dial_color": None, "bracelet_type": None, "price": None,
+            "seller": None, "warranty_date": None,
+            "accessories": {"has_warranty_card": None, "has_box": None, "other_description": None},
+            "condition": None,
+        }
+        confidence = {field: 0.0 for field in info}
+        if not lines:
+            return info, confidence
+
+        # ページタイトル「【楽天市場】商品名：ショップ名」から商品名と出品者
+        title, seller = split_title(lines[0])
+        if seller:
+            info["seller"], confidence["seller"] = seller, 0.9
+        name = " ".join(TITLE_NOISE.sub(" ", TITLE_TAGS.sub(" ", title)).split())
+        if name:
+            info["name"], confidence["name"] = _clip(name), 0.8
+
+        info["price"], confidence["price"] = self._headline_price(lines)
+
+        labeled = {}
+        for field, value in self._labeled_values(lines):
+            labeled.setdefault(field, []).append(value)
+
+        # 検索した型番がタイトルか型番の項目にあれば確定する。本文の他の箇所（関連商品・パンくずなど）にしかない場合は
+        # 別の商品の型番の可能性があるため、LLM に確認させる
+        normalized_model = _normalize(model_number or "").upper().replace(" ", "")
+
+        def mentions_model(value):
+            return bool(normalized_model) and normalized_model in value.upper().replace(" ", "")
+
+        if mentions_model(title) or any(mentions_model(value) for value in labeled.get("model_number", [])):
+            info["model_number"], confidence["model_number"] = model_number, 0.95
+        elif labeled.get("model_number"):
+            value = labeled["model_number"][0].split("/")[0].split()[0]
+            if value not in ("-", "なし"):
+                info["model_number"], confidence["model_number"] = _clip(value), 0.85
+        elif any(mentions_model(line) for line in lines):
+            info["model_number"], confidence["model_number"] = model_number, 0.5
+
+        dial_value = labeled.get("dial_color", [""])[0]
+        dial_color = next((color for color in DIAL_COLORS if color in dial_value), None)
+        if dial_color:
+            info["dial_color"], confidence["dial_color"] = dial_color, 0.85
+        elif dial_value:
+            info["dial_color"], confidence["dial_color"] = _clip(re.split(r"[\s/(]", dial_value)[0]), 0.6
+        else:
+            match = DIAL_IN_TITLE.search(title)
+            if match:
+                info["dial_color"], confidence["dial_color"] = match.group(1), 0.8
+
+        for value in labeled.get("bracelet", []) + [title]:
+            bracelet_type = next((name for word, name in BRACELET_TYPES if word in value), None)
+            if bracelet_type:
+                info["bracelet_type"] = bracelet_type
+                confidence["bracelet_type"] = 0.85 if value is not title else 0.6
+                break
+
+        if labeled.get("condition"):
+            condition = labeled["condition"][0]
+            info["condition"] = _clip(condition)
+            confidence["condition"] = 0.85 if CONDITION_WORDS.search(condition) else 0.5
+
+        accessory_text = " ".join(labeled.get("accessories", []))
+        if accessory_text:
+            has_warranty, has_box, others, warranty_date = self._parse_accessories(accessory_text)
+            info["accessories"] = {"has_warranty_card": has_warranty, "has_box": has_box, "other_description": others}
+            confidence["accessories"] = 0.85
+            info["warranty_date"] = warranty_date
+            # 保証書がない場合は日付なしで確定、ある場合は日付が読み取れたときだけ確定
+            confidence["warranty_date"] = 0.85 if (warranty_date or not has_warranty) else 0.3
+        return info, confidence
+
+    def resolve(self, text: str, model_number: str = None):
+        """
+        ルールで抽出し、信頼度が足りない項目の一覧を返す
+        戻り値:
+        (dict, List[str]): (抽出結果, LLM に問い合わせる必要のある項目名のリスト)
+        """
+        with get_metrics().span("rule_extract"):
+            info, confidence = self.extract(text, model_number)
+        unresolved = [field for field, score in confidence.items() if score < self.min_confidence]
+        return info, unresolved
+
+    def record(self, unresolved):
+        """1ページ分の結果（LLM に問い合わせた項目）を集計する"""
+        metrics = get_metrics()
+        metrics.increment("rule_extract_documents")
+        if not unresolved:
+            metrics.increment("rule_extract_fast_path")
+        metrics.increment("rule_extract_llm_fields", len(unresolved))
+        with self._lock:
+            self.documents += 1
+            self.fast_path += not unresolved
+            self.llm_fields += len(unresolved)
+
+    def stats(self):
+        """ルールだけで抽出できたページの割合などの集計を返す"""
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "fast_path": self.fast_path,
+                "fast_path_ratio": self.fast_path / self.documents if self.documents else 0.0,
+                "llm_fields": self.llm_fields,
+            }
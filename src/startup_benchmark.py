@@ -0,0 +1,126 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent  # プロジェクトのルートディレクトリ
+SRC_DIR = Path(__file__).parent
+# 計測するエントリポイント: 名前 -> (インポートするモジュール, 実行ディレクトリ)
+ENTRY_POINTS = {
+    "process_excel": ("process_excel", SRC_DIR),
+    "app": ("app", BASE_DIR),
+}
+# インポートの予算（秒）。cron やコンテナのヘルスチェックで頻繁に起動するため、超えた場合は失敗にする
+STARTUP_BUDGET_SECONDS = {"process_excel": 0.5, "app": 0.5}
+HELP_BUDGET_SECONDS = 1.0     # process_excel.py --help 全体（インタプリタの起動を含む）の予算（秒）
+# 起動時に読み込まないモジュール（処理の段階で初めて読み込む）
+LAZY_MODULES = ("pandas", "numpy", "openai", "tavily", "gradio", "rich")
+DEFAULT_REPEAT = 5            # 計測の繰り返し回数（中央値を使う）
+TOP_IMPORTS = 10              # 表示する読み込み時間の大きいモジュールの件数
+
+
+def parse_importtime(stderr: str):
+    """
+    python -X importtime の出力を解析する
+    戻り値:
+    List[tuple]: (モジュール名, 自身の時間（秒）, 子を含む時間（秒）, 階層の深さ) のリスト
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # 見出し行
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6, depth))
+    return imports
+
+
+def measure_import(entry: str):
+    """
+    エントリポイントのモジュールを新しいプロセスでインポートし、読み込み時間と読み込まれたモジュールを返す
+    戻り値:
+    dict: {"seconds": インポート時間, "lazy_loaded": 読み込まれた LAZY_MODULES, "top": 時間の大きいモジュール}
+    """
+    module, cwd = ENTRY_POINTS[entry]
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd,
+                               capture_output=True, text=True, encoding="utf-8")
+    if completed.returncode != 0:
+        raise RuntimeError(f"{module} のインポートに失敗しました:\n{completed.stderr[-2000:]}")
+    imports = parse_importtime(completed.stderr)
+    end = next(i for i, (name, _, _, depth) in enumerate(imports) if name == module and depth == 0)
+    # 子モジュールは親より前に出力されるため、直前の深さ1以上の行がこのモジュールから読み込まれたもの
+    start = end
+    while start > 0 and imports[start - 1][3] > 0:
+        start -= 1
+    children = imports[start:end]
+    loaded = {name.split(".")[0] for name, _, _, _ in children}
+    return {
+        "seconds": imports[end][2],
+        "lazy_loaded": sorted(loaded & set(LAZY_MODULES)),
+        "top": [(name, cumulative) for name, _, cumulative, _ in sorted(children, key=lambda item: -item[2])][:TOP_IMPORTS],
+    }
+
+
+def measure_help() -> float:
+    """process_excel.py --help の実行時間（秒、インタプリタの起動を含む）"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(SRC_DIR / "process_excel.py"), "--help"], capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def run_startup_benchmark(repeat: int = DEFAULT_REPEAT):
+    """
+    各エントリポイントの起動時間を repeat 回計測し、中央値と予算の判定を返す
+    戻り値:
+    dict: エントリポイントごとの計測結果と "ok"（全て予算内で、起動時に重い依存を読み込んでいなければ True）
+    """
+    results = {}
+    for entry in ENTRY_POINTS:
+        runs = [measure_import(entry) for _ in range(repeat)]
+        seconds = statistics.median(run["seconds"] for run in runs)
+        results[entry] = {
+            "import_seconds": round(seconds, 4),
+            "budget_seconds": STARTUP_BUDGET_SECONDS[entry],
+            "lazy_loaded": runs[-1]["lazy_loaded"],
+            "top_imports": [[name, round(cumulative, 4)] for name, cumulative in runs[-1]["top"]],
+        }
+        results[entry]["ok"] = seconds <= STARTUP_BUDGET_SECONDS[entry] and not runs[-1]["lazy_loaded"]
+    help_seconds = statistics.median(measure_help() for _ in range(repeat))
+    results["process_excel --help"] = {
+        "seconds": round(help_seconds, 4), "budget_seconds": HELP_BUDGET_SECONDS, "ok": help_seconds <= HELP_BUDGET_SECONDS,
+    }
+    results["ok"] = all(result["ok"] for result in results.values())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='process_excel.py と app.py の起動時間（インポート時間）を計測し、予算を超えていないか確認するスクリプト')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help=f'計測の繰り返し回数 (デフォルト: {DEFAULT_REPEAT})')
+    parser.add_argument('--output', default=None, help='計測結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    results = run_startup_benchmark(max(1, args.repeat))
+    for entry in ENTRY_POINTS:
+        result = results[entry]
+        status = "OK" if result["ok"] else "NG"
+        print(f"[{status}] import {entry}: {result['import_seconds']:.3f}s (予算 {result['budget_seconds']}s)")
+        if result["lazy_loaded"]:
+            print(f"     起動時に読み込まれた重い依存: {', '.join(result['lazy_loaded'])}")
+        for name, cumulative in result["top_imports"][:5]:
+            print(f"     {cumulative:.3f}s  {name}")
+    help_result = results["process_excel --help"]
+    print(f"[{'OK' if help_result['ok'] else 'NG'}] process_excel.py --help: {help_result['seconds']:.3f}s (予算 {help_result['budget_seconds']}s)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"計測結果を '{args.output}' に保存しました。")
+    sys.exit(0 if results["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,101 @@
 import os
-from tavily import TavilyClient
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from retry import get_api_caller
+from metrics import get_metrics
+
 # .envファイルから環境変数を読み込み
 load_dotenv()
 
+# 検索対象のドメイン（楽天市場の商品ページ）
+INCLUDE_DOMAINS = ["https://item.rakuten.co.jp/"]
+EXTRACT_BATCH_URLS = 20   # Extract API に1回で渡す URL の最大件数（API の上限）
+EXTRACT_CONCURRENCY = 4   # extract_contents で同時に送るリクエスト数の上限
+
+
+def normalize_query(query: str) -> str:
+    """キャッシュキー用に検索クエリを正規化する（全角/半角・大文字/小文字・空白の揺れを吸収）"""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
 
 class tavily_processor:
     """
     Tavily の Search と Extract の処理をラップするクラス
     """
 
-    def __init__(self):
+    def __init__(self, search_cache=None, refresh_cache: bool = False):
+        """
+        パラメータ:
+        search_cache (SQLiteCache): 検索結果の永続キャッシュ。None の場合はキャッシュを使わない
+        refresh_cache (bool): True の場合はキャッシュを読まずに検索し、結果でキャッシュを更新する
+        """
         # 環境変数から Tavily API キーを取得
         self.api_key = os.getenv("TAVILY_API_KEY")
         if not self.api_key:
             raise ValueError("Tavily APIキーが設定されていません。.envファイルを確認してください。")
-        # TavilyClient を初期化（同期版）
+        # TavilyClient を初期化（同期版）。tavily は読み込みに時間がかかるため、クライアントを作るときに読み込む
+        from tavily import TavilyClient
         self.client = TavilyClient(self.api_key)
+        # プロセス全体で共有するレート制限（TAVILY_RPM で設定）・再試行・サーキットブレーカー
+        self.api = get_api_caller("tavily")
+        self.rate_limiter = self.api.rate_limiter
+        self.search_cache = search_cache
+        self.refresh_cache = refresh_cache
+
+    def _search_cache_key(self, query, max_results, advance_search, include_domains):
+        """検索結果キャッシュのキー（キャッシュを使わない場合は None）"""
+        if self.search_cache is None:
+            return None
+        return self.search_cache.make_key(
+            normalize_query(query), max_results, bool(advance_search), sorted(include_domains)
+        )
+
+    def cached_search(self, query: str, max_results: int = 20, advance_search: bool = True, include_domains=None):
+        """
+        キャッシュ済みの検索結果だけを返す（API は呼ばない）
+        戻り値:
+        List[dict] または None: search_item と同じ形式の結果。キャッシュにない場合は None
+        """
+        if include_domains is None:
+            include_domains = INCLUDE_DOMAINS
+        cache_key = self._search_cache_key(query, max_results, advance_search, include_domains)
+        if cache_key is None or self.refresh_cache:
+            return None
+        return self.search_cache.get(cache_key)
 
-    def search_item(self, query: str, max_results: int = 20, advance_search: bool = True):
+    def search_item(self, query: str, max_results: int = 20, advance_search: bool = True, include_domains=None,
+                    recover_missing_content: bool = True):
         """
         Tavily Search API を使って楽天内の商品を検索する処理
+        search_cache が設定されている場合は、正規化したクエリと検索条件をキーにキャッシュを利用する
+        raw_content のない検索結果は、extract_contents でまとめて本文を取得し直す（取得できなかったものは除く）
         パラメータ:
         query (str): 検索クエリ
         max_results (int): 返却する検索結果の最大件数
         advance_search (bool): Trueの場合は高度な検索深度を使用、Falseの場合は標準検索
+        include_domains (List[str]): 検索対象のドメイン。None の場合は INCLUDE_DOMAINS
+        recover_missing_content (bool): False の場合は raw_content のない検索結果をそのまま除く
         戻り値:
         List[dict]: 各辞書が {"url": <URL>, "content": <raw_content>} となるリスト（重複なし）
         """
+        if include_domains is None:
+            include_domains = INCLUDE_DOMAINS
+
+        cache_key = self._search_cache_key(query, max_results, advance_search, include_domains)
+        if cache_key is not None:
+            if not self.refresh_cache:
+                cached_results = self.search_cache.get(cache_key)
+                if cached_results is not None:
+                    return cached_results
+
         # 検索パラメータを辞書として準備
         search_params = {
             "query": query,
             "max_results": max_results,
             "include_raw_content": True,
-            "include_domains": ["https://item.rakuten.co.jp/"],
+            "include_domains": list(include_domains),
             "exclude_domains": [""],
         }
 
@@ -42,24 +103,76 @@ class tavily_processor:
         if advance_search:
             search_params["search_depth"] = "advanced"
 
-        # 準備したパラメータでAPIを呼び出し
-        response = self.client.search(**search_params)
+        # 準備したパラメータでAPIを呼び出し（レート制限の待ち時間を含めて search_item として計測）
+        with get_metrics().span("search_item"):
+            response = self.api.call(self.client.search, **search_params)
 
         results = response.get("results", [])
-        filtered_results = []
-        processed_urls = set()  # URLの重複チェック用セット
+        contents = {}  # URL -> raw_content（検索結果の順序を保つ。重複した URL は最初に本文のあったものを使う）
 
         for item in results:
             url = item.get("url")
-            content = item.get("raw_content")
+            if url and not contents.get(url):
+                contents[url] = item.get("raw_content")
+
+        # raw_content のない URL は、1件ずつではなくまとめて Extract API で取得する
+        missing_urls = [url for url, content in contents.items() if not content]
+        if missing_urls and recover_missing_content:
+            recovered, failures = self.extract_contents(missing_urls)
+            contents.update(recovered)
+            metrics = get_metrics()
+            metrics.increment("tavily_recovered_contents", len(recovered))
+            metrics.increment("tavily_missing_contents", len(failures))
 
-            # URLが有効で、コンテンツがあり、まだ処理していないURLのみを追加
-            if url and content and url not in processed_urls:
-                processed_urls.add(url)  # 処理済みとしてマーク
-                filtered_results.append({"url": url, "content": content})
+        # URLが有効で、コンテンツがあるもののみを追加
+        filtered_results = [{"url": url, "content": content} for url, content in contents.items() if content]
+
+        if cache_key is not None:
+            self.search_cache.set(cache_key, filtered_results)
 
         return filtered_results
 
+    def extract_contents(self, urls, extract_depth: str = "advanced", max_workers: int = EXTRACT_CONCURRENCY):
+        """
+        Tavily Extract API を使って、複数のURLの本文をまとめて取得する
+        EXTRACT_BATCH_URLS 件ずつのリクエストに分け、max_workers 件まで同時に送る
+        パラメータ:
+        urls (List[str]): 取得するURL（重複は1回だけ取得する）
+        extract_depth (str): "advanced" または "basic"
+        max_workers (int): 同時に送るリクエスト数の上限
+        戻り値:
+        (dict, dict): (URL -> raw_content, 取得できなかった URL -> 理由)
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        chunks = [urls[start:start + EXTRACT_BATCH_URLS] for start in range(0, len(urls), EXTRACT_BATCH_URLS)]
+        contents, failures = {}, {}
+        if not chunks:
+            return contents, failures
+
+        def extract_chunk(chunk):
+            with get_metrics().span("extract_contents"):
+                return self.api.call(self.client.extract, urls=chunk, extract_depth=extract_depth)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            futures = [(chunk, executor.submit(extract_chunk, chunk)) for chunk in chunks]
+            for chunk, future in futures:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    # 再試行しても失敗したリクエストは、そのリクエストの URL をすべて失敗として返す
+                    failures.update((url, repr(e)) for url in chunk)
+                    continue
+                for result in response.get("results", []):
+                    if result.get("url") in chunk and result.get("raw_content"):
+                        contents[result["url"]] = result["raw_content"]
+                for failed in response.get("failed_results", []):
+                    if failed.get("url") in chunk and failed["url"] not in contents:
+                        failures[failed["url"]] = failed.get("error") or "取得失敗"
+                for url in chunk:
+                    if url not in contents and url not in failures:
+                        failures[url] = "本文なし"
+        return contents, failures
+
     def extract_content(self, url: str, extract_depth: str = "advanced", include_images: bool = False):
         """
         Tavily Extract API を使って、指定されたURLから content と画像URLを抽出する処理
@@ -73,7 +186,10 @@ class tavily_processor:
             include_images=False の場合: 抽出された raw_content のみ
             結果がなければ None を返す。
         """
-        response = self.client.extract(urls=[url], extract_depth=extract_depth, include_images=include_images)
+        with get_metrics().span("extract_content"):
+            response = self.api.call(
+                self.client.extract, urls=[url], extract_depth=extract_depth, include_images=include_images
+            )
         results = response.get("results", [])
         if not results:
             return None
@@ -1,60 +1,160 @@
 import os
 import json
-from openai import OpenAI
+import hashlib
+import unicodedata
 from dotenv import load_dotenv
 
+from rate_limiter import estimate_tokens
+from retry import get_api_caller, is_retryable_error
+from metrics import get_metrics
+
 # .envから環境変数を読み込み
 load_dotenv()
 
+# JSONスキーマの定義（各項目の型や説明を含む）
+WATCH_INFO_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": ["string", "null"], "description": "時計の名前"},
+        "model_number": {"type": ["string", "null"], "description": "型番"},
+        "dial_color": {"type": ["string", "null"], "description": "文字盤の色"},
+        "bracelet_type": {
+            "type": ["string", "null"],
+            "description": "ブレス形状",
+            "enum": [
+                "オイスター", "ジュビリー", "プレジデント",
+                "オイスターフレックス", "パールマスター",
+                "レザー", "そのほか", "不明"
+            ]
+        },
+        "price": {"type": ["integer", "null"], "description": "価格"},
+        "seller": {"type": ["string", "null"], "description": "出品者名"},
+        "warranty_date": {"type": ["string", "null"], "description": "保証書の日付"},
+        "accessories": {
+            "type": "object",
+            "properties": {
+                "has_warranty_card": {"type": ["boolean", "null"], "description": "保証書の有無"},
+                "has_box": {"type": ["boolean", "null"], "description": "箱の有無"},
+                "other_description": {"type": ["string", "null"], "description": "他の付属品の名前"}
+            },
+            "required": ["has_warranty_card", "has_box", "other_description"]
+        },
+        "condition": {"type": ["string", "null"], "description": "状態"}
+    },
+    "required": [
+        "name", "model_number", "dial_color", "bracelet_type", "price",
+        "seller", "warranty_date", "accessories", "condition"
+    ]
+}
+
+# スキーマやプロンプトを変更した場合は更新する（抽出結果キャッシュのキーに含まれる）
+SCHEMA_VERSION = 1
+
+
+def schema_for_fields(fields=None) -> dict:
+    """WATCH_INFO_SCHEMA のうち fields の項目だけを含むスキーマ（None の場合はスキーマ全体）"""
+    if fields is None:
+        return WATCH_INFO_SCHEMA
+    return {
+        "type": "object",
+        "properties": {field: WATCH_INFO_SCHEMA["properties"][field] for field in fields},
+        "required": [field for field in WATCH_INFO_SCHEMA["required"] if field in fields],
+    }
+
+
+def failed_watch_info(url: str, description: str) -> dict:
+    """抽出に失敗した場合の記録（スキーマの項目は None、URL と失敗理由のみ設定。error は失敗時のみ付く）"""
+    return {
+        "name": None, "model_number": None, "dial_color": None, "bracelet_type": None,
+        "price": None, "url": url,
+        "seller": None, "warranty_date": None,
+        "accessories": {"has_warranty_card": None, "has_box": None, "other_description": description},
+        "condition": None,
+        "error": description
+    }
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にページテキストを正規化する（全角/半角・空白の揺れを吸収）"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
 class WatchInfoExtractor:
     """
     入力されたテキストから、時計の情報を抽出するクラス
     OpenAI API の json_object モードを利用して、以下のスキーマに従った情報を抽出する
     """
-    def __init__(self):
+    def __init__(self, result_cache=None):
+        """
+        パラメータ:
+        result_cache (SQLiteCache): 抽出結果の永続キャッシュ。None の場合はキャッシュを使わない
+        """
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI APIキーが設定されていません。.envファイルを確認してください。")
-        self.client = OpenAI(api_key=self.api_key)
+        # 再試行は retry.ApiCaller で行うため、クライアント自身の再試行は無効にする
+        # openai は読み込みに時間がかかるため、クライアントを作るときに読み込む
+        from openai import OpenAI
+        self.client = OpenAI(api_key=self.api_key, max_retries=0)
         self.model = "gpt-4o-mini"  # json_object 出力に対応したモデルを指定
+        # プロセス全体で共有するレート制限（OPENAI_RPM / OPENAI_TPM で設定）・再試行・サーキットブレーカー
+        self.api = get_api_caller("openai")
+        self.rate_limiter = self.api.rate_limiter
+        self.max_output_tokens_estimate = 500  # TPM 見積もり用の出力トークン数
+        self.result_cache = result_cache
 
-    def extract_info(self, text: str):
-        # JSONスキーマの定義（各項目の型や説明を含む）
-        schema = {
-            "type": "object",
-            "properties": {
-                "name": {"type": ["string", "null"], "description": "時計の名前"},
-                "model_number": {"type": ["string", "null"], "description": "型番"},
-                "dial_color": {"type": ["string", "null"], "description": "文字盤の色"},
-                "bracelet_type": {
-                    "type": ["string", "null"],
-                    "description": "ブレス形状",
-                    "enum": [
-                        "オイスター", "ジュビリー", "プレジデント",
-                        "オイスターフレックス", "パールマスター",
-                        "レザー", "そのほか", "不明"
-                    ]
-                },
-                "price": {"type": ["integer", "null"], "description": "価格"},
-                "seller": {"type": ["string", "null"], "description": "出品者名"},
-                "warranty_date": {"type": ["string", "null"], "description": "保証書の日付"},
-                "accessories": {
-                    "type": "object",
-                    "properties": {
-                        "has_warranty_card": {"type": ["boolean", "null"], "description": "保証書の有無"},
-                        "has_box": {"type": ["boolean", "null"], "description": "箱の有無"},
-                        "other_description": {"type": ["string", "null"], "description": "他の付属品の名前"}
-                    },
-                    "required": ["has_warranty_card", "has_box", "other_description"]
-                },
-                "condition": {"type": ["string", "null"], "description": "状態"}
-            },
-            "required": [
-                "name", "model_number", "dial_color", "bracelet_type", "price",
-                "seller", "warranty_date", "accessories", "condition"
-            ]
-        }
+    def cache_key(self, text: str, fields=None):
+        """抽出結果キャッシュのキー（キャッシュを使わない場合は None）。一部の項目だけの抽出は項目名もキーに含める"""
+        if self.result_cache is None:
+            return None
+        text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        if fields is None:
+            return self.result_cache.make_key(self.model, SCHEMA_VERSION, text_hash)
+        return self.result_cache.make_key(self.model, SCHEMA_VERSION, text_hash, sorted(fields))
+
+    def _cached_result(self, text: str, fields=None):
+        """
+        キャッシュ済みの抽出結果を返す（なければ None）
+        一部の項目だけを求められた場合は、同じテキストの全項目の抽出結果があればその一部を返す
+        """
+        if self.result_cache is None:
+            return None
+        cached_result = self.result_cache.get(self.cache_key(text, fields))
+        if cached_result is None and fields is not None:
+            full_result = self.result_cache.get(self.cache_key(text))
+            if full_result is not None:
+                cached_result = {field: full_result.get(field) for field in fields}
+        return cached_result
+
+    def _chat_json(self, system_message: str, prompt: str, output_tokens_estimate: int, span_name: str = "extract_info"):
+        """
+        レート制限を守りながら json_object モードで問い合わせ、応答を JSON として返す
+        呼び出し時間は span_name として、トークン使用量（response.usage）は openai_*_tokens として記録する
+        """
+        estimated_tokens = estimate_tokens(system_message) + estimate_tokens(prompt) + output_tokens_estimate
+        metrics = get_metrics()
+        with metrics.span(span_name):
+            response = self.api.call(
+                self.client.chat.completions.create,
+                tokens=estimated_tokens,
+                model=self.model,
+                response_format={"type": "json_object"},
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.0
+            )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.rate_limiter.record_usage(estimated_tokens, usage.total_tokens)
+            metrics.record_usage("openai", usage)
+        result_json_str = response.choices[0].message.content
+        return self.parse_response_content(result_json_str)
 
+    def _build_messages(self, text: str, fields=None):
+        """1件抽出用のシステムメッセージとプロンプトを組み立てる（fields を指定した場合はその項目だけのスキーマにする）"""
+        schema = schema_for_fields(fields)
         prompt = f"""
 以下のテキストから、時計の情報を抽出してください。抽出する情報は以下の JSON スキーマに従って出力してください。
 
@@ -66,18 +166,121 @@ class WatchInfoExtractor:
 {text}
 \"\"\"
 """
-        response = self.client.chat.completions.create(
-            model=self.model,
-            response_format={"type": "json_object"},
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"あなたは時計情報抽出のアシスタントです。以下のスキーマに従って、情報を抽出してください。\n{json.dumps(schema, indent=2, ensure_ascii=False)}"
-                },
+        system_message = f"あなたは時計情報抽出のアシスタントです。以下のスキーマに従って、情報を抽出してください。\n{json.dumps(schema, indent=2, ensure_ascii=False)}"
+        return system_message, prompt
+
+    def build_request_body(self, text: str) -> dict:
+        """
+        extract_info と同じ内容の Chat Completions リクエストボディを返す
+        OpenAI Batch API の入力ファイル（JSONL）を作成する際に利用する
+        """
+        system_message, prompt = self._build_messages(text)
+        return {
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.0
+            "temperature": 0.0,
+        }
+
+    @staticmethod
+    def parse_response_content(content: str):
+        """Chat Completions の応答本文（JSON 文字列）を抽出結果に変換する"""
+        return json.loads(content)
+
+    def cached_info(self, text: str, fields=None):
+        """キャッシュ済みの抽出結果だけを返す（API は呼ばない）。キャッシュにない場合は None"""
+        return self._cached_result(text, fields)
+
+    def extract_info(self, text: str, fields=None):
+        """
+        テキストから時計情報を抽出する
+        result_cache が設定されている場合は (モデル名, スキーマバージョン, 正規化テキストのハッシュ) をキーに
+        抽出結果を再利用し、同じページを再度 API で抽出しない
+        パラメータ:
+        text (str): 抽出対象のテキスト
+        fields (List[str]): 抽出する項目（WATCH_INFO_SCHEMA の項目名）。None の場合は全項目
+        戻り値:
+        dict: 抽出結果（fields を指定した場合はその項目だけ）
+        """
+        cached_result = self._cached_result(text, fields)
+        if cached_result is not None:
+            return cached_result
+        cache_key = self.cache_key(text, fields)
+
+        system_message, prompt = self._build_messages(text, fields)
+        output_tokens_estimate = self.max_output_tokens_estimate
+        if fields is not None:
+            output_tokens_estimate = max(50, output_tokens_estimate * len(fields) // len(WATCH_INFO_SCHEMA["required"]))
+        result = self._chat_json(system_message, prompt, output_tokens_estimate)
+        if cache_key is not None and result:
+            self.result_cache.set(cache_key, result)
+        return result
+
+    def extract_many(self, texts):
+        """
+        複数の商品ページのテキストを1回のリクエストでまとめて抽出する
+        スキーマはシステムメッセージに1回だけ含め、各テキストには番号を付けて渡す
+        応答が不正な形式（件数不足・必須項目の欠落など）だった項目や、まとめてのリクエストが一時的でないエラーで
+        失敗した場合は extract_info で1件ずつ抽出し直す
+        パラメータ:
+        texts (List[str]): 抽出対象のテキストのリスト
+        戻り値:
+        List[dict]: texts と同じ順序の抽出結果のリスト
+        """
+        results = [None] * len(texts)
+        cache_keys = [self.cache_key(text) for text in texts]
+        pending = []  # キャッシュになかった項目の位置
+        for i, cache_key in enumerate(cache_keys):
+            cached_result = self.result_cache.get(cache_key) if cache_key is not None else None
+            if cached_result is not None:
+                results[i] = cached_result
+            else:
+                pending.append(i)
+
+        if len(pending) == 1:
+            results[pending[0]] = self.extract_info(texts[pending[0]])
+            return results
+        if not pending:
+            return results
+
+        system_message = (
+            "あなたは時計情報抽出のアシスタントです。複数の商品ページのテキストが番号付きで与えられます。"
+            "各テキストについて以下のスキーマに従って情報を抽出し、"
+            '{"items": [{"index": <テキスト番号>, ...スキーマの項目}, ...]} の形式で、'
+            "すべてのテキストの結果を番号順に出力してください。\n"
+            f"{json.dumps(WATCH_INFO_SCHEMA, ensure_ascii=False, separators=(',', ':'))}"
         )
-        result_json_str = response.choices[0].message.content
-        result = json.loads(result_json_str)
-        return result
\ No newline at end of file
+        prompt = "以下の各テキストから、時計の情報を抽出してください。\n"
+        for index, i in enumerate(pending):
+            prompt += f"\n### テキスト {index}\n\"\"\"\n{texts[i]}\n\"\"\"\n"
+
+        items_by_index = {}
+        try:
+            response = self._chat_json(system_message, prompt, self.max_output_tokens_estimate * len(pending),
+                                       span_name="extract_many")
+            items = response.get("items") if isinstance(response, dict) else None
+            for item in items if isinstance(items, list) else []:
+                if not isinstance(item, dict) or not isinstance(item.get("index"), int):
+                    continue
+                item = dict(item)
+                index = item.pop("index")
+                if 0 <= index < len(pending) and all(key in item for key in WATCH_INFO_SCHEMA["required"]):
+                    items_by_index[index] = item
+        except Exception as e:
+            if is_retryable_error(e):
+                raise  # 再試行しても回復しなかった API のエラーは1件ずつ呼び出しても失敗するため、そのまま伝える
+            items_by_index = {}  # 応答が JSON でない・リクエストが拒否された場合などは1件ずつ抽出し直す
+
+        for index, i in enumerate(pending):
+            result = items_by_index.get(index)
+            if result is None:
+                # まとめての抽出に失敗した項目は1件ずつ抽出し直す
+                results[i] = self.extract_info(texts[i])
+                continue
+            if cache_keys[i] is not None:
+                self.result_cache.set(cache_keys[i], result)
+            results[i] = result
+        return results
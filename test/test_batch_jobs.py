@@ -0,0 +1,158 @@
+import json
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from batch_jobs import prepare_batch, submit_batch, ingest_batch, LocalFileExecutor, MANIFEST_FILE
+from rule_extractor import RuleExtractor
+from watch_info_extractor import WatchInfoExtractor
+
+# 記録済みの Tavily 検索結果（APIを呼ばずに再生する）
+RECORDED_SEARCH = Path(__file__).parent / "results" / "tavily_search_results.json"
+
+
+class RecordedSearchClient:
+    """記録済みの検索結果を返す tavily_processor の代替"""
+
+    def __init__(self):
+        with open(RECORDED_SEARCH, encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        # tavily_processor.search_item と同様に、URLの重複を除いて返す
+        unique_results = {r["url"]: r["raw_content"] for r in results if r.get("raw_content")}
+        self.results = [{"url": url, "content": content} for url, content in unique_results.items()]
+        self.calls = 0
+
+    def search_item(self, query, max_results=20, advance_search=True):
+        self.calls += 1
+        return self.results[:max_results]
+
+
+def make_extractor():
+    """APIキーなしで WatchInfoExtractor のリクエスト組み立て部分だけを使う"""
+    extractor = WatchInfoExtractor.__new__(WatchInfoExtractor)
+    extractor.model = "gpt-4o-mini"
+    extractor.result_cache = None
+    return extractor
+
+
+def fake_complete(body):
+    """リクエスト本文の長さを価格として返す決定的な応答"""
+    text = body["messages"][-1]["content"]
+    if "エラーを起こす" in text:
+        raise RuntimeError("simulated failure")
+    return json.dumps({"name": "テスト", "model_number": "126500LN", "price": len(text)}, ensure_ascii=False)
+
+
+def test_prepare_submit_ingest_roundtrip(tmp_path):
+    search_client = RecordedSearchClient()
+    rows = [(0, "ROLEX 126500LN ブラック オイスター 中古", "126500LN"),
+            (1, "ROLEX 126500LN ホワイト オイスター 中古", "126500LN")]
+    batch_dir = tmp_path / "batch"
+
+    summary = prepare_batch(rows, search_client, make_extractor(), batch_dir, max_results=10,
+                            advance_search=True, max_requests_per_file=2)
+    unique_urls = len(search_client.results[:10])
+    # 同じURLは1回だけリクエストされ、上限件数ごとにファイルが分割される
+    assert summary["rows"] == 2
+    assert summary["requests"] == unique_urls
+    assert summary["request_files"] == (unique_urls + 1) // 2
+
+    executor = LocalFileExecutor(fake_complete, tmp_path / "local")
+    jobs = submit_batch(batch_dir, executor)
+    assert len(jobs) == summary["request_files"]
+    # 送信済みのファイルは再送信しない
+    assert submit_batch(batch_dir, executor) == []
+
+    output_path = tmp_path / "result.json"
+    result = ingest_batch(batch_dir, executor, output_path)
+    assert result == {"completed": True, "pending_jobs": 0, "rows": 2, "failed_urls": 0}
+
+    with open(output_path, encoding="utf-8") as f:
+        output = json.load(f)
+    assert [row["input_keywords"] for row in output] == [keywords for _, keywords, _ in rows]
+    for row in output:
+        assert [detail["url"] for detail in row["extracted_results"]] == [r["url"] for r in search_client.results[:10]]
+        assert all(detail["price"] > 0 for detail in row["extracted_results"])
+
+
+def test_ingest_waits_for_pending_jobs_and_records_failures(tmp_path):
+    class SlowExecutor(LocalFileExecutor):
+        done = False
+
+        def status(self, job_id):
+            return "completed" if self.done else "in_progress"
+
+    search_client = RecordedSearchClient()
+    search_client.results = [{"url": "https://item.rakuten.co.jp/a/1/", "content": "4,428,000円"},
+                             {"url": "https://item.rakuten.co.jp/a/2/", "content": "エラーを起こす"}]
+    batch_dir = tmp_path / "batch"
+    prepare_batch([(0, "ROLEX 126500LN 中古", "126500LN")], search_client, make_extractor(), batch_dir,
+                  max_results=10, advance_search=True)
+
+    executor = SlowExecutor(fake_complete, tmp_path / "local")
+    submit_batch(batch_dir, executor)
+    output_path = tmp_path / "result.json"
+    assert ingest_batch(batch_dir, executor, output_path)["completed"] is False
+    assert not output_path.exists()
+
+    executor.done = True
+    result = ingest_batch(batch_dir, executor, output_path)
+    assert result["completed"] is True and result["failed_urls"] == 1
+    with open(output_path, encoding="utf-8") as f:
+        details = json.load(f)[0]["extracted_results"]
+    assert details[0]["price"] > 0
+    assert details[1]["price"] is None
+    assert details[1]["accessories"]["other_description"].startswith("バッチ抽出エラー")
+    assert (batch_dir / MANIFEST_FILE).exists()
+
+
+def test_request_files_are_split_before_the_byte_limit(tmp_path):
+    search_client = RecordedSearchClient()
+    batch_dir = tmp_path / "batch"
+    max_bytes = 60000
+    summary = prepare_batch([(0, "ROLEX 126500LN 中古", "126500LN")], search_client, make_extractor(), batch_dir,
+                            max_results=10, advance_search=True, max_bytes_per_file=max_bytes)
+    request_files = sorted(batch_dir.glob("requests-*.jsonl"))
+    assert summary["request_files"] == len(request_files) > 1
+    # 1件で上限を超えるリクエストを除き、各ファイルは上限のバイト数以内に収まる
+    for request_file in request_files:
+        lines = request_file.read_bytes().splitlines(keepends=True)
+        assert len(lines) == 1 or sum(len(line) for line in lines) <= max_bytes
+    assert sum(len(request_file.read_text(encoding="utf-8").splitlines()) for request_file in request_files) == summary["requests"]
+
+
+def test_ingest_merges_fields_resolved_by_rules(tmp_path):
+    search_client = RecordedSearchClient()
+    search_client.results = [{"url": "https://item.rakuten.co.jp/a/1/",
+                              "content": "【楽天市場】ロレックス デイトナ 126500LN：ルールのショップ\n【型番】126500LN\n2,980,000円\n"}]
+    batch_dir = tmp_path / "batch"
+    prepare_batch([(0, "ROLEX 126500LN 中古", "126500LN")], search_client, make_extractor(), batch_dir,
+                  max_results=10, advance_search=True, rule_extractor=RuleExtractor())
+    executor = LocalFileExecutor(fake_complete, tmp_path / "local")
+    submit_batch(batch_dir, executor)
+    output_path = tmp_path / "result.json"
+    ingest_batch(batch_dir, executor, output_path)
+
+    with open(output_path, encoding="utf-8") as f:
+        detail = json.load(f)[0]["extracted_results"][0]
+    # ルールで確定した項目はルールの値、確定できなかった項目は LLM の値を使う
+    assert detail["seller"] == "ルールのショップ" and detail["name"] == "ロレックス デイトナ 126500LN"
+    assert detail["price"] > 0 and detail["price"] != 2980000
+
+
+class BrokenRuleExtractor(RuleExtractor):
+    def resolve(self, text, model_number=None):
+        raise TypeError("simulated rule failure")
+
+
+def test_rule_extraction_failure_falls_back_to_llm_request(tmp_path):
+    search_client = RecordedSearchClient()
+    batch_dir = tmp_path / "batch"
+    summary = prepare_batch([(0, "ROLEX 126500LN 中古", "126500LN")], search_client, make_extractor(), batch_dir,
+                            max_results=3, advance_search=True, rule_extractor=BrokenRuleExtractor())
+    # バッチ全体は止まらず、全件を LLM にリクエストする
+    assert summary["requests"] == 3 and summary["prefilled"] == 0
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from benchmark import run_benchmark, build_synthetic_sheet
+from fake_backends import FaultProfile, FakeAPIError
+
+# 計測値（時間・メモリ）以外の、実行条件によらず一致すべき項目
+STABLE_KEYS = ["search_calls", "chat_calls", "injected_errors", "row_errors", "failed_urls",
+               "prompt_tokens", "completion_tokens"]
+
+
+def test_synthetic_sheet_size_and_duplicates():
+    sheet = build_synthetic_sheet(120, duplicate_ratio=0.5)
+    assert len(sheet) == 120
+    keys = sheet.astype(str).agg(" ".join, axis=1)
+    assert keys.nunique() == 60
+
+
+def test_fault_profile_is_deterministic():
+    outcomes = []
+    for _ in range(2):
+        faults = FaultProfile(error_rate=0.5, seed=3)
+        result = []
+        for key in ["a", "b", "c", "a", "a"]:
+            try:
+                faults.apply("search", key)
+                result.append("ok")
+            except FakeAPIError as e:
+                result.append(e.status_code)
+        outcomes.append(result)
+    assert outcomes[0] == outcomes[1]
+    assert 500 in outcomes[0] and "ok" in outcomes[0]
+
+
+def test_benchmark_counts_are_independent_of_concurrency():
+    options = dict(latency=0.0, jitter=0.0, error_rate=0.1, seed=1, unique_pages=True, retry_base_delay=0.001)
+    serial = run_benchmark(20, workers=1, **options)
+    parallel = run_benchmark(20, workers=4, **options)
+    assert serial["rows"] == 20 and serial["rows_per_second"] > 0
+    assert serial["row_latency_p50"] <= serial["row_latency_p95"]
+    assert {key: serial[key] for key in STABLE_KEYS} == {key: parallel[key] for key in STABLE_KEYS}
+    # 疑似エラーは再試行で回復する（再試行した分だけ検索 API の呼び出しが増える）
+    assert serial["injected_errors"] > 0 and serial["retries"] == serial["injected_errors"]
+    assert serial["search_calls"] > 20
+    assert serial["row_errors"] == 0 and serial["failed_urls"] == 0
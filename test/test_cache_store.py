@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from cache_store import SQLiteCache
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    clock = FakeClock()
+    cache = SQLiteCache(tmp_path / "cache.sqlite3", ttl_seconds=60, clock=clock)
+    cache.set("key", {"price": 4428000})
+    clock.now += 60
+    assert cache.get("key") == {"price": 4428000}
+    clock.now += 1
+    assert cache.get("key") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+    # 期限はアクセスではなく保存した時刻から数え、上書きすると延びる
+    cache.set("key", "new")
+    clock.now += 50
+    cache.get("key")
+    clock.now += 20
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted_at_the_size_cap(tmp_path):
+    clock = FakeClock()
+    cache = SQLiteCache(tmp_path / "cache.sqlite3", max_entries=2, clock=clock)
+    cache.set("a", 1)
+    clock.now += 1
+    cache.set("b", 2)
+    clock.now += 1
+    assert cache.get("a") == 1  # a のほうが最近使われている
+    clock.now += 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    # 既存のキーの上書きでは件数が増えないため削除しない
+    cache.set("c", 4)
+    assert cache.stats()["entries"] == 2 and cache.get("a") == 1
+
+    # 件数はファイルを開き直しても引き継がれる
+    cache.close()
+    reopened = SQLiteCache(tmp_path / "cache.sqlite3", max_entries=2, clock=clock)
+    assert reopened.stats()["entries"] == 2
+
+
+def test_make_key_is_stable():
+    key = SQLiteCache.make_key("rakuten", {"b": 1, "a": [1, 2]}, 10)
+    assert key == SQLiteCache.make_key("rakuten", {"a": [1, 2], "b": 1}, 10)  # 辞書のキーの順序に依存しない
+    assert key != SQLiteCache.make_key("rakuten", {"a": [2, 1], "b": 1}, 10)
+    assert key != SQLiteCache.make_key("rakuten", {"a": [1, 2], "b": 1}, 20)
+    # 実行やプロセスが変わっても同じキーになる（既存のキャッシュファイルを使い続けられる）
+    assert SQLiteCache.make_key("ROLEX 126500LN 中古", 10, True) == "6e6fb9ce0051ab1fd746550e4930e5516762b2395e40dda5fcdb106803166583"
@@ -0,0 +1,55 @@
+import json
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from content_trimmer import ContentTrimmer
+from rate_limiter import estimate_tokens
+
+RECORDED_SEARCH = Path(__file__).parent / "results" / "tavily_search_results.json"
+
+# ナビゲーション・ジャンル一覧・画像と、情報を含まない説明文に、抽出対象の記載が埋もれたページ
+PAGE = "\n".join(
+    ["【楽天市場】【中古】ロレックス デイトナ 126500LN：ブランドショップ楽天市場店", "楽天市場", "ジャンル一覧", "買い物かご"]
+    + ["腕時計", "家電", "![Image 1](https://image.rakuten.co.jp/a.jpg)", "https://item.rakuten.co.jp/shop/"]
+    + [f"ショップからのお知らせ その{i}。営業日のご案内と配送についてのご連絡です。" for i in range(60)]
+    + ["4,428,000円", "送料無料"]
+    + [f"当店のこだわり その{i}。一点一点丁寧に検品しております。" for i in range(60)]
+    + ["【型番】126500LN", "【文字盤】ブラック", "【状態】中古 ランクA", "【付属品】メーカー保証書(2024年11月) 純正箱"]
+    + [f"よくある質問 その{i}。ご注文後のキャンセルについて。" for i in range(60)]
+)
+
+
+def test_trim_keeps_price_model_and_accessory_sections():
+    trimmer = ContentTrimmer(max_chars=1000)
+    trimmed = trimmer.trim(PAGE, "126500LN")
+    lines = trimmed.splitlines()
+
+    assert lines[0].startswith("【楽天市場】")  # タイトル行は常に残す
+    for expected in ("4,428,000円", "【型番】126500LN", "【状態】中古 ランクA", "【付属品】メーカー保証書(2024年11月) 純正箱"):
+        assert expected in lines
+    assert not {"楽天市場", "ジャンル一覧", "腕時計"} & set(lines)
+    assert not any(line.startswith(("![Image", "https://", "よくある質問 その30")) for line in lines)
+    assert len(trimmed) <= 1000
+
+    stats = trimmer.stats()
+    assert stats["documents"] == 1 and stats["trimmed_tokens"] == estimate_tokens(trimmed)
+    assert stats["saved_tokens"] > stats["trimmed_tokens"]
+
+
+def test_trim_stays_within_budget_on_recorded_pages():
+    with open(RECORDED_SEARCH, encoding="utf-8") as f:
+        pages = [result["raw_content"] for result in json.load(f)["results"] if result.get("raw_content")]
+    for max_chars in (4000, 800):
+        trimmer = ContentTrimmer(max_chars=max_chars)
+        for page in pages:
+            trimmed = trimmer.trim(page, "126500LN")
+            assert len(trimmed) <= max_chars
+            assert estimate_tokens(trimmed) <= estimate_tokens(page)
+            assert trimmed.splitlines()[0] == page.strip().splitlines()[0].strip()
+            if "型番" in page and max_chars == 4000:
+                assert "型番" in trimmed
@@ -0,0 +1,61 @@
+import sys
+import threading
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from tavily_processor import tavily_processor, EXTRACT_BATCH_URLS
+
+URLS = [f"https://item.rakuten.co.jp/shop/{i}/" for i in range(25)]
+BROKEN_URL = URLS[7]
+
+
+class FakeClient:
+    def __init__(self):
+        self.extract_calls = []
+        self._lock = threading.Lock()
+
+    def search(self, query, **kwargs):
+        # 偶数番目だけ raw_content があり、重複した URL も含む
+        results = [{"url": url, "raw_content": f"本文 {url}" if i % 2 == 0 else None} for i, url in enumerate(URLS)]
+        return {"results": results + [{"url": URLS[0], "raw_content": "重複"}]}
+
+    def extract(self, urls, **kwargs):
+        with self._lock:
+            self.extract_calls.append(list(urls))
+        return {"results": [{"url": url, "raw_content": f"抽出 {url}"} for url in urls if url != BROKEN_URL],
+                "failed_results": [{"url": url, "error": "timeout"} for url in urls if url == BROKEN_URL]}
+
+
+def make_processor(monkeypatch):
+    monkeypatch.setenv("TAVILY_API_KEY", "test")
+    processor = tavily_processor()
+    processor.client = FakeClient()
+    return processor
+
+
+def test_extract_contents_sends_api_sized_chunks(monkeypatch):
+    processor = make_processor(monkeypatch)
+    contents, failures = processor.extract_contents(URLS + URLS[:3])
+
+    assert sorted(len(chunk) for chunk in processor.client.extract_calls) == [len(URLS) - EXTRACT_BATCH_URLS, EXTRACT_BATCH_URLS]
+    assert failures == {BROKEN_URL: "timeout"}
+    assert len(contents) == len(URLS) - 1 and contents[URLS[0]] == f"抽出 {URLS[0]}"
+    assert processor.extract_contents([]) == ({}, {})
+
+
+def test_search_item_recovers_hits_without_raw_content(monkeypatch):
+    processor = make_processor(monkeypatch)
+    results = processor.search_item("ROLEX 126500LN 中古", max_results=25)
+
+    # raw_content のない12件は1回のリクエストで取得し直し、取得できなかった1件だけを除く
+    assert processor.client.extract_calls == [URLS[1::2]]
+    assert [item["url"] for item in results] == [url for url in URLS if url != BROKEN_URL]
+    assert results[0]["content"] == f"本文 {URLS[0]}" and results[1]["content"] == f"抽出 {URLS[1]}"
+
+    processor.client.extract_calls.clear()
+    assert len(processor.search_item("ROLEX", recover_missing_content=False)) == 13
+    assert processor.client.extract_calls == []
@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from incremental import PreviousRun, RunDiff, diff_listings
+from journal import RowJournal, row_input_hash
+
+
+def row(keywords, *listings, row_error=None):
+    return {"input_keywords": keywords, "row_error": row_error,
+            "extracted_results": [{"url": url, "name": "デイトナ", "price": price} for url, price in listings]}
+
+
+def test_previous_run_matches_rows_by_input_and_checks_freshness(tmp_path):
+    journal = RowJournal(tmp_path / "result.json.journal.jsonl")
+    daytona, submariner, failed = (row_input_hash(keywords) for keywords in ("デイトナ", "サブマリーナ", "GMT"))
+    journal.append(0, daytona, row("デイトナ", ("https://a/1", 4428000)), completed_at=1000.0)
+    journal.append(1, submariner, row("サブマリーナ"), completed_at=100.0)
+    journal.append(2, failed, row("GMT", row_error="検索に失敗"), completed_at=1000.0)
+    journal.close()
+
+    previous = PreviousRun(journal.path)
+    assert len(previous) == 3 and previous.hash_at(1) == submariner
+    assert previous.is_fresh(daytona, max_age_seconds=500, now=1200.0)
+    assert not previous.is_fresh(submariner, max_age_seconds=500, now=1200.0)  # 期限切れ
+    assert not previous.is_fresh(failed, max_age_seconds=500, now=1200.0)      # エラーの行は再検索する
+    assert not previous.is_fresh(row_input_hash("新しい行"), max_age_seconds=500, now=1200.0)
+    assert previous.read(daytona)["extracted_results"][0]["price"] == 4428000
+    previous.close()
+
+    assert len(PreviousRun(tmp_path / "missing.jsonl")) == 0
+
+
+def test_diff_reports_added_removed_and_repriced_listings():
+    old = row("デイトナ", ("https://a/1", 4428000), ("https://b/1", 4398000))
+    new = row("デイトナ", ("https://a/1", 4380000), ("https://c/1", 4500000))
+    changes = diff_listings(old, new)
+    assert [item["url"] for item in changes["added"]] == ["https://c/1"]
+    assert [item["url"] for item in changes["removed"]] == ["https://b/1"]
+    assert changes["price_changed"] == [{"url": "https://a/1", "name": "デイトナ", "old_price": 4428000, "new_price": 4380000}]
+
+    run_diff = RunDiff()
+    run_diff.reuse()
+    run_diff.record(0, "stale", old, new)
+    run_diff.record(1, "stale", new, new)  # 変化のない行は差分に含めない
+    run_diff.record(2, "new", None, row("GMT", ("https://d/1", 2000000)))
+    assert [entry["row_index"] for entry in run_diff.rows] == [0, 2]
+    summary = run_diff.summary()
+    assert (summary["reused_rows"], summary["reprocessed_rows"], summary["stale_rows"], summary["new_rows"]) == (1, 3, 2, 1)
+    assert (summary["added_listings"], summary["removed_listings"], summary["price_changes"]) == (2, 1, 1)
@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from input_reader import iter_input_rows, count_input_rows
+from pipeline import build_initial_keywords
+
+SHEET = pd.DataFrame({
+    "No": [1, 2, 3, 4],
+    "ブランド": ["ROLEX", "ROLEX", None, "ROLEX"],
+    "型番": ["126500LN", "116610LN", None, "126610LV"],
+    "文字盤色": ["ブラック", None, None, "グリーン"],
+    "ブレス形状": ["オイスター", "オイスター", None, None],
+    "備考": ["読み込まない列"] * 4,
+})
+
+
+def test_reads_only_keyword_columns_in_the_same_way_as_read_excel(tmp_path):
+    excel_path = tmp_path / "input.xlsx"
+    SHEET.to_excel(excel_path, index=False)
+    csv_path = tmp_path / "input.csv"
+    SHEET.to_csv(csv_path, index=False, encoding="utf-8-sig")
+
+    expected = [(index, build_initial_keywords(row)) for index, row in pd.read_excel(excel_path).iterrows()]
+    for path in (excel_path, csv_path):
+        rows = list(iter_input_rows(path))
+        assert all(set(row) == {"ブランド", "型番", "文字盤色", "ブレス形状"} for _, row in rows)
+        assert [(index, build_initial_keywords(row)) for index, row in rows] == expected
+        assert rows[2][1]["型番"] is None  # 途中の空行は行番号を保つ
+        assert count_input_rows(path) == 4
+        assert [index for index, _ in iter_input_rows(path, limit=2)] == [0, 1]
+        assert count_input_rows(path, limit=2) == 2
+
+
+def test_skips_trailing_blank_rows_and_rejects_unknown_formats(tmp_path):
+    csv_path = tmp_path / "input.csv"
+    csv_path.write_text("ブランド,型番\nROLEX,126500LN\n,\n,\n", encoding="utf-8")
+    assert list(iter_input_rows(csv_path)) == [(0, {"ブランド": "ROLEX", "型番": "126500LN"})]
+
+    text_path = tmp_path / "input.txt"
+    text_path.write_text("ブランド,型番\n", encoding="utf-8")
+    with pytest.raises(ValueError):
+        next(iter_input_rows(text_path))
+    with pytest.raises(FileNotFoundError):
+        next(iter_input_rows(tmp_path / "missing.xlsx"))
@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from job_scheduler import JobScheduler
+
+
+def test_jobs_run_in_order_within_concurrency_limit():
+    scheduler = JobScheduler(max_concurrent_jobs=1)
+    first = scheduler.submit("a.xlsx", 3)
+    second = scheduler.submit("b.xlsx", 5)
+
+    # 受付順: 2件目は1件目より先に開始できない
+    assert scheduler.wait_turn(second, timeout=0) is False
+    assert scheduler.wait_turn(first, timeout=0) is True
+    # 実行枠が埋まっている間は待機する
+    assert scheduler.wait_turn(second, timeout=0.05) is False
+    assert scheduler.position(second) == 1
+
+    scheduler.update(first, 3)
+    scheduler.finish(first)
+    assert scheduler.wait_turn(second, timeout=0) is True
+    assert [(job["ファイル"], job["状態"], job["進捗"]) for job in scheduler.snapshot()] == [
+        ("b.xlsx", "実行中", "0/5"),
+        ("a.xlsx", "完了", "3/3"),
+    ]
+
+
+def test_finish_while_queued_releases_the_queue():
+    scheduler = JobScheduler(max_concurrent_jobs=1)
+    cancelled = scheduler.submit("a.xlsx", 1)
+    waiting = scheduler.submit("b.xlsx", 1)
+    # 待機中に中断されたジョブは待機列から外れ、後続のジョブが開始できる
+    scheduler.finish(cancelled, "中断")
+    assert scheduler.position(waiting) == 1
+    assert scheduler.wait_turn(waiting, timeout=0) is True
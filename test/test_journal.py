@@ -0,0 +1,66 @@
+import json
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+import journal as journal_module
+from journal import RowJournal, row_input_hash
+
+
+def result(keywords):
+    return {"input_keywords": keywords, "extracted_results": [{"url": f"https://item.rakuten.co.jp/{keywords}/"}]}
+
+
+def test_resume_drops_a_truncated_last_line(tmp_path):
+    path = tmp_path / "result.json.journal.jsonl"
+    journal = RowJournal(path)
+    journal.append(0, row_input_hash("a"), result("a"))
+    journal.append(1, row_input_hash("b"), result("b"))
+    journal.close()
+    # 書き込み途中で中断された末尾行
+    with open(path, "ab") as f:
+        f.write(json.dumps({"row_index": 2, "input_hash": row_input_hash("c"), "result": result("c")}).encode()[:30])
+
+    resumed = RowJournal(path, resume=True)
+    assert resumed.completed_count() == 2 and not resumed.is_completed(2, row_input_hash("c"))
+    resumed.append(2, row_input_hash("c"), result("c"))
+    resumed.close()
+    # 切り捨てた位置から追記され、全行を読み出せる
+    assert [json.loads(line)["row_index"] for line in path.read_text(encoding="utf-8").splitlines()] == [0, 1, 2]
+    assert list(RowJournal(path, resume=True).iter_results([2, 0, 1])) == [result("c"), result("a"), result("b")]
+
+
+def test_only_rows_with_the_same_input_are_skipped(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = RowJournal(path)
+    journal.append(0, row_input_hash("ROLEX 126500LN 中古"), result("a"))
+    journal.close()
+
+    resumed = RowJournal(path, resume=True)
+    assert resumed.is_completed(0, row_input_hash("ROLEX 126500LN 中古"))
+    assert not resumed.is_completed(0, row_input_hash("ROLEX 126710BLNR 中古"))  # 入力が変わった行は再処理する
+    assert not resumed.is_completed(1, row_input_hash("ROLEX 126500LN 中古"))
+    assert resumed.read(0) == result("a")
+    resumed.close()
+
+    # resume=False の場合は既存のジャーナルを空にする
+    assert RowJournal(path).completed_count() == 0 and path.read_bytes() == b""
+
+
+def test_fsync_is_batched_and_flushed_on_close(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(journal_module.os, "fsync", lambda fd: synced.append(fd))
+    journal = RowJournal(tmp_path / "journal.jsonl", fsync_every=3, fsync_interval=3600)
+    for index in range(4):
+        journal.append(index, row_input_hash(str(index)), result(str(index)))
+    assert len(synced) == 1  # 3件ごとにまとめて fsync する
+    # fsync 前の行もファイルには書き出されている（flush 済み）
+    assert len((tmp_path / "journal.jsonl").read_text(encoding="utf-8").splitlines()) == 4
+    journal.close()
+    assert len(synced) == 2  # 閉じるときに残りを fsync する
+    journal.close()
+    assert len(synced) == 2
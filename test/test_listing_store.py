@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from listing_store import ListingStore
+
+
+def listing(url, price, has_box=True, model_number="126500LN"):
+    return {"url": url, "name": "デイトナ", "model_number": model_number, "price": price, "seller": "ショップ",
+            "accessories": {"has_warranty_card": True, "has_box": has_box, "other_description": None}}
+
+
+def test_store_keeps_history_and_filters_by_indexed_columns(tmp_path):
+    store = ListingStore(tmp_path / "listings.sqlite3")
+    last_month = [{"input_keywords": "ROLEX 126500LN 中古", "extracted_results": [
+        listing("https://a/1", 4428000), listing("https://b/1", 3980000, has_box=False)]}]
+    today = [{"input_keywords": "ROLEX 126500LN 中古", "extracted_results": [
+        listing("https://a/1", "3,950,000"), listing("https://c/1", 3900000, model_number="１２６５００ｌｎ")]},
+        {"input_keywords": "ROLEX 116500LN 中古", "extracted_results": [listing("https://d/1", 3500000, model_number="116500LN")]},
+        {"input_keywords": "ROLEX 126610LN 中古", "extracted_results": [], "row_error": "検索に失敗"}]
+    assert store.add_run(last_month, run_at=1000.0)["listings"] == 2
+    assert store.add_run(iter(today), run_at=2000.0) == {"run_id": 2, "rows": 3, "listings": 3}
+
+    cheap_with_box = store.query(model_number="126500ln", max_price=3999999, has_box=True, has_warranty_card=True)
+    assert [(item["url"], item["price"]) for item in cheap_with_box] == [("https://c/1", 3900000), ("https://a/1", 3950000)]
+    assert [item["url"] for item in store.query(model_number="126500LN", max_price=3999999, since=500.0)] == \
+        ["https://c/1", "https://a/1", "https://b/1"]
+    assert len(store.query(latest_run_only=True)) == 3
+    assert store.price_history("https://a/1") == [(1000.0, 4428000), (2000.0, 3950000)]
+    assert [run["row_count"] for run in store.runs()] == [3, 1]
+    store.close()
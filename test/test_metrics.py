@@ -0,0 +1,52 @@
+import sys
+import types
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from metrics import Metrics, start_prometheus_server
+
+
+def test_spans_counters_and_token_usage():
+    metrics = Metrics()
+    for seconds in (0.02, 0.03, 0.04, 2.0):
+        metrics.observe("search_item", seconds)
+    with pytest.raises(ValueError):
+        with metrics.span("extract_info"):
+            raise ValueError("boom")
+    metrics.increment("openai_retries", 2)
+    metrics.record_usage("openai", types.SimpleNamespace(prompt_tokens=120, completion_tokens=30))
+    metrics.record_usage("openai", types.SimpleNamespace(prompt_tokens=80, completion_tokens=None))
+
+    snapshot = metrics.snapshot()
+    search = snapshot["spans"]["search_item"]
+    assert search["count"] == 4 and search["max_seconds"] == 2.0
+    assert 0.025 <= search["p50_seconds"] <= 0.05
+    assert search["p95_seconds"] <= 2.0
+    assert snapshot["spans"]["extract_info"]["errors"] == 1
+    assert snapshot["counters"] == {"openai_completion_tokens": 30, "openai_prompt_tokens": 200, "openai_retries": 2}
+
+
+def test_prometheus_exporter_serves_cumulative_histograms():
+    metrics = Metrics()
+    metrics.observe("row", 0.2)
+    metrics.observe("row", 20.0)
+    metrics.increment("tavily_retries")
+
+    server = start_prometheus_server(0, host="127.0.0.1", metrics=metrics)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert 'rolex_search_row_seconds_bucket{le="0.25"} 1' in body
+    assert 'rolex_search_row_seconds_bucket{le="+Inf"} 2' in body
+    assert "rolex_search_row_seconds_count 2" in body
+    assert "rolex_search_tavily_retries_total 1" in body
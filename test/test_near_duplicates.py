@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from near_duplicates import NearDuplicateIndex, simhash
+from pipeline import WatchSearchPipeline
+
+SPEC = "\n".join(f"【項目{i}】ロレックス デイトナ 126500LN 自動巻き Cal.4131 ステンレス 仕様の説明 {i}" for i in range(40))
+
+
+def listing(shop: str, price: str = "4,428,000") -> str:
+    return f"【楽天市場】【中古】ロレックス デイトナ 126500LN：{shop}\n{price}\n円\n{SPEC}\n"
+
+
+def test_index_groups_near_duplicates_with_the_same_price():
+    index = NearDuplicateIndex(max_distance=3, max_entries=2)
+    assert bin(simhash(listing("ショップA")) ^ simhash(listing("ショップB"))).count("1") <= 3
+
+    representative, is_owner = index.claim(listing("ショップA"))
+    assert is_owner
+    future, is_owner = index.claim(listing("ショップB"))
+    assert not is_owner and future is representative
+    # 本文がほぼ同じでも価格が違えば別の商品として扱う
+    _, is_owner = index.claim(listing("ショップC", price="4,398,000"))
+    assert is_owner
+    _, is_owner = index.claim("【楽天市場】まったく別の商品：ショップD\n" + "オメガ スピードマスター " * 30)
+    assert is_owner
+    assert index.reused == 1
+
+    # 上限を超えたら抽出済みのものから破棄する（抽出中のものは残す）
+    assert len(index._entries) == 3
+    representative.set_result({"price": 4428000})
+    index.claim("【楽天市場】さらに別の商品：ショップE\n" + "グランドセイコー " * 30)
+    assert len(index._entries) == 3 and all(not future.done() for _, _, future in index._entries.values())
+
+
+class FakeSearchClient:
+    def search_item(self, query, max_results=20, advance_search=True):
+        return [{"url": "https://item.rakuten.co.jp/shop-a/126500ln/", "content": listing("ショップA")},
+                {"url": "https://item.rakuten.co.jp/shop-b/126500ln-2/", "content": listing("ショップB")},
+                {"url": "https://item.rakuten.co.jp/shop-c/126500ln/", "content": listing("ショップC", "4,398,000")}]
+
+
+class FakeExtractor:
+    def __init__(self):
+        self.calls = 0
+
+    def extract_info(self, text):
+        self.calls += 1
+        return {"name": "デイトナ", "price": 4398000 if "4,398,000" in text else 4428000, "seller": "抽出したショップ"}
+
+    def extract_many(self, texts):
+        return [self.extract_info(text) for text in texts]
+
+
+def test_pipeline_copies_representative_result_with_own_url_and_seller():
+    row = pd.Series({"ブランド": "ROLEX", "型番": "126500LN"})
+    for workers in (1, 4):
+        extractor = FakeExtractor()
+        pipeline = WatchSearchPipeline(FakeSearchClient(), extractor, workers=workers, log=lambda message: None,
+                                       near_duplicates=NearDuplicateIndex())
+        results = dict(pipeline.run([(0, row)]))[0]["extracted_results"]
+
+        assert extractor.calls == 2  # ショップB はショップA の結果を再利用
+        assert [result["url"] for result in results] == [
+            "https://item.rakuten.co.jp/shop-a/126500ln/", "https://item.rakuten.co.jp/shop-b/126500ln-2/",
+            "https://item.rakuten.co.jp/shop-c/126500ln/"]
+        assert results[1]["price"] == 4428000 and results[1]["seller"] == "ショップB"
+        assert results[2]["price"] == 4398000
@@ -0,0 +1,118 @@
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from pipeline import UrlRegistry, WatchSearchPipeline, build_initial_keywords
+
+ROWS = pd.DataFrame([
+    {"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": "ブラック", "ブレス形状": "オイスター"},
+    {"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": "ホワイト", "ブレス形状": "オイスター"},
+    {"ブランド": "ROLEX", "型番": "116500LN", "文字盤色": None, "ブレス形状": "エラー"},
+])
+
+
+class FakeSearchClient:
+    """行ごとに共通のURLを含む検索結果を返す（「エラー」を含むクエリは例外）"""
+
+    def search_item(self, query, max_results=20, advance_search=True):
+        if "エラー" in query:
+            raise RuntimeError("search failed")
+        return [{"url": "https://item.rakuten.co.jp/shop/common/", "content": "共通 4,428,000円"},
+                {"url": f"https://item.rakuten.co.jp/shop/{query}/", "content": query}]
+
+
+class FakeExtractor:
+    """テキストの長さを価格として返す（呼び出し回数を記録）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def extract_info(self, text):
+        self.calls += 1
+        return {"name": "テスト", "price": len(text)}
+
+    def extract_many(self, texts):
+        return [self.extract_info(text) for text in texts]
+
+
+def run_pipeline(workers):
+    extractor = FakeExtractor()
+    pipeline = WatchSearchPipeline(FakeSearchClient(), extractor, workers=workers, log=lambda message: None)
+    results = dict(pipeline.run(ROWS.iterrows()))
+    return [results[index] for index in ROWS.index], extractor.calls
+
+
+def test_build_initial_keywords_skips_missing_values():
+    assert build_initial_keywords(ROWS.iloc[0]) == "ROLEX 126500LN ブラック オイスター 中古"
+    assert build_initial_keywords(ROWS.iloc[2]) == "ROLEX 116500LN エラー 中古"
+    assert build_initial_keywords(pd.Series({"型番": "126500LN"})) == "126500LN 中古"
+
+
+def test_run_is_identical_in_serial_and_parallel():
+    serial, serial_calls = run_pipeline(workers=1)
+    parallel, parallel_calls = run_pipeline(workers=4)
+    assert serial == parallel
+    # 共通のURLは1回だけ抽出され、各行に同じ結果が入る
+    assert serial_calls == parallel_calls == 3
+    assert serial[0]["extracted_results"][0] == serial[1]["extracted_results"][0]
+    assert "row_error" not in serial[0]  # エラーがない行の出力の形式は従来どおり
+    # 検索の失敗は行レベルのエラーとして記録される
+    assert serial[2]["extracted_results"] == []
+    assert serial[2]["row_error"].startswith("商品検索エラー")
+
+
+class SlowCountingExtractor(FakeExtractor):
+    """抽出に時間がかかり、テキストごとの抽出回数を記録する（スレッドセーフ）"""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def extract_info(self, text):
+        with self._lock:
+            self.counts[text] += 1
+        time.sleep(0.02)  # 抽出中に他の行が同じURLを見つけるようにする
+        return {"name": "テスト", "price": len(text)}
+
+
+def test_concurrent_rows_sharing_a_url_extract_it_once():
+    rows = pd.DataFrame([{"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": f"色{i}", "ブレス形状": "オイスター"}
+                         for i in range(12)])
+    extractor = SlowCountingExtractor()
+    pipeline = WatchSearchPipeline(FakeSearchClient(), extractor, workers=6, log=lambda message: None)
+    results = dict(pipeline.run(rows.iterrows()))
+
+    assert extractor.counts["共通 4,428,000円"] == 1
+    assert all(count == 1 for count in extractor.counts.values())
+    common = {repr(results[index]["extracted_results"][0]) for index in rows.index}
+    assert len(common) == 1
+
+
+def test_url_registry_gives_one_owner_per_url_across_threads():
+    registry = UrlRegistry()
+    barrier = threading.Barrier(8)
+    claims = []
+
+    def claim():
+        barrier.wait()
+        claims.append(registry.claim("https://item.rakuten.co.jp/shop/common/"))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(owner for _, owner in claims) == 1
+    assert len({id(future) for future, _ in claims}) == 1
+    assert registry.unique_urls() == 1 and registry.reused == 7
@@ -0,0 +1,70 @@
+import json
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from journal import RowJournal, row_input_hash
+from process_excel import OrderedRowEmitter
+from result_writer import JsonlWriter
+
+
+def result(index):
+    return {"input_keywords": f"行{index}", "extracted_results": []}
+
+
+def test_rows_completed_out_of_order_are_written_in_input_order():
+    written = []
+    row_indexes = []
+    emitter = OrderedRowEmitter(row_indexes, written.append, load_completed=None)
+
+    # 行番号は読み込みながら追加され、完了は前後する
+    row_indexes.extend([0, 1, 2, 3])
+    for index in (2, 3):
+        emitter.done(index, result(index))
+    assert written == []  # 先頭の行が終わるまで保留する
+    emitter.done(0, result(0))
+    assert written == [result(0)]
+    row_indexes.append(4)
+    emitter.done(4, result(4))
+    emitter.done(1, result(1))
+    emitter.flush()
+    assert written == [result(index) for index in range(5)]
+
+
+def test_resumed_rows_are_reloaded_from_the_journal_and_written_once(tmp_path):
+    journal_path = tmp_path / "result.jsonl.journal.jsonl"
+    # 前回の実行で行 0 と 2 が完了している
+    journal = RowJournal(journal_path)
+    for index in (0, 2):
+        journal.append(index, row_input_hash(f"行{index}"), result(index))
+    journal.close()
+
+    journal = RowJournal(journal_path, resume=True)
+    output_path = tmp_path / "result.jsonl"
+    writer = JsonlWriter(output_path)
+    row_indexes = []
+    emitter = OrderedRowEmitter(row_indexes, writer.write, journal.read)
+    pending = []
+    for index in range(4):
+        row_indexes.append(index)
+        if journal.is_completed(index, row_input_hash(f"行{index}")):
+            emitter.done(index)  # 前回完了分はジャーナルから読み出す
+        else:
+            pending.append(index)
+    assert pending == [1, 3]
+    for index in reversed(pending):
+        journal.append(index, row_input_hash(f"行{index}"), result(index))
+        emitter.done(index, result(index))
+    emitter.flush()
+    writer.close()
+    journal.close()
+
+    lines = [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+    assert lines == [result(index) for index in range(4)]
+    resumed = RowJournal(journal_path, resume=True)
+    assert list(resumed.iter_results(range(4))) == lines  # ジャーナルにも各行1件ずつ
+    resumed.close()
@@ -0,0 +1,128 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from pipeline import WatchSearchPipeline
+from query_planner import QueryPlanner, matches_row
+
+LISTINGS = {
+    "https://item.rakuten.co.jp/a/1/": ("ブラック", "オイスター"),
+    "https://item.rakuten.co.jp/b/1/": ("ホワイト", "オイスター"),
+    "https://item.rakuten.co.jp/c/1/": ("ブラック", "ジュビリー"),
+    "https://item.rakuten.co.jp/d/1/": (None, "オイスター"),
+}
+
+
+class FakeSearchClient:
+    def __init__(self):
+        self.queries = []
+
+    def search_item(self, query, max_results=20, advance_search=True):
+        self.queries.append((query, max_results))
+        return [{"url": url, "content": url} for url in LISTINGS]
+
+
+class FakeExtractor:
+    def __init__(self):
+        self.calls = 0
+
+    def extract_info(self, text):
+        self.calls += 1
+        dial_color, bracelet_type = LISTINGS[text]
+        return {"name": "デイトナ", "dial_color": dial_color, "bracelet_type": bracelet_type}
+
+    def extract_many(self, texts):
+        return [self.extract_info(text) for text in texts]
+
+
+def test_matches_row_ignores_blank_and_unknown_values():
+    row = {"文字盤色": "ブラック", "ブレス形状": "オイスターブレス"}
+    assert matches_row({"dial_color": "ブラック文字盤", "bracelet_type": "オイスター"}, row)
+    assert not matches_row({"dial_color": "ホワイト", "bracelet_type": "オイスター"}, row)
+    assert not matches_row({"dial_color": "ブラック", "bracelet_type": "オイスターフレックス"}, row)
+    assert matches_row({"dial_color": None, "bracelet_type": "不明"}, row)
+    assert matches_row({"dial_color": "ホワイト", "bracelet_type": "ジュビリー"}, {"ブランド": "ROLEX"})
+
+
+def test_rows_with_the_same_model_share_one_search():
+    rows = [(0, {"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": "ブラック", "ブレス形状": "オイスター"}),
+            (1, {"ブランド": "ROLEX", "型番": " 126500LN", "文字盤色": "ホワイト", "ブレス形状": "オイスター"}),
+            (2, {"ブランド": "ROLEX", "型番": "126710BLNR", "文字盤色": "ブラック", "ブレス形状": "ジュビリー"})]
+    for workers in (1, 4):
+        search_client, extractor = FakeSearchClient(), FakeExtractor()
+        planner = QueryPlanner(max_results=20)
+        planner.plan(rows)
+        pipeline = WatchSearchPipeline(search_client, extractor, max_results=10, workers=workers,
+                                       log=lambda message: None, query_planner=planner)
+        results = dict(pipeline.run(rows))
+
+        # 126500LN の2行は1回の検索にまとめ、1行だけの 126710BLNR は従来どおり行のキーワードで検索する
+        assert sorted(search_client.queries) == [("ROLEX 126500LN 中古", 20), ("ROLEX 126710BLNR ブラック ジュビリー 中古", 10)]
+        assert extractor.calls == 4  # 同じ URL の抽出は1回
+        assert [item["url"] for item in results[0]["extracted_results"]] == [
+            "https://item.rakuten.co.jp/a/1/", "https://item.rakuten.co.jp/d/1/"]
+        assert [item["url"] for item in results[1]["extracted_results"]] == [
+            "https://item.rakuten.co.jp/b/1/", "https://item.rakuten.co.jp/d/1/"]
+        assert len(results[2]["extracted_results"]) == 4
+        assert results[1]["input_keywords"] == "ROLEX 126500LN ホワイト オイスター 中古"
+        assert planner.stats() == {"groups": 1, "grouped_rows": 2, "saved_searches": 1}
+
+
+class CachingSearchClient(FakeSearchClient):
+    """検索キーワード・最大取得数ごとに検索結果をキャッシュする（tavily_processor の search_cache と同様）"""
+
+    def __init__(self):
+        super().__init__()
+        self.cache = {}
+
+    def search_item(self, query, max_results=20, advance_search=True):
+        self.cache[(query, max_results)] = super().search_item(query, max_results, advance_search)
+        return self.cache[(query, max_results)]
+
+    def cached_search(self, query, max_results=20, advance_search=True):
+        return self.cache.get((query, max_results))
+
+
+class CachingExtractor(FakeExtractor):
+    def __init__(self):
+        super().__init__()
+        self.cache = {}
+
+    def extract_info(self, text):
+        self.cache[text] = super().extract_info(text)
+        return self.cache[text]
+
+    def cached_info(self, text):
+        return self.cache.get(text)
+
+
+def test_grouped_rows_are_served_from_cache_on_a_rerun():
+    rows = [(0, {"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": "ブラック", "ブレス形状": "オイスター"}),
+            (1, {"ブランド": "ROLEX", "型番": "126500LN", "文字盤色": "ホワイト", "ブレス形状": "オイスター"}),
+            (2, {"ブランド": "ROLEX", "型番": "126710BLNR", "文字盤色": "ブラック", "ブレス形状": "ジュビリー"})]
+    search_client, extractor = CachingSearchClient(), CachingExtractor()
+
+    def make_pipeline():
+        planner = QueryPlanner(max_results=20)
+        planner.plan(rows)
+        return WatchSearchPipeline(search_client, extractor, max_results=10, log=lambda message: None,
+                                   query_planner=planner)
+
+    first = dict(make_pipeline().run(rows))
+    search_client.queries.clear()
+    extractor.calls = 0
+
+    # 2回目は全行をキャッシュから返し、まとめた行も文字盤色・ブレス形状で振り分ける
+    pipeline = make_pipeline()
+    known_details = {}
+    second = {index: pipeline.lookup_cached(row, known_details) for index, row in rows}
+    assert search_client.queries == [] and extractor.calls == 0
+    assert second == first
+    assert [item["url"] for item in second[1]["extracted_results"]] == [
+        "https://item.rakuten.co.jp/b/1/", "https://item.rakuten.co.jp/d/1/"]
+    # キャッシュから返した行はグループから除かれ、検索結果を保持し続けない
+    assert not pipeline.query_planner.is_grouped(rows[0][1])
@@ -0,0 +1,98 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from rate_limiter import MIN_RATE_FACTOR, RATE_RECOVERY_STEP, RateLimiter
+
+
+class FakeClock:
+    """sleep で時刻を進めるだけの時計（実際には待たない）"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(clock, **limits):
+    return RateLimiter("test", clock=clock, sleep=clock.sleep, **limits)
+
+
+def test_bucket_refills_at_the_configured_rate():
+    clock = FakeClock()
+    limiter = make_limiter(clock, requests_per_minute=60)
+
+    # 満杯の状態から 60 件は待たずに取得できる
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+    # 61 件目は1件分（60件/分 → 1秒）補充されるまで待つ
+    limiter.acquire()
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+    # 30 秒経てば 30 件分補充される（容量を超えては溜まらない）
+    clock.now += 30
+    for _ in range(30):
+        limiter.acquire()
+    assert len(clock.sleeps) == 1
+    clock.now += 3600
+    limiter.requests.refill(clock(), limiter.rate_factor)
+    assert limiter.requests.available == 60
+
+
+def test_token_bucket_waits_for_tokens_and_records_actual_usage():
+    clock = FakeClock()
+    limiter = make_limiter(clock, tokens_per_minute=600)
+
+    limiter.acquire(tokens=500)
+    limiter.record_usage(estimated_tokens=500, actual_tokens=600)  # 見積もりより多く使った分も差し引く
+    assert limiter.tokens.available == 0
+
+    # 600トークン/分 → 100トークンの補充に 10 秒
+    limiter.acquire(tokens=100)
+    assert clock.sleeps == [pytest.approx(10.0)]
+
+
+def test_rate_limited_pauses_halves_the_rate_and_recovers_on_success():
+    clock = FakeClock()
+    limiter = make_limiter(clock, requests_per_minute=60)
+
+    limiter.on_rate_limited(retry_after=2.0)
+    assert limiter.rate_factor == 0.5
+
+    # Retry-After の間はすべての呼び出しを止める
+    limiter.acquire()
+    assert clock.sleeps[0] == pytest.approx(2.0)
+
+    # 速度係数が半分の間は容量も補充速度も半分になる（30件/分 → 1件に2秒）
+    clock.sleeps.clear()
+    limiter.requests.available = 0
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(2.0)
+
+    # 連続した 429 で速度係数は下限まで下がる
+    for _ in range(10):
+        limiter.on_rate_limited(retry_after=0)
+    assert limiter.rate_factor == MIN_RATE_FACTOR
+
+    # 成功が続くと少しずつ元の速度へ戻り、1.0 を超えない
+    steps = round((1.0 - MIN_RATE_FACTOR) / RATE_RECOVERY_STEP)
+    for _ in range(steps - 1):
+        limiter.on_success()
+    assert MIN_RATE_FACTOR < limiter.rate_factor < 1.0
+    for _ in range(5):
+        limiter.on_success()
+    assert limiter.rate_factor == 1.0
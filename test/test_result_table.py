@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from result_table import OUTPUT_COLUMNS, export_path_for, export_results, format_for_display, results_to_frame
+
+ROWS = [
+    {"input_keywords": "ROLEX 126500LN ブラック 中古", "row_error": None, "extracted_results": [
+        {"name": "デイトナ", "model_number": "126500LN", "price": 4428000, "url": "https://a/1",
+         "accessories": {"has_warranty_card": True, "has_box": False, "other_description": "冊子"}},
+        {"name": "デイトナ", "model_number": "126500LN", "price": None, "url": "https://b/1", "accessories": None,
+         "error": "抽出失敗"}]},
+    {"input_keywords": "ROLEX 126610LV 中古", "row_error": "商品検索エラー: timeout", "extracted_results": []},
+    {"input_keywords": "ROLEX 116500LN 中古", "row_error": None, "extracted_results": []},
+    {"input_keywords": "ROLEX 124200 中古", "row_error": None, "extracted_results": [
+        {"name": "オイスターパーペチュアル", "price": 980000, "url": "https://c/1",
+         "accessories": {"has_warranty_card": None, "has_box": True, "other_description": None}}]},
+]
+
+
+def test_results_to_frame_keeps_input_order_and_numeric_prices():
+    frame = results_to_frame(iter(ROWS))
+    assert list(frame.columns) == OUTPUT_COLUMNS
+    assert list(frame["検索キーワード"]) == [ROWS[0]["input_keywords"]] * 2 + [row["input_keywords"] for row in ROWS[1:]]
+    assert str(frame["価格"].dtype) == "Int64" and frame["価格"].sum() == 4428000 + 980000
+    assert str(frame["箱あり"].dtype) == "boolean" and list(frame["箱あり"].fillna(False)) == [False, False, False, False, True]
+    assert frame.loc[2, "エラー"] == "商品検索エラー: timeout" and frame.loc[3, "商品名"] == "該当なし"
+    assert frame.loc[0, "付属品詳細"] == "冊子"
+
+    display = format_for_display(frame)
+    assert list(display["価格"]) == ["¥4,428,000", "N/A", "", "", "¥980,000"]
+    assert display.loc[2, "商品名"] == "" and display.loc[1, "エラー"] == "抽出失敗"
+    assert len(results_to_frame([])) == 0
+
+
+def test_export_keeps_types(tmp_path):
+    frame = results_to_frame(ROWS)
+    excel_path = export_results(frame, tmp_path / "result.xlsx")
+    assert pd.read_excel(excel_path)["価格"].sum() == 4428000 + 980000
+    with pytest.raises(ValueError):
+        export_results(frame, tmp_path / "result.csv")
+
+    assert export_path_for(tmp_path / "result.jsonl.gz", "xlsx") == tmp_path / "result.xlsx"
+    assert export_path_for("data/result.json", "parquet") == Path("data/result.parquet")
+    # 日付などを含むファイル名は拡張子の前の部分を残す（実行ごとの書き出しが上書きし合わない）
+    assert export_path_for("run.2024-05-01.jsonl.gz", "parquet") == Path("run.2024-05-01.parquet")
+    assert export_path_for("run.2024-05-02.json", "xlsx") == Path("run.2024-05-02.xlsx")
+
+    pytest.importorskip("pyarrow")
+    parquet = pd.read_parquet(export_results(frame, tmp_path / "result.parquet"))
+    assert str(parquet["価格"].dtype) == "Int64"
+
+
+def test_rows_formatted_one_at_a_time_match_the_whole_table():
+    # Gradio の表示は完了した行ごとに1回だけ展開・整形し、表示の際に連結する
+    per_row = pd.concat([format_for_display(results_to_frame([row])) for row in ROWS], ignore_index=True)
+    pd.testing.assert_frame_equal(per_row, format_for_display(results_to_frame(ROWS)))
@@ -0,0 +1,40 @@
+import json
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from result_writer import write_json_array, JsonlWriter, iter_jsonl, convert_jsonl_to_json
+
+ROWS = [
+    {"input_keywords": "ROLEX 126500LN ブラック オイスター 中古",
+     "extracted_results": [{"url": "https://item.rakuten.co.jp/a/1/", "price": 4428000, "accessories": {"box": True}}]},
+    {"input_keywords": "ROLEX 126500LN ホワイト オイスター 中古", "extracted_results": []},
+]
+
+
+def test_write_json_array_matches_json_dump(tmp_path):
+    path = tmp_path / "result.json"
+    assert write_json_array(path, iter(ROWS)) == 2
+    assert path.read_text(encoding="utf-8") == json.dumps(ROWS, ensure_ascii=False, indent=2)
+
+    write_json_array(path, [])
+    assert path.read_text(encoding="utf-8") == "[]"
+
+
+def test_jsonl_roundtrip_and_convert(tmp_path):
+    for name in ("result.jsonl", "result.jsonl.gz"):
+        jsonl_path = tmp_path / name
+        with JsonlWriter(jsonl_path) as writer:
+            writer.write(ROWS[0])
+            # 書き込み中でも書き出し済みの行を読み取れる
+            assert list(iter_jsonl(jsonl_path)) == ROWS[:1]
+            writer.write(ROWS[1])
+        assert list(iter_jsonl(jsonl_path)) == ROWS
+
+        json_path = tmp_path / (name + ".json")
+        assert convert_jsonl_to_json(jsonl_path, json_path) == 2
+        assert json_path.read_text(encoding="utf-8") == json.dumps(ROWS, ensure_ascii=False, indent=2)
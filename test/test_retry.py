@@ -0,0 +1,101 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from rate_limiter import RateLimiter
+from retry import ApiCaller, CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable_error
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after_seconds=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.retry_after_seconds = retry_after_seconds
+
+
+def make_caller(**policy):
+    policy = dict(dict(max_attempts=4, deadline=5.0, attempt_timeout=None, base_delay=0.001), **policy)
+    return ApiCaller("test", rate_limiter=RateLimiter("test"), circuit_breaker=CircuitBreaker("test", 3, 0.05),
+                     policy=RetryPolicy(**policy))
+
+
+def test_retries_transient_errors_and_honors_retry_after():
+    outcomes = [StatusError(503), StatusError(429, retry_after_seconds=0.05), "ok"]
+    calls = []
+
+    def flaky(query, timeout=None):
+        calls.append((query, timeout))
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    caller = make_caller(attempt_timeout=10.0)
+    start = time.monotonic()
+    assert caller.call(flaky, "q") == "ok"
+    assert time.monotonic() - start >= 0.05  # Retry-After の間は呼び出さない
+    assert len(calls) == 3 and all(timeout <= 5.0 for _, timeout in calls)  # 期限内に収まるタイムアウトを渡す
+
+    # 一時的でないエラーは再試行しない
+    attempts = []
+
+    def bad_request():
+        attempts.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        make_caller().call(bad_request)
+    assert len(attempts) == 1
+    assert is_retryable_error(TimeoutError()) and not is_retryable_error(ValueError())
+
+
+def test_deadline_and_circuit_breaker_stop_calls_to_a_down_api():
+    attempts = []
+
+    def down():
+        attempts.append(1)
+        raise StatusError(500)
+
+    # 待ち時間が期限を超える場合は再試行を打ち切る
+    with pytest.raises(StatusError):
+        make_caller(base_delay=10.0, max_delay=10.0, deadline=0.01).call(down)
+
+    caller = make_caller(max_attempts=10, deadline=0.02)
+    attempts.clear()
+    with pytest.raises((StatusError, CircuitOpenError)):
+        caller.call(down)
+    # 3 回連続で失敗したら呼び出しを止める（復旧確認までの 0.05 秒は期限 0.02 秒より長い）
+    assert len(attempts) == 3 and caller.circuit_breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda: "ok")
+
+    # 復旧確認の1件が成功すれば呼び出しを再開する
+    time.sleep(0.06)
+    assert caller.call(lambda: "ok") == "ok"
+    assert caller.circuit_breaker.state == "closed"
+
+
+def test_interrupted_trial_call_releases_the_half_open_slot():
+    caller = make_caller(max_attempts=1, deadline=0.5)
+    breaker = caller.circuit_breaker
+    for _ in range(3):
+        breaker.on_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    # 試しの1件が成功・失敗以外で終わっても、次の呼び出しが試しの1件になって再開できる
+    with pytest.raises(KeyboardInterrupt):
+        caller.call(interrupted)
+    assert breaker.state == "open"
+    assert caller.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
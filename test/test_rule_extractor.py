@@ -0,0 +1,129 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from pipeline import WatchSearchPipeline, row_model_number
+from rule_extractor import RuleExtractor
+
+STRUCTURED_PAGE = """【楽天市場】【中古】ロレックス ROLEX デイトナ 126500LN ブラック文字盤 メンズ 腕時計：ブランドショップ楽天市場店
+【型番】126500LN
+【文字盤】ブラック
+【ブレスレット】オイスターブレス
+【状態】中古 ランクA
+【付属品】メーカー保証書(2024年11月) 純正箱 冊子
+4,428,000
+円
+送料無料
+4,428,000円
+"""
+
+# 状態・付属品の記載がなく、価格も1回しか出てこないページ
+SPARSE_PAGE = """【楽天市場】ロレックス デイトナ 126500LN：別のショップ
+【型番】126500LN
+2,980,000円
+"""
+
+
+def test_structured_page_is_resolved_without_llm():
+    extractor = RuleExtractor()
+    info, unresolved = extractor.resolve(STRUCTURED_PAGE, "126500LN")
+    assert unresolved == []
+    assert info["seller"] == "ブランドショップ楽天市場店"
+    assert info["model_number"] == "126500LN"
+    assert info["price"] == 4428000
+    assert info["dial_color"] == "ブラック" and info["bracelet_type"] == "オイスター"
+    assert info["warranty_date"] == "2024年11月"
+    assert info["accessories"]["has_warranty_card"] is True and info["accessories"]["has_box"] is True
+
+    info, unresolved = extractor.resolve(SPARSE_PAGE, "126500LN")
+    assert info["model_number"] == "126500LN"
+    assert {"price", "condition", "accessories", "warranty_date"} <= set(unresolved)
+    assert "model_number" not in unresolved and "seller" not in unresolved
+
+
+# 検索した型番が関連商品の欄にしかないページ
+RELATED_ONLY_PAGE = """【楽天市場】【中古】ロレックス デイトナ ホワイト文字盤：ブランドショップ楽天市場店
+3,980,000円
+この商品を見た人はこちらも見ています
+ロレックス デイトナ 126500LN
+"""
+
+
+def test_model_number_outside_title_and_spec_is_confirmed_by_llm():
+    info, unresolved = RuleExtractor().resolve(RELATED_ONLY_PAGE, "126500LN")
+    assert info["model_number"] == "126500LN"
+    assert "model_number" in unresolved
+
+
+class FakeSearchClient:
+    def search_item(self, query, max_results=20, advance_search=True):
+        return [{"url": "https://item.rakuten.co.jp/shop/structured/", "content": STRUCTURED_PAGE},
+                {"url": "https://item.rakuten.co.jp/shop/sparse/", "content": SPARSE_PAGE}]
+
+
+class FakeExtractor:
+    """問い合わせを受けた項目の一覧を記録し、全項目に固定値を返す"""
+
+    def __init__(self):
+        self.requested_fields = []
+
+    def extract_info(self, text, fields=None):
+        self.requested_fields.append(fields)
+        return {"name": "LLM", "price": 2980000, "condition": "LLM の状態", "warranty_date": None,
+                "accessories": {"has_warranty_card": False, "has_box": False, "other_description": None}}
+
+    def extract_many(self, texts):
+        return [self.extract_info(text) for text in texts]
+
+
+def test_pipeline_asks_llm_only_for_unresolved_fields():
+    row = pd.Series({"ブランド": "ROLEX", "型番": "126500LN"})
+    for batch_size in (1, 2):
+        extractor = FakeExtractor()
+        rule_extractor = RuleExtractor()
+        pipeline = WatchSearchPipeline(FakeSearchClient(), extractor, batch_size=batch_size,
+                                       log=lambda message: None, rule_extractor=rule_extractor)
+        structured, sparse = pipeline.process_row(row, 0, 1)["extracted_results"]
+
+        # 全項目をルールで確定できたページは LLM に問い合わせない
+        assert len(extractor.requested_fields) == 1
+        assert structured["price"] == 4428000 and structured["name"] != "LLM"
+        assert structured["url"] == "https://item.rakuten.co.jp/shop/structured/"
+        # 確定できなかった項目だけ LLM の値を使う
+        assert sparse["price"] == 2980000 and sparse["condition"] == "LLM の状態"
+        assert sparse["seller"] == "別のショップ" and sparse["name"] != "LLM"
+        if batch_size == 1:
+            assert "price" in extractor.requested_fields[0] and "seller" not in extractor.requested_fields[0]
+        assert rule_extractor.stats()["fast_path"] == 1 and rule_extractor.stats()["documents"] == 2
+
+
+NUMERIC_MODEL_PAGE = """【楽天市場】【中古】ロレックス サブマリーナ 124200 ブラック文字盤：ブランドショップ楽天市場店
+【型番】124200
+1,280,000円
+"""
+
+
+def test_numeric_model_number_from_excel_is_handled_as_text():
+    # Excel の 型番 列は数値のセル（空欄を含む列は float）として読み込まれる
+    assert row_model_number(pd.Series({"型番": 124200})) == "124200"
+    assert row_model_number(pd.Series({"型番": 124200.0})) == "124200"
+    assert row_model_number(pd.Series({"型番": " 126500LN "})) == "126500LN"
+    assert row_model_number(pd.Series({"型番": None})) is None
+
+    info, unresolved = RuleExtractor().resolve(NUMERIC_MODEL_PAGE, 124200)
+    assert info["model_number"] == "124200" and "model_number" not in unresolved
+
+    search_client = FakeSearchClient()
+    search_client.search_item = lambda query, max_results=20, advance_search=True: [
+        {"url": "https://item.rakuten.co.jp/shop/numeric/", "content": NUMERIC_MODEL_PAGE}]
+    pipeline = WatchSearchPipeline(search_client, FakeExtractor(), log=lambda message: None,
+                                   rule_extractor=RuleExtractor())
+    result = pipeline.process_row(pd.Series({"ブランド": "ROLEX", "型番": 124200}), 0, 1)
+    detail = result["extracted_results"][0]
+    assert "error" not in detail and detail["model_number"] == "124200"
@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from startup_benchmark import ENTRY_POINTS, measure_import, parse_importtime
+
+
+def test_entry_points_do_not_import_heavy_dependencies():
+    # 見出し行を飛ばし、階層の深さ（インデント2文字ごと）を読み取る
+    imports = parse_importtime("import time: self [us] | cumulative | imported package\n"
+                               "import time:       120 |        120 |   json.decoder\n"
+                               "import time:       300 |        420 | json\n")
+    assert imports == [("json.decoder", 0.00012, 0.00012, 1), ("json", 0.0003, 0.00042, 0)]
+
+    for entry in ENTRY_POINTS:
+        result = measure_import(entry)
+        assert result["lazy_loaded"] == [], f"{entry} の起動時に {result['lazy_loaded']} が読み込まれています"
+        assert result["seconds"] > 0
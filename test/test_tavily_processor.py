@@ -1,8 +1,15 @@
 # test/test_tavily.py
 import json
+import sys
 from pathlib import Path
 from rich.progress import Progress
-from src.tavily_processor import tavily_processor
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from tavily_processor import tavily_processor
 
 def main():
     processor = tavily_processor()
@@ -1,6 +1,159 @@
 import json
+import sys
 from pathlib import Path
-from src.watch_info_extractor import WatchInfoExtractor
+from types import SimpleNamespace
+
+import pytest
+
+# srcディレクトリをPythonパスに追加（src内のモジュールは相互に直接インポートしている）
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+import watch_info_extractor
+from cache_store import SQLiteCache
+from rate_limiter import RateLimiter
+from retry import ApiCaller, CircuitBreaker, RetryPolicy
+from watch_info_extractor import WatchInfoExtractor
+
+PAGE = "【楽天市場】ロレックス デイトナ 126500LN：ショップ\n4,428,000円"
+RESULT = {"name": "デイトナ", "model_number": "126500LN", "price": 4428000}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeCompletions:
+    """chat.completions の代替。reply(messages) の戻り値（dict は JSON にする）を応答本文として返す"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        content = self.reply(kwargs["messages"])
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def make_extractor(reply, result_cache=None):
+    """APIキーなしで、fake の chat client を使う WatchInfoExtractor を作る（再試行なし）"""
+    completions = FakeCompletions(reply)
+    extractor = WatchInfoExtractor.__new__(WatchInfoExtractor)
+    extractor.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    extractor.model = "gpt-4o-mini"
+    extractor.api = ApiCaller("openai", rate_limiter=RateLimiter("openai"), circuit_breaker=CircuitBreaker("openai"),
+                              policy=RetryPolicy(max_attempts=1, deadline=5.0))
+    extractor.rate_limiter = extractor.api.rate_limiter
+    extractor.max_output_tokens_estimate = 500
+    extractor.result_cache = result_cache
+    return extractor, completions
+
+
+def test_same_text_is_extracted_once_across_runs(tmp_path):
+    cache_path = tmp_path / "cache.sqlite3"
+    extractor, completions = make_extractor(lambda messages: RESULT, SQLiteCache(cache_path))
+    assert extractor.extract_info(PAGE) == RESULT
+    # 空白・全角半角の揺れは同じテキストとして扱う
+    assert extractor.extract_info("  " + PAGE.replace("4,428,000", "４,４２８,０００") + "\n") == RESULT
+    assert len(completions.requests) == 1
+
+    # 別の実行（同じキャッシュファイル）でも API を呼ばない
+    extractor, completions = make_extractor(lambda messages: RESULT, SQLiteCache(cache_path))
+    assert extractor.extract_info(PAGE) == RESULT
+    assert completions.requests == []
+
+
+def test_cache_key_depends_on_schema_version_and_fields(tmp_path, monkeypatch):
+    extractor, _ = make_extractor(lambda messages: RESULT, SQLiteCache(tmp_path / "cache.sqlite3"))
+    key = extractor.cache_key(PAGE)
+    assert extractor.cache_key(PAGE, ["price"]) != key
+    assert extractor.cache_key(PAGE, ["price", "seller"]) == extractor.cache_key(PAGE, ["seller", "price"])
+    assert extractor.cache_key(PAGE, ["price", "seller"]) != extractor.cache_key(PAGE, ["price"])
+    monkeypatch.setattr(watch_info_extractor, "SCHEMA_VERSION", watch_info_extractor.SCHEMA_VERSION + 1)
+    assert extractor.cache_key(PAGE) != key
+    assert make_extractor(lambda messages: RESULT)[0].cache_key(PAGE) is None  # キャッシュなし
+
+
+def test_failed_extraction_is_not_cached(tmp_path):
+    replies = [StatusError(400), {}, RESULT]
+
+    def reply(messages):
+        outcome = replies.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    extractor, completions = make_extractor(reply, SQLiteCache(tmp_path / "cache.sqlite3"))
+    with pytest.raises(StatusError):
+        extractor.extract_info(PAGE)
+    assert extractor.extract_info(PAGE) == {}  # 空の結果も保存しない
+    assert extractor.extract_info(PAGE) == RESULT
+    assert extractor.extract_info(PAGE) == RESULT
+    assert len(completions.requests) == 3
+
+
+TEXTS = ["ページA 126500LN", "ページB 116500LN", "ページC 126710BLRO", "ページD 124270"]
+
+
+def full_result(name):
+    return {"name": name, "model_number": None, "dial_color": None, "bracelet_type": None, "price": 1000,
+            "seller": None, "warranty_date": None,
+            "accessories": {"has_warranty_card": None, "has_box": None, "other_description": None}, "condition": None}
+
+
+def batch_reply(batched):
+    """まとめての問い合わせには batched(messages) を、1件ずつの問い合わせにはテキスト名の結果を返す"""
+    def reply(messages):
+        if "複数の商品ページ" in messages[0]["content"]:
+            return batched(messages)
+        return full_result("single:" + next(text for text in TEXTS if text in messages[-1]["content"]))
+    return reply
+
+
+def test_extract_many_keeps_valid_items_and_retries_malformed_ones():
+    def batched(messages):
+        incomplete = full_result("batch:B")
+        del incomplete["price"]
+        return {"items": [
+            dict(full_result("batch:A"), index=0),
+            dict(incomplete, index=1),          # 必須項目の欠落
+            "not an item",                      # オブジェクトでない
+            dict(full_result("batch:X"), index=9),  # 範囲外の番号
+            dict(full_result("batch:D"), index=3),  # 番号 2 の結果がない
+        ]}
+
+    extractor, completions = make_extractor(batch_reply(batched))
+    results = extractor.extract_many(TEXTS)
+    assert [result["name"] for result in results] == ["batch:A", "single:" + TEXTS[1], "single:" + TEXTS[2], "batch:D"]
+    assert len(completions.requests) == 3  # まとめて1回 + 不正だった2件
+
+
+def test_extract_many_falls_back_per_item_on_non_json_reply_or_rejected_request():
+    extractor, completions = make_extractor(batch_reply(lambda messages: "これは JSON ではありません"))
+    assert [result["name"] for result in extractor.extract_many(TEXTS)] == ["single:" + text for text in TEXTS]
+    assert len(completions.requests) == 1 + len(TEXTS)
+
+    def rejected(messages):
+        raise StatusError(400)
+
+    extractor, completions = make_extractor(batch_reply(rejected))
+    assert [result["name"] for result in extractor.extract_many(TEXTS)] == ["single:" + text for text in TEXTS]
+
+    # 再試行しても回復しなかった一時的なエラーは呼び出し側へ伝える
+    def unavailable(messages):
+        raise StatusError(503)
+
+    extractor, completions = make_extractor(batch_reply(unavailable))
+    with pytest.raises(StatusError):
+        extractor.extract_many(TEXTS)
+    assert len(completions.requests) == 1
+
 
 def main():
     extractor = WatchInfoExtractor()